@@ -0,0 +1,261 @@
+# analitica.py
+"""
+Reportes de ventas con NumPy.
+
+Los pedidos y sus líneas de un rango de fechas se leen por páginas
+(db.iterar_ventas: transacciones cortas de solo lectura, sin bloquear las
+tablas de ventas) y se guardan en arreglos por columna. Los reportes se
+calculan sobre esos arreglos agrupando de forma vectorizada, sin recorrer
+fila por fila en Python.
+
+Los rangos que ya terminaron (hasta <= hoy a las 00:00) no cambian, así que
+sus arreglos se guardan en disco (CACHE_DIR) y el siguiente reporte del
+mismo rango no vuelve a leer la BD. usar_cache=False ignora el caché.
+
+NumPy es opcional para el resto del proyecto; este módulo lo necesita:
+    pip install numpy
+
+Uso (desde la raíz del proyecto):
+    python analitica.py 2026-09-01 2026-10-01
+"""
+import hashlib
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+import db
+from models import desde_centavos
+
+CACHE_DIR = os.getenv(
+    "ANALITICA_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache_analitica"),
+)
+TAM_PAGINA = 2000
+
+
+def _requiere_numpy():
+    if np is None:
+        raise ImportError("analitica.py necesita NumPy: pip install numpy")
+
+
+class DatosVentas:
+    """
+    Arreglos por columna de los pedidos de un rango y de sus líneas.
+    Dinero en centavos (int64). tipos[k] es el tipo de entrega con código k.
+    """
+
+    __slots__ = ("pedido_id", "pedido_fecha", "pedido_tipo", "pedido_total",
+                 "linea_pedido", "linea_producto", "linea_cantidad", "linea_precio", "tipos")
+
+    COLUMNAS = __slots__[:-1]
+
+    def __init__(self, **columnas):
+        for nombre in self.__slots__:
+            setattr(self, nombre, columnas[nombre])
+
+    def linea_fecha(self):
+        """Fecha y hora del pedido de cada línea."""
+        return self.pedido_fecha[self._indice_pedido_por_linea()]
+
+    def linea_tipo(self):
+        return self.pedido_tipo[self._indice_pedido_por_linea()]
+
+    def _indice_pedido_por_linea(self):
+        orden = np.argsort(self.pedido_id, kind="stable")
+        return orden[np.searchsorted(self.pedido_id, self.linea_pedido, sorter=orden)]
+
+    def guardar(self, ruta):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = ruta + ".tmp.npz"
+        np.savez(temporal, tipos=np.array(self.tipos, dtype=str),
+                 **{c: getattr(self, c) for c in self.COLUMNAS})
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def abrir(cls, ruta):
+        with np.load(ruta) as datos:
+            columnas = {c: datos[c] for c in cls.COLUMNAS}
+            columnas["tipos"] = [str(t) for t in datos["tipos"]]
+        return cls(**columnas)
+
+
+# ========== Extracción ==========
+
+def _texto_fecha(valor):
+    # MySQL regresa datetime; SQLite, texto 'YYYY-MM-DD HH:MM:SS'
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep="T", timespec="seconds")
+    return str(valor).replace(" ", "T")
+
+
+def _a_centavos(valores):
+    # DECIMAL(10,2) cabe sin error en float64; rint corrige el .99999
+    return np.rint(np.asarray(valores, dtype=np.float64) * 100).astype(np.int64)
+
+
+def _leer_bd(desde, hasta, tam_pagina):
+    ids, fechas, tipos_txt, totales = [], [], [], []
+    l_pedido, l_producto, l_cantidad, l_precio = [], [], [], []
+    codigos = {}
+    for pedidos, detalles in db.iterar_ventas(desde, hasta, tam_pagina):
+        for p in pedidos:
+            ids.append(p["id"])
+            fechas.append(_texto_fecha(p["created_at"]))
+            tipos_txt.append(codigos.setdefault(p["tipo_entrega"], len(codigos)))
+            totales.append(float(p["total"]))
+        for d in detalles:
+            l_pedido.append(d["pedido_id"])
+            l_producto.append(d["producto_id"])
+            l_cantidad.append(d["cantidad"])
+            l_precio.append(float(d["precio_unitario"]))
+
+    return DatosVentas(
+        pedido_id=np.array(ids, dtype=np.int64),
+        pedido_fecha=np.array(fechas, dtype="datetime64[s]"),
+        pedido_tipo=np.array(tipos_txt, dtype=np.int16),
+        pedido_total=_a_centavos(totales),
+        linea_pedido=np.array(l_pedido, dtype=np.int64),
+        linea_producto=np.array(l_producto, dtype=np.int64),
+        linea_cantidad=np.array(l_cantidad, dtype=np.int64),
+        linea_precio=_a_centavos(l_precio),
+        tipos=list(codigos),
+    )
+
+
+def _ruta_cache(desde, hasta):
+    # Una BD distinta (otra copia SQLite, otro servidor) no comparte caché
+    origen = getattr(db.backend, "ruta", None) or "{host}:{port}/{database}".format(**db.DB_CONFIG)
+    llave = hashlib.sha1(f"{db.backend.nombre}|{origen}".encode()).hexdigest()[:12]
+    nombre = f"ventas_{llave}_{desde:%Y%m%d%H%M%S}_{hasta:%Y%m%d%H%M%S}.npz"
+    return os.path.join(CACHE_DIR, nombre)
+
+
+def cargar_ventas(desde, hasta, usar_cache=True, tam_pagina=TAM_PAGINA):
+    """
+    DatosVentas de los pedidos con desde <= created_at < hasta
+    (date o datetime). Lanza db.Error si falla la lectura.
+    """
+    _requiere_numpy()
+    desde, hasta = _como_datetime(desde), _como_datetime(hasta)
+    cerrado = hasta <= datetime.combine(date.today(), datetime.min.time())
+    ruta = _ruta_cache(desde, hasta)
+    if usar_cache and cerrado and os.path.exists(ruta):
+        return DatosVentas.abrir(ruta)
+
+    datos = _leer_bd(desde.strftime("%Y-%m-%d %H:%M:%S"), hasta.strftime("%Y-%m-%d %H:%M:%S"), tam_pagina)
+    if usar_cache and cerrado:
+        try:
+            datos.guardar(ruta)
+        except OSError as e:
+            print("No se pudo guardar el caché de ventas:", e)
+    return datos
+
+
+def _como_datetime(valor):
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime.combine(valor, datetime.min.time())
+    return datetime.fromisoformat(str(valor))
+
+
+# ========== Reportes ==========
+
+def ingresos_por_producto_dia(datos):
+    """
+    Unidades e ingresos por (día, producto). Regresa arreglos paralelos
+    dia (datetime64[D]), producto_id, unidades, ingresos (centavos),
+    ordenados por día y producto.
+    """
+    _requiere_numpy()
+    dias = datos.linea_fecha().astype("datetime64[D]")
+    llaves = np.empty(len(dias), dtype=[("dia", "datetime64[D]"), ("producto_id", np.int64)])
+    llaves["dia"] = dias
+    llaves["producto_id"] = datos.linea_producto
+    grupos, inverso = np.unique(llaves, return_inverse=True)
+    return {
+        "dia": grupos["dia"],
+        "producto_id": grupos["producto_id"],
+        "unidades": np.bincount(inverso, weights=datos.linea_cantidad, minlength=len(grupos)).astype(np.int64),
+        "ingresos": _sumar_por_grupo(inverso, datos.linea_cantidad * datos.linea_precio, len(grupos)),
+    }
+
+
+def ticket_promedio_por_entrega(datos):
+    """{tipo_entrega: (pedidos, ticket promedio como Decimal)}."""
+    _requiere_numpy()
+    n = len(datos.tipos)
+    conteo = np.bincount(datos.pedido_tipo, minlength=n)
+    sumas = _sumar_por_grupo(datos.pedido_tipo, datos.pedido_total, n)
+    resultado = {}
+    for codigo, tipo in enumerate(datos.tipos):
+        if conteo[codigo]:
+            promedio = desde_centavos(int(sumas[codigo])) / int(conteo[codigo])
+            resultado[tipo] = (int(conteo[codigo]), promedio.quantize(Decimal("0.01")))
+    return resultado
+
+
+def pedidos_por_hora(datos):
+    """Pedidos e ingresos (centavos) por hora del día: dos arreglos de 24."""
+    _requiere_numpy()
+    horas = (datos.pedido_fecha - datos.pedido_fecha.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+    return {
+        "pedidos": np.bincount(horas, minlength=24),
+        "ingresos": _sumar_por_grupo(horas, datos.pedido_total, 24),
+    }
+
+
+def hora_pico(datos):
+    """Hora (0-23) con más pedidos, o None si no hay pedidos."""
+    conteo = pedidos_por_hora(datos)["pedidos"]
+    return int(np.argmax(conteo)) if conteo.sum() else None
+
+
+def _sumar_por_grupo(grupos, valores, n):
+    # np.add.at suma en int64 exacto (bincount con weights pasaría por float)
+    sumas = np.zeros(n, dtype=np.int64)
+    np.add.at(sumas, grupos, valores)
+    return sumas
+
+
+# ========== Línea de comandos ==========
+
+def main():
+    if np is None:
+        raise SystemExit("analitica.py necesita NumPy: pip install numpy")
+    hoy = date.today()
+    desde = _como_datetime(sys.argv[1]) if len(sys.argv) > 1 else _como_datetime(hoy - timedelta(days=30))
+    hasta = _como_datetime(sys.argv[2]) if len(sys.argv) > 2 else _como_datetime(hoy + timedelta(days=1))
+
+    datos = cargar_ventas(desde, hasta)
+    print(f"Ventas del {desde:%Y-%m-%d %H:%M} al {hasta:%Y-%m-%d %H:%M}: "
+          f"{len(datos.pedido_id)} pedidos, {len(datos.linea_pedido)} líneas")
+
+    print("\nTicket promedio por tipo de entrega:")
+    for tipo, (n, promedio) in ticket_promedio_por_entrega(datos).items():
+        print(f"  {tipo:<10} {n:6d} pedidos  ${promedio}")
+
+    por_hora = pedidos_por_hora(datos)
+    pico = hora_pico(datos)
+    if pico is not None:
+        print(f"\nHora pico: {pico:02d}:00 ({por_hora['pedidos'][pico]} pedidos, "
+              f"${desde_centavos(int(por_hora['ingresos'][pico]))})")
+
+    reporte = ingresos_por_producto_dia(datos)
+    orden = np.argsort(-reporte["ingresos"], kind="stable")[:10]
+    print("\nTop 10 (día, producto) por ingresos:")
+    for i in orden:
+        print(f"  {reporte['dia'][i]}  producto {reporte['producto_id'][i]:>6}  "
+              f"{reporte['unidades'][i]:6d} u.  ${desde_centavos(int(reporte['ingresos'][i]))}")
+
+
+if __name__ == "__main__":
+    main()
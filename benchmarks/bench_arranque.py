@@ -0,0 +1,94 @@
+# benchmarks/bench_arranque.py
+"""
+Mide cuánto tarda en importarse la capa de BD (db + db_connection + controller)
+en un proceso nuevo, comparando el árbol actual con una versión anterior del
+repositorio (por defecto la de antes del administrador único de conexiones).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_arranque [revision_anterior] [repeticiones]
+
+La versión anterior se exporta con `git archive` a un directorio temporal.
+Para simular una BD caída o inalcanzable basta con cambiar DB_HOST/DB_PORT
+en el entorno, p. ej. DB_HOST=10.255.255.1 (la conexión se queda colgada
+hasta el timeout en la versión anterior).
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODIGO = "import db, db_connection, controller"
+
+
+def medir(directorio, repeticiones):
+    tiempos = []
+    salida = ""
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", CODIGO],
+            cwd=directorio,
+            capture_output=True,
+            text=True,
+        )
+        tiempos.append(time.perf_counter() - inicio)
+        salida = proc.stdout + proc.stderr
+    return tiempos, salida
+
+
+def exportar(revision, destino):
+    archivo = subprocess.run(
+        ["git", "archive", revision],
+        cwd=RAIZ,
+        capture_output=True,
+        check=True,
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", destino], input=archivo, check=True)
+    # el .env local puede tener cambios sin commit
+    shutil.copy(os.path.join(RAIZ, ".env"), os.path.join(destino, ".env"))
+
+
+def revision_por_defecto():
+    """La de antes del administrador único: padre del commit que agregó connection_manager.py."""
+    commits = subprocess.run(
+        ["git", "log", "--diff-filter=A", "--format=%h", "--", "connection_manager.py"],
+        cwd=RAIZ,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    if not commits:
+        raise SystemExit("No se encontró el commit que agregó connection_manager.py; pasa la revisión anterior")
+    return commits[-1] + "~1"
+
+
+def reportar(nombre, tiempos, salida):
+    lineas = [l for l in salida.strip().splitlines() if l]
+    print(
+        f"{nombre:<12} mediana={statistics.median(tiempos) * 1000:8.1f} ms  "
+        f"max={max(tiempos) * 1000:8.1f} ms  líneas impresas={len(lineas)}"
+    )
+
+
+def main():
+    revision = sys.argv[1] if len(sys.argv) > 1 else revision_por_defecto()
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"'{CODIGO}' en un proceso nuevo, {repeticiones} repeticiones")
+    print(f"DB_HOST={os.getenv('DB_HOST', '(del .env)')}")
+
+    destino = tempfile.mkdtemp(prefix="bench_arranque_")
+    try:
+        exportar(revision, destino)
+        reportar(revision, *medir(destino, repeticiones))
+    finally:
+        shutil.rmtree(destino, ignore_errors=True)
+    reportar("actual", *medir(RAIZ, repeticiones))
+
+
+if __name__ == "__main__":
+    main()
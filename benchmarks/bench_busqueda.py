@@ -0,0 +1,148 @@
+# benchmarks/bench_busqueda.py
+"""
+Tiempo por tecla de la búsqueda de productos de la GUI, de punta a punta:
+buscar en el Inventario, dar formato y actualizar la lista (ListaVirtual
+sobre un Listbox falso, del mismo alto que el de la GUI). Se escribe, se
+borra hasta dejar el cuadro vacío (lista completa) y se vuelve a escribir.
+
+    índice     buscar_texto + lista completa guardada (como gui.py)
+    sin caché  buscar_texto, pero listar() completo cada vez que se vacía
+    lineal     recorrido de listar() comparando nombres, sin caché
+
+Uso (desde la raíz del proyecto, no usa la BD ni abre ventanas):
+    python -m benchmarks.bench_busqueda [productos]
+"""
+import random
+import sys
+import time
+
+from lista_virtual import ListaVirtual
+from models import MAX_RESULTADOS_BUSQUEDA, Producto, Inventario
+
+PALABRAS = ["Big", "Mac", "Papas", "Medianas", "Grandes", "Refresco", "Helado", "Combo",
+            "McNuggets", "Pollo", "Queso", "Doble", "Cajita", "Café", "Pay", "Manzana"]
+# Alto de lst_productos en gui.py
+ALTO_LISTA = 20
+
+
+class ListboxFalso:
+    """Lo que ListaVirtual usa de tk.Listbox, guardando las filas en una lista."""
+
+    def __init__(self, height):
+        self.height = height
+        self.filas = []
+
+    def cget(self, opcion):
+        return self.height
+
+    def config(self, **opciones):
+        pass
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def insert(self, i, *textos):
+        i = len(self.filas) if i == "end" else i
+        self.filas[i:i] = textos
+
+    def delete(self, desde, hasta=None):
+        desde = len(self.filas) if desde == "end" else desde
+        hasta = desde if hasta is None else (len(self.filas) - 1 if hasta == "end" else hasta)
+        del self.filas[desde:hasta + 1]
+
+    def curselection(self):
+        return ()
+
+    def selection_set(self, i):
+        pass
+
+    def yview(self, *args):
+        pass
+
+
+def texto_producto(p):
+    # mismo formato que gui._texto_producto
+    return f"{p.producto_id} | {p.nombre} - ${p.precio:.2f} (Stock: {p.cantidad})"
+
+
+def teclas():
+    """Lo que va quedando en el cuadro de búsqueda tecla por tecla."""
+    estados = []
+    for texto in ("papas medianas", "doble queso 4242", "zz"):
+        estados += [texto[:i] for i in range(1, len(texto) + 1)]
+        estados += [texto[:i] for i in range(len(texto) - 1, -1, -1)]  # borrar hasta vaciar
+    return estados
+
+
+def lineal(inv, texto):
+    consulta = texto.casefold().split()
+    encontrados = []
+    for p in inv.listar():
+        nombre = p.nombre.casefold().split()
+        if all(any(w.startswith(q) for w in nombre) for q in consulta):
+            encontrados.append(p)
+            if len(encontrados) >= MAX_RESULTADOS_BUSQUEDA:
+                break
+    return encontrados
+
+
+def vista_indice(inv, vista):
+    todos = []
+
+    def tecla(texto):
+        if texto.strip():
+            vista.actualizar(inv.buscar_texto(texto, MAX_RESULTADOS_BUSQUEDA))
+            return
+        if not todos:
+            todos.append(inv.listar())
+        vista.actualizar(todos[0], fija=True)
+    return tecla
+
+
+def vista_sin_cache(inv, vista):
+    def tecla(texto):
+        vista.actualizar(inv.buscar_texto(texto, MAX_RESULTADOS_BUSQUEDA) if texto.strip() else inv.listar())
+    return tecla
+
+
+def vista_lineal(inv, vista):
+    def tecla(texto):
+        vista.actualizar(lineal(inv, texto) if texto.strip() else inv.listar())
+    return tecla
+
+
+def medir(nombre, armar, inv, estados):
+    vista = ListaVirtual(ListboxFalso(ALTO_LISTA), texto_producto, clave=lambda p: p.producto_id)
+    tecla = armar(inv, vista)
+    tecla("")  # la lista completa al abrir la ventana, fuera de la medición
+    tiempos = []
+    for texto in estados:
+        t = time.perf_counter()
+        tecla(texto)
+        tiempos.append(time.perf_counter() - t)
+    vacias = [s for s, texto in zip(tiempos, estados) if not texto]
+    print(f"{nombre:<9} ms/tecla promedio={sum(tiempos) / len(tiempos) * 1000:7.3f}  "
+          f"peor={max(tiempos) * 1000:7.3f}  cuadro vacío={max(vacias) * 1000:7.3f}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = random.Random(1)
+    inv = Inventario()
+    for i in range(n):
+        nombre = " ".join(rnd.sample(PALABRAS, 3)) + f" {i}"
+        inv.agregar_producto(Producto(i, nombre, rnd.randint(10, 200), 10))
+
+    t = time.perf_counter()
+    inv.construir_indices()
+    print(f"{n} productos, índices construidos en {(time.perf_counter() - t) * 1000:.0f} ms")
+
+    estados = teclas()
+    print(f"{len(estados)} teclas, hasta {MAX_RESULTADOS_BUSQUEDA} resultados, lista de {ALTO_LISTA} filas")
+    medir("índice", vista_indice, inv, estados)
+    medir("sin caché", vista_sin_cache, inv, estados)
+    medir("lineal", vista_lineal, inv, estados)
+
+
+if __name__ == "__main__":
+    main()
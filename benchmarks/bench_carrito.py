@@ -0,0 +1,58 @@
+# benchmarks/bench_carrito.py
+"""
+Costo de agregar productos a un carrito grande (pedidos para eventos) y
+mostrar el total después de cada clic, como hace la GUI: el Carrito anterior
+recorría todo el carrito en cada total(); el actual lleva el total al día.
+
+Uso (desde la raíz del proyecto, no usa la BD):
+    python -m benchmarks.bench_carrito [lineas] [piezas_por_linea]
+"""
+import sys
+import time
+
+from models import Producto, Carrito
+
+
+class CarritoAnterior:
+    """Copia del Carrito anterior (total recorriendo los items), solo para comparar."""
+
+    def __init__(self, usuario_id):
+        self.usuario_id = usuario_id
+        self.items = {}
+
+    def add(self, producto, cantidad=1):
+        self.items[producto.producto_id] = self.items.get(producto.producto_id, 0) + int(cantidad)
+
+    def total(self, productos):
+        tot = 0.0
+        for pid, qty in self.items.items():
+            prod = productos.get(pid)
+            if prod:
+                tot += prod.precio * qty
+        return tot
+
+
+def medir(nombre, clase, productos, piezas):
+    carrito = clase(1)
+    inicio = time.perf_counter()
+    clics = 0
+    for _ in range(piezas):
+        for p in productos.values():
+            carrito.add(p, 1)
+            total = carrito.total(productos)
+            clics += 1
+    transcurrido = time.perf_counter() - inicio
+    print(f"{nombre:<9} µs/clic={transcurrido * 1e6 / clics:8.2f}  total={total}")
+
+
+def main():
+    lineas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    piezas = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    productos = {i: Producto(i, f"Producto {i}", 10 + (i % 97) / 10, 1000) for i in range(lineas)}
+    print(f"{lineas} líneas, {piezas} piezas por línea ({lineas * piezas} clics)")
+    medir("anterior", CarritoAnterior, productos, piezas)
+    medir("actual", Carrito, productos, piezas)
+
+
+if __name__ == "__main__":
+    main()
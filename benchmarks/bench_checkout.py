@@ -0,0 +1,155 @@
+# benchmarks/bench_checkout.py
+"""
+Cuenta viajes a la base de datos (round trips) por pedido con la versión
+anterior de crear_pedido (una consulta por línea) y con la versión por lotes.
+
+Uso (desde la raíz del proyecto, con la BD configurada en .env):
+    python -m benchmarks.bench_checkout [lineas_por_pedido] [pedidos]
+"""
+import sys
+import time
+from datetime import datetime
+
+import connection_manager
+import db
+from db_backends import CacheSentencias
+
+
+class CursorContado:
+    def __init__(self, cur, contador):
+        self._cur = cur
+        self._contador = contador
+
+    def execute(self, *args, **kwargs):
+        self._contador["consultas"] += 1
+        return self._cur.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._contador["consultas"] += 1
+        return self._cur.executemany(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+
+class ConexionContada:
+    def __init__(self, conn, contador, caches):
+        self._conn = conn
+        self._contador = contador
+        # caché de sentencias propio de cada medición, para que todos los
+        # cursores que se usen pasen por el contador
+        self._sentencias = caches.setdefault(id(conn._sentencias), CacheSentencias())
+
+    def cursor(self, *args, **kwargs):
+        return CursorContado(self._conn.cursor(*args, **kwargs), self._contador)
+
+    def commit(self):
+        self._contador["commits"] += 1
+        return self._conn.commit()
+
+    def rollback(self):
+        self._contador["commits"] += 1
+        return self._conn.rollback()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+def _crear_pedido_por_linea(usuario_id, tipo_entrega, items):
+    """Copia de la implementación anterior, solo para comparar."""
+    conn = db.get_conn()
+    if not conn:
+        return None
+    cur = conn.cursor()
+    try:
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cur.execute(
+            "INSERT INTO pedidos (usuario_id, tipo_entrega, total, estado, created_at) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (usuario_id, tipo_entrega, 0, 'creado', now)
+        )
+        pid = cur.lastrowid
+        total = 0
+        for producto_id, cantidad in items:
+            prod = db.get_producto(producto_id)
+            if not prod:
+                continue
+            precio_unit = float(prod["precio"])
+            cur.execute(
+                "INSERT INTO detalle_pedido (pedido_id, producto_id, cantidad, precio_unitario) "
+                "VALUES (%s, %s, %s, %s)",
+                (pid, producto_id, cantidad, precio_unit)
+            )
+            total += precio_unit * cantidad
+            new_stock = max(int(prod["cantidad"]) - cantidad, 0)
+            cur.execute("UPDATE productos SET cantidad = %s WHERE id = %s", (new_stock, producto_id))
+        cur.execute("UPDATE pedidos SET total = %s WHERE id = %s", (total, pid))
+        conn.commit()
+        return pid
+    except db.Error as e:
+        print("Error al crear pedido:", e)
+        conn.rollback()
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+
+def medir(nombre, funcion, usuario_id, items, pedidos):
+    contador = {"conexiones": 0, "consultas": 0, "commits": 0}
+    caches = {}
+    get_conn_original = db.get_conn
+    get_conn_lectura_original = connection_manager.get_conn_lectura
+
+    def contar(conn):
+        if conn is None:
+            return None
+        contador["conexiones"] += 1
+        return ConexionContada(conn, contador, caches)
+
+    def get_conn_contado():
+        return contar(get_conn_original())
+
+    def get_conn_lectura_contado():
+        # las lecturas (transaccion(lectura=True)) no pasan por db.get_conn
+        conn, replica = get_conn_lectura_original()
+        return contar(conn), replica
+
+    db.get_conn = get_conn_contado
+    connection_manager.get_conn_lectura = get_conn_lectura_contado
+    try:
+        inicio = time.perf_counter()
+        for _ in range(pedidos):
+            if funcion(usuario_id, "mostrador", items) is None:
+                raise SystemExit(f"{nombre}: no se pudo crear el pedido")
+        transcurrido = time.perf_counter() - inicio
+    finally:
+        db.get_conn = get_conn_original
+        connection_manager.get_conn_lectura = get_conn_lectura_original
+
+    viajes = contador["consultas"] + contador["commits"]
+    print(
+        f"{nombre:<12} conexiones/pedido={contador['conexiones'] / pedidos:5.1f}  "
+        f"viajes/pedido={viajes / pedidos:5.1f}  "
+        f"ms/pedido={transcurrido * 1000 / pedidos:7.2f}"
+    )
+
+
+def main():
+    lineas = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    pedidos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    db.init_db()
+    usuario_id = db.create_usuario("Bench", f"bench_{int(time.time())}@example.com")
+    items = []
+    for i in range(lineas):
+        pid = db.create_producto(f"Bench {i}", 10.0 + i, lineas * pedidos * 10)
+        items.append((pid, 1))
+
+    print(f"{lineas} líneas por pedido, {pedidos} pedidos")
+    medir("por línea", _crear_pedido_por_linea, usuario_id, items, pedidos)
+    medir("por lotes", db.crear_pedido, usuario_id, items, pedidos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_contencion_catalogo.py
+"""
+Pedidos por segundo con varias cajas cobrando productos distintos (sin
+candados de fila compartidos entre ellas), con y sin incrementar la versión
+del catálogo en cada venta.
+
+"contador" repite el esquema anterior: cada pedido incrementa la fila única
+de catalogo_version al inicio de su transacción, así que en MySQL todas las
+ventas esperan ese candado hasta el commit de la anterior. "marca" es el
+actual (las ventas solo marcan stock_marca en sus propias filas).
+
+Pensado para MySQL (InnoDB); con SQLite solo sirve de prueba de humo,
+porque ahí toda escritura ya toma el candado del archivo.
+
+Uso (desde la raíz del proyecto, con la BD configurada en .env):
+    python -m benchmarks.bench_contencion_catalogo [cajas] [pedidos_por_caja]
+"""
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+
+def _pedido_con_contador(usuario_id, tipo_entrega, items):
+    """Venta que también incrementa catalogo_version, solo para comparar."""
+    with db.transaccion() as tx:
+        db.backend.incrementar_version_catalogo(tx)
+        return db.crear_pedido_estricto(usuario_id, tipo_entrega, items, tx=tx)
+
+
+def correr(nombre, crear, uid, productos, cajas, pedidos):
+    def caja(numero):
+        # cada caja vende solo su producto: la única fila en común sería la
+        # del contador
+        items = [(productos[numero], 1)]
+        latencias = []
+        for _ in range(pedidos):
+            inicio = time.perf_counter()
+            pid, faltantes = crear(uid, "mostrador", items)
+            latencias.append(time.perf_counter() - inicio)
+            if not pid:
+                raise RuntimeError(f"pedido fallido: {faltantes}")
+        return latencias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=cajas) as pool:
+        latencias = sorted(s for lote in pool.map(caja, range(cajas)) for s in lote)
+    transcurrido = time.perf_counter() - inicio
+    print(f"{nombre:<9} pedidos/s={len(latencias) / transcurrido:8.1f}  "
+          f"latencia ms: mediana={statistics.median(latencias) * 1000:6.1f}  "
+          f"p95={latencias[int(len(latencias) * 0.95)] * 1000:6.1f}")
+
+
+def main():
+    cajas = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    pedidos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    db.init_db()
+    if db.backend.nombre != "mysql":
+        print(f"Aviso: backend {db.backend.nombre}, los números no reflejan la contención de MySQL")
+    uid = db.create_usuario("Bench Contención", f"bench_contencion_{time.time_ns()}@example.com")
+    productos = [db.create_producto(f"Contención {i}", 10 + i, 1_000_000) for i in range(cajas)]
+    print(f"{cajas} cajas x {pedidos} pedidos, un producto distinto por caja")
+
+    correr("contador", _pedido_con_contador, uid, productos, cajas, pedidos)
+    correr("marca", db.crear_pedido_estricto, uid, productos, cajas, pedidos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# benchmarks/bench_memoria.py
+"""
+Bytes por producto de un Inventario en memoria: con las clases de antes
+(atributos en __dict__) y con las de models.py (__slots__).
+
+Uso (desde la raíz del proyecto, no usa la BD):
+    python -m benchmarks.bench_memoria [productos]
+"""
+import gc
+import sys
+import tracemalloc
+
+from models import Producto, Inventario
+
+
+class ProductoConDict:
+    """Copia de Producto antes de __slots__, solo para comparar."""
+
+    def __init__(self, producto_id, nombre, precio, cantidad):
+        self.producto_id = producto_id
+        self.nombre = nombre
+        self.precio = float(precio)
+        self.cantidad = int(cantidad)
+
+
+def medir(nombre, clase, n):
+    gc.collect()
+    tracemalloc.start()
+    inicio, _ = tracemalloc.get_traced_memory()
+    inv = Inventario()
+    for i in range(n):
+        inv.productos[i] = clase(i, f"Producto {i}", 10.0 + i % 100, i % 50)
+    usado, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<10} bytes/producto={(usado - inicio) / n:7.1f}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"Inventario de {n} productos (incluye nombre, precio y el dict del inventario)")
+    medir("__dict__", ProductoConDict, n)
+    medir("__slots__", Producto, n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# benchmarks/bench_metricas.py
+"""
+Costo de la instrumentación (metricas.py) en una operación corta de BD
+(db.get_producto: conexión, una consulta y commit), apagada y prendida.
+
+Uso (desde la raíz del proyecto, con la BD configurada en .env):
+    python -m benchmarks.bench_metricas [llamadas]
+"""
+import sys
+import time
+
+import db
+import metricas
+
+
+def medir(nombre, pid, llamadas):
+    inicio = time.perf_counter()
+    for _ in range(llamadas):
+        db.get_producto(pid)
+    transcurrido = time.perf_counter() - inicio
+    print(f"{nombre:<9} µs/llamada={transcurrido * 1e6 / llamadas:8.2f}")
+
+
+def main():
+    llamadas = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    db.init_db()
+    pid = db.create_producto("Bench Metricas", 1.0, 1)
+    medir("calentar", pid, llamadas // 10)
+
+    metricas.desactivar()
+    medir("apagadas", pid, llamadas)
+    metricas.activar()
+    medir("prendidas", pid, llamadas)
+    metricas.desactivar()
+    medir("apagadas", pid, llamadas)
+
+    datos = metricas.instantanea()["operaciones"]
+    for nombre in ("conexion.espera", "sql:SELECT productos", "commit", "db.get_producto"):
+        h = datos[nombre]
+        print(f"  {nombre:<22} promedio={h['promedio_ms']:.3f} ms  p95<={h['p95_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
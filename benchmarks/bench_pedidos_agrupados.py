@@ -0,0 +1,61 @@
+# benchmarks/bench_pedidos_agrupados.py
+"""
+Pedidos por segundo en hora pico: varias cajas cobrando al mismo tiempo,
+cada pedido con su propia transacción (db.crear_pedido_estricto) contra la
+cola con commit agrupado (cola_pedidos.ColaPedidos).
+
+Uso (desde la raíz del proyecto, con la BD configurada en .env):
+    python -m benchmarks.bench_pedidos_agrupados [cajas] [pedidos_por_caja] [ventana_ms]
+"""
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from cola_pedidos import ColaPedidos
+
+
+def correr(nombre, crear, uid, productos, cajas, pedidos):
+    def caja(numero):
+        latencias = []
+        for i in range(pedidos):
+            p = productos[(numero * pedidos + i) % len(productos)]
+            inicio = time.perf_counter()
+            pid, faltantes = crear(uid, "mostrador", [(p, 1), (productos[0], 1)])
+            latencias.append(time.perf_counter() - inicio)
+            if not pid:
+                raise RuntimeError(f"pedido fallido: {faltantes}")
+        return latencias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=cajas) as pool:
+        latencias = sorted(s for lote in pool.map(caja, range(cajas)) for s in lote)
+    transcurrido = time.perf_counter() - inicio
+    print(f"{nombre:<10} pedidos/s={len(latencias) / transcurrido:8.1f}  "
+          f"latencia ms: mediana={statistics.median(latencias) * 1000:6.1f}  "
+          f"p95={latencias[int(len(latencias) * 0.95)] * 1000:6.1f}")
+
+
+def main():
+    cajas = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    pedidos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    ventana_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    db.init_db()
+    uid = db.create_usuario("Bench Agrupados", f"bench_agrupados_{time.time_ns()}@example.com")
+    productos = [db.create_producto(f"Agrupado {i}", 10 + i, 1_000_000) for i in range(20)]
+    print(f"{cajas} cajas x {pedidos} pedidos (todos comparten el producto {productos[0]})")
+
+    correr("separados", db.crear_pedido_estricto, uid, productos, cajas, pedidos)
+    cola = ColaPedidos(ventana_ms=ventana_ms)
+    try:
+        correr("agrupados", cola.crear_pedido_estricto, uid, productos, cajas, pedidos)
+    finally:
+        cola.cerrar()
+    print(f"lotes={cola.stats['lotes']}  pedidos por lote={cola.stats['pedidos'] / max(cola.stats['lotes'], 1):.1f}  "
+          f"lotes fallidos={cola.stats['lotes_fallidos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/bench_servicio.py
+"""
+Prueba de carga del servicio de pedidos (servicio.py): N terminales
+simuladas, cada una con su conexión HTTP keep-alive, hacen login, buscan
+productos, cobran un pedido y leen su historial contra un solo proceso.
+Reporta peticiones por segundo, latencias y el estado del pool compartido.
+
+La BD es una copia temporal de la BD SQLite local (DB_SQLITE_PATH, por
+defecto data/sample_db.sqlite3), así la carga no ensucia ninguna BD real.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_servicio [terminales] [rondas_por_terminal]
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_origen = os.getenv("DB_SQLITE_PATH", "data/sample_db.sqlite3")
+if not os.path.isabs(_origen):
+    _origen = os.path.join(RAIZ, _origen)
+_copia = os.path.join(tempfile.mkdtemp(prefix="bench_servicio_"), "carga.sqlite3")
+shutil.copy(_origen, _copia)
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["DB_SQLITE_PATH"] = _copia
+
+import asyncio
+import http.client
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import controller
+import db
+import servicio
+
+
+def pedir(conexion, metodo, ruta, datos=None):
+    inicio = time.perf_counter()
+    conexion.request(metodo, ruta, body=json.dumps(datos) if datos is not None else None,
+                     headers={"Content-Type": "application/json"})
+    respuesta = conexion.getresponse()
+    cuerpo = json.loads(respuesta.read())
+    return respuesta.status, cuerpo, time.perf_counter() - inicio
+
+
+def terminal(numero, puerto, productos, rondas):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+    latencias, estados = [], {}
+
+    def medir(metodo, ruta, datos=None):
+        estado, cuerpo, segundos = pedir(conexion, metodo, ruta, datos)
+        latencias.append(segundos)
+        estados[estado] = estados.get(estado, 0) + 1
+        return cuerpo
+
+    try:
+        correo = f"terminal_{numero}_{time.time_ns()}@example.com"
+        uid = medir("POST", "/usuarios", {"nombre": f"Terminal {numero}", "correo": correo})["id"]
+        for ronda in range(rondas):
+            pid = productos[(numero + ronda) % len(productos)]
+            medir("POST", "/login", {"correo": correo})
+            medir("GET", "/productos?buscar=carga&limite=20")
+            medir("POST", "/pedidos", {"usuario_id": uid, "tipo_entrega": "mostrador", "items": [[pid, 1]]})
+            medir("GET", f"/usuarios/{uid}/pedidos?limite=20")
+    finally:
+        conexion.close()
+    return latencias, estados
+
+
+def main():
+    terminales = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rondas = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    db.init_db()
+    productos = [db.create_producto(f"Carga {i}", 10 + i, 1_000_000) for i in range(50)]
+    controller.cargar_inventario_desde_db(forzar=True)
+
+    loop = asyncio.new_event_loop()
+    hilo = threading.Thread(target=loop.run_forever, daemon=True)
+    hilo.start()
+    serv = servicio.ServicioPedidos()
+    servidor = asyncio.run_coroutine_threadsafe(serv.iniciar("127.0.0.1", 0), loop).result()
+    puerto = servidor.sockets[0].getsockname()[1]
+
+    print(f"{terminales} terminales x {rondas} rondas contra un proceso "
+          f"({servicio.HILOS_SERVICIO} hilos de BD, {servicio.MAX_EN_CURSO} peticiones a la vez)")
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=terminales) as pool:
+        resultados = list(pool.map(lambda n: terminal(n, puerto, productos, rondas), range(terminales)))
+    transcurrido = time.perf_counter() - inicio
+
+    latencias = sorted(s for lat, _ in resultados for s in lat)
+    estados = {}
+    for _, e in resultados:
+        for codigo, n in e.items():
+            estados[codigo] = estados.get(codigo, 0) + n
+    print(f"peticiones={len(latencias)}  por segundo={len(latencias) / transcurrido:.0f}  estados={estados}")
+    print(f"latencia ms: mediana={statistics.median(latencias) * 1000:.1f}  "
+          f"p95={latencias[int(len(latencias) * 0.95)] * 1000:.1f}  máx={latencias[-1] * 1000:.1f}")
+    print("pool:", controller.estadisticas_conexiones())
+    print("servicio:", serv.stats)
+
+    asyncio.run_coroutine_threadsafe(serv.cerrar(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == "__main__":
+    main()
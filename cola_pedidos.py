@@ -0,0 +1,108 @@
+# cola_pedidos.py
+"""
+Cola de cobro con commit agrupado (group commit) para las horas pico.
+
+Cada pedido por separado paga su propio commit, y en hora pico el tiempo del
+commit (fsync del log de la BD) es lo que limita los pedidos por segundo.
+La cola escribe los pedidos en lotes de hasta MAX_LOTE, en una sola
+transacción con db.crear_pedidos_estrictos: un bloqueo de productos, un
+UPDATE de stock, un INSERT de detalle y un commit para todo el lote.
+
+Mientras un lote se escribe, los pedidos que llegan se juntan para el
+siguiente, así que en hora pico los lotes se forman solos y con poca carga
+cada pedido se escribe en cuanto llega. PEDIDOS_VENTANA_MS > 0 además espera
+esos milisegundos a que lleguen más pedidos antes de escribir (sirve cuando
+el commit es lento, p. ej. MySQL con fsync en disco lento; por defecto 0,
+igual que binlog_group_commit_sync_delay de MySQL).
+
+Cada cliente recibe su propio (pedido_id, faltantes). Un pedido sin stock
+solo se rechaza a sí mismo; si el lote completo falla en la BD (p. ej. un
+usuario_id inválido o un deadlock), sus pedidos se vuelven a intentar uno
+por uno con db.crear_pedido_estricto, así el error solo le llega al pedido
+que lo causó.
+
+Los pedidos se escriben desde el hilo de la cola, así que al confirmar un
+lote se marcan como escritoras las sesiones de BD de quienes los mandaron
+(para que sus lecturas siguientes no vayan a una réplica atrasada).
+
+Es opcional: controller la usa si AGRUPAR_PEDIDOS=1 en el .env.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import connection_manager
+import db
+
+VENTANA_MS = float(os.getenv("PEDIDOS_VENTANA_MS", 0))
+MAX_LOTE = int(os.getenv("PEDIDOS_MAX_LOTE", 50))
+
+_FIN = object()
+
+
+class ColaPedidos:
+    def __init__(self, ventana_ms=VENTANA_MS, max_lote=MAX_LOTE):
+        self.ventana = ventana_ms / 1000
+        self.max_lote = max_lote
+        self.stats = {"pedidos": 0, "lotes": 0, "lotes_fallidos": 0}
+        self._cola = queue.SimpleQueue()
+        self._hilo = threading.Thread(target=self._trabajar, name="cola-pedidos", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, usuario_id, tipo_entrega, items):
+        """Encola el pedido y regresa un Future con su (pedido_id, faltantes)."""
+        futuro = Future()
+        pedido = (usuario_id, tipo_entrega, list(items))
+        self._cola.put((futuro, pedido, connection_manager.sesion_actual()))
+        return futuro
+
+    def crear_pedido_estricto(self, usuario_id, tipo_entrega, items):
+        """Igual que db.crear_pedido_estricto, pero dentro de un lote."""
+        return self.enviar(usuario_id, tipo_entrega, items).result()
+
+    def cerrar(self):
+        """Escribe lo que ya estaba en la cola y detiene el hilo."""
+        self._cola.put(_FIN)
+        self._hilo.join()
+
+    def _trabajar(self):
+        terminar = False
+        while not terminar:
+            primero = self._cola.get()
+            if primero is _FIN:
+                return
+            # Mientras se escribe un lote se va llenando el siguiente
+            lote = [primero]
+            limite = time.monotonic() + self.ventana
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                try:
+                    siguiente = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is _FIN:
+                    terminar = True
+                    break
+                lote.append(siguiente)
+            self._escribir(lote)
+
+    def _escribir(self, lote):
+        pedidos = [pedido for _, pedido, _ in lote]
+        try:
+            resultados = db.crear_pedidos_estrictos(pedidos) if len(lote) > 1 else None
+            if resultados is None:
+                if len(lote) > 1:
+                    self.stats["lotes_fallidos"] += 1
+                # Uno por uno, cada pedido con su transacción y sus reintentos
+                resultados = [db.crear_pedido_estricto(*pedido) for pedido in pedidos]
+        except Exception as e:
+            for futuro, _, _ in lote:
+                futuro.set_exception(e)
+            return
+        self.stats["pedidos"] += len(lote)
+        self.stats["lotes"] += 1
+        connection_manager.marcar_escritura(*{sesion for _, _, sesion in lote})
+        for (futuro, _, _), resultado in zip(lote, resultados):
+            futuro.set_result(resultado)
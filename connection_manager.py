@@ -0,0 +1,477 @@
+# connection_manager.py
+"""
+Administrador único de conexiones del proceso.
+
+db.py, db_connection.py y controller.py piden sus conexiones aquí, así que
+hay un solo pool por proceso. Nada se conecta al importar: el pool se crea
+con la primera conexión que se pide, y cada conexión se abre hasta que hace
+falta. Una conexión solo se valida con ping si estuvo inactiva más de
+POOL_PING_INACTIVIDAD segundos.
+
+Si hay una réplica de lectura configurada (ver db_backends.crear_backend_replica)
+tiene su propio pool, y EnrutadorLecturas decide a cuál va cada lectura.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+import db_backends
+
+load_dotenv()
+
+# Config de conexión a MySQL
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", 3306)),
+    "database": os.getenv("DB_NAME", "proyecto2"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "MC_Pedro1171"),
+    "autocommit": False,
+    "charset": "utf8mb4",
+}
+
+POOL_NAME = os.getenv("POOL_NAME", "proyecto2_pool")
+POOL_SIZE = int(os.getenv("POOL_SIZE", 5))
+POOL_PING_INACTIVIDAD = float(os.getenv("POOL_PING_INACTIVIDAD", 30))
+# Con el pool lleno, cuánto espera (en fila) quien pide una conexión antes
+# de rendirse; 0 = no esperar
+POOL_ESPERA_MAX = float(os.getenv("POOL_ESPERA_MAX", 10))
+# Con demanda sostenida (alguien lleva POOL_CRECER_TRAS_MS esperando) el pool
+# crece de POOL_SIZE hasta POOL_MAX; las conexiones de más se cierran cuando
+# pasan POOL_INACTIVIDAD_EXTRA segundos sin que nadie tenga que esperar
+POOL_MAX = max(POOL_SIZE, int(os.getenv("POOL_MAX", POOL_SIZE * 2)))
+POOL_CRECER_TRAS_MS = float(os.getenv("POOL_CRECER_TRAS_MS", 100))
+POOL_INACTIVIDAD_EXTRA = float(os.getenv("POOL_INACTIVIDAD_EXTRA", 60))
+# POOL_REINICIO_COMPLETO=1 reinicia la sesión completa al devolver cada
+# conexión (un viaje más al servidor); por defecto solo se cierra la
+# transacción si quedó abierta, sin ir al servidor
+POOL_REINICIO_COMPLETO = os.getenv("POOL_REINICIO_COMPLETO", "0") == "1"
+
+# Réplica de lectura: las lecturas de una sesión van a la primaria durante
+# LEER_PRIMARIA_TRAS_ESCRIBIR segundos después de que esa sesión escribe (así
+# ve lo que acaba de escribir). La réplica se aparta si va más de
+# REPLICA_RETRASO_MAX segundos atrás (se mide cada REPLICA_REVISAR_CADA
+# segundos) o, si falla, durante REPLICA_PAUSA_TRAS_FALLA segundos.
+LEER_PRIMARIA_TRAS_ESCRIBIR = float(os.getenv("LEER_PRIMARIA_TRAS_ESCRIBIR", 5))
+REPLICA_RETRASO_MAX = float(os.getenv("REPLICA_RETRASO_MAX", 5))
+REPLICA_REVISAR_CADA = float(os.getenv("REPLICA_REVISAR_CADA", 1))
+REPLICA_PAUSA_TRAS_FALLA = float(os.getenv("REPLICA_PAUSA_TRAS_FALLA", 30))
+# Sesiones recordadas antes de limpiar las que ya vencieron
+MAX_SESIONES_ESCRITURA = 10000
+
+_sesion = contextvars.ContextVar("sesion_bd", default=None)
+
+
+class ConexionPrestada:
+    """Conexión entregada por el pool; close() la regresa en vez de cerrarla."""
+
+    __slots__ = ("_pool", "_raw")
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.devolver(raw)
+
+    def __getattr__(self, nombre):
+        return getattr(self._raw, nombre)
+
+
+class _Turno:
+    """Lugar en la fila de espera del pool."""
+
+    __slots__ = ("listo", "raw", "abrir")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.raw = None      # conexión libre que le tocó
+        self.abrir = False   # o permiso para abrir una nueva
+
+
+class PoolConexiones:
+    """
+    Pool sobre las conexiones crudas de un backend.
+
+    Las conexiones se abren conforme se necesitan, hasta `tamano`, y las
+    libres se reutilizan de la más reciente a la más vieja (la más reciente
+    es la que menos probablemente caducó en el servidor). Si no hay ninguna
+    libre, quien la pide se forma y espera hasta espera_max segundos; las
+    conexiones que se devuelven se entregan en orden de llegada. Si alguien
+    lleva crecer_tras segundos esperando, el límite sube de uno en uno hasta
+    `maximo`, y vuelve a bajar (cerrando las conexiones de más) cuando pasa
+    inactividad_extra sin que nadie espere.
+    """
+
+    def __init__(self, backend, tamano, ping_tras_inactividad, maximo=None,
+                 espera_max=POOL_ESPERA_MAX, crecer_tras=POOL_CRECER_TRAS_MS / 1000,
+                 inactividad_extra=POOL_INACTIVIDAD_EXTRA, reinicio_completo=POOL_REINICIO_COMPLETO):
+        self.backend = backend
+        self.tamano = tamano
+        self.maximo = max(tamano, maximo if maximo is not None else tamano)
+        self.ping_tras_inactividad = ping_tras_inactividad
+        self.espera_max = espera_max
+        self.crecer_tras = crecer_tras
+        self.inactividad_extra = inactividad_extra
+        self.reinicio_completo = reinicio_completo
+        self._libres = []  # (conexion, momento en que se devolvió)
+        self._abiertas = 0
+        self._limite = tamano
+        self._fila = deque()  # _Turno en orden de llegada
+        self._ultima_espera = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "creadas": 0,
+            "prestamos": 0,
+            "pings": 0,
+            "descartadas": 0,
+            "esperas": 0,
+            "espera_total_ms": 0.0,
+            "agotado": 0,
+            "crecimientos": 0,
+            "reducciones": 0,
+        }
+
+    def obtener(self):
+        raw = None
+        devuelta = None
+        turno = None
+        with self._lock:
+            if self._fila:
+                turno = self._formar()  # nadie se mete antes que los que ya esperan
+            elif self._libres:
+                raw, devuelta = self._libres.pop()
+            elif self._abiertas < self._limite:
+                self._abiertas += 1
+            else:
+                turno = self._formar()
+            if turno is None:
+                self._stats["prestamos"] += 1
+
+        if turno is not None:
+            if not self._esperar(turno):
+                print("Error al obtener conexión: pool agotado.")
+                return None
+            raw = turno.raw
+            devuelta = None if raw is None else time.monotonic()
+
+        if raw is not None and time.monotonic() - devuelta > self.ping_tras_inactividad:
+            self._contar("pings")
+            if not self.backend.validar(raw):
+                self._descartar(raw, reabrir=True)
+                raw = None
+
+        if raw is None:
+            try:
+                raw = self.backend.conectar()
+            except self.backend.Error as e:
+                with self._lock:
+                    self._abiertas -= 1
+                    self._repartir()
+                print("Error al obtener conexión:", e)
+                return None
+            self._contar("creadas")
+
+        return ConexionPrestada(self, raw)
+
+    def _formar(self):
+        turno = _Turno()
+        self._fila.append(turno)
+        self._stats["esperas"] += 1
+        return turno
+
+    def _esperar(self, turno):
+        """Espera su turno; True si le tocó conexión (o permiso de abrir una)."""
+        inicio = time.monotonic()
+        fin = inicio + self.espera_max
+        crecer_en = inicio + self.crecer_tras
+        while True:
+            ahora = time.monotonic()
+            pausa = fin - ahora
+            if self._limite < self.maximo:
+                pausa = min(pausa, max(crecer_en - ahora, 0.001))
+            if pausa > 0 and turno.listo.wait(pausa):
+                break
+            with self._lock:
+                if turno.listo.is_set():
+                    break
+                ahora = time.monotonic()
+                self._ultima_espera = ahora
+                if ahora >= fin:
+                    self._fila.remove(turno)
+                    self._stats["agotado"] += 1
+                    self._stats["espera_total_ms"] += (ahora - inicio) * 1000
+                    return False
+                if ahora >= crecer_en and self._limite < self.maximo:
+                    # Demanda sostenida: una conexión más para el primero de la
+                    # fila (y otra más si dentro de crecer_tras sigue esperando)
+                    crecer_en = ahora + self.crecer_tras
+                    self._limite += 1
+                    self._stats["crecimientos"] += 1
+                    self._repartir()
+        with self._lock:
+            self._ultima_espera = time.monotonic()
+            self._stats["prestamos"] += 1
+            self._stats["espera_total_ms"] += (self._ultima_espera - inicio) * 1000
+        return True
+
+    def _repartir(self):
+        """Con el lock tomado: da conexiones libres (o lugares) a la fila, en orden."""
+        while self._fila:
+            if self._libres:
+                raw, _ = self._libres.pop()
+                turno = self._fila.popleft()
+                turno.raw = raw
+            elif self._abiertas < self._limite:
+                self._abiertas += 1
+                turno = self._fila.popleft()
+                turno.abrir = True
+            else:
+                return
+            turno.listo.set()
+
+    def devolver(self, raw):
+        try:
+            self.backend.reiniciar(raw, completo=self.reinicio_completo)
+        except self.backend.Error:
+            self._descartar(raw)
+            return
+        sobrante = None
+        with self._lock:
+            self._libres.append((raw, time.monotonic()))
+            if self._fila:
+                self._repartir()
+            elif (self._limite > self.tamano
+                  and time.monotonic() - self._ultima_espera > self.inactividad_extra):
+                self._limite -= 1
+                self._stats["reducciones"] += 1
+                if self._abiertas > self._limite:
+                    # se cierra la libre que lleva más tiempo sin usarse
+                    sobrante, _ = self._libres.pop(0)
+                    self._abiertas -= 1
+        if sobrante is not None:
+            try:
+                sobrante.close()
+            except Exception:
+                pass
+
+    def _descartar(self, raw, reabrir=False):
+        """Cierra una conexión rota; con reabrir=True su lugar se conserva."""
+        self._contar("descartadas")
+        try:
+            raw.close()
+        except Exception:
+            pass
+        if not reabrir:
+            with self._lock:
+                self._abiertas -= 1
+                self._repartir()
+
+    def _contar(self, clave):
+        with self._lock:
+            self._stats[clave] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["espera_total_ms"] = round(stats["espera_total_ms"], 3)
+            stats["tamano"] = self.tamano
+            stats["limite"] = self._limite
+            stats["maximo"] = self.maximo
+            stats["abiertas"] = self._abiertas
+            stats["libres"] = len(self._libres)
+            stats["en_uso"] = self._abiertas - len(self._libres)
+            stats["en_espera"] = len(self._fila)
+        return stats
+
+
+class ConnectionManager:
+    """
+    Punto único para pedir conexiones. El backend se elige al crear el
+    administrador (sin conectarse); el pool se crea con la primera conexión.
+    """
+
+    def __init__(self, backend, tamano=POOL_SIZE, ping_tras_inactividad=POOL_PING_INACTIVIDAD,
+                 maximo=POOL_MAX, espera_max=POOL_ESPERA_MAX):
+        self.backend = backend
+        self.tamano = tamano
+        self.maximo = maximo
+        self.ping_tras_inactividad = ping_tras_inactividad
+        self.espera_max = espera_max
+        self._pool = None
+        self._lock = threading.Lock()
+        self._prestamos_directos = 0
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = PoolConexiones(
+                        self.backend, self.tamano, self.ping_tras_inactividad,
+                        maximo=self.maximo, espera_max=self.espera_max,
+                    )
+        return self._pool
+
+    def get_conn(self):
+        if not self.backend.usa_pool:
+            # El backend ya reutiliza sus conexiones (p. ej. SQLite por hilo)
+            self._prestamos_directos += 1
+            return self.backend.get_conn()
+        return self._obtener_pool().obtener()
+
+    def estadisticas(self):
+        stats = {
+            "backend": self.backend.nombre,
+            "pool": POOL_NAME,
+            "inicializado": self._pool is not None or self._prestamos_directos > 0,
+        }
+        if self._pool is not None:
+            stats.update(self._pool.estadisticas())
+        else:
+            stats["prestamos"] = self._prestamos_directos
+        return stats
+
+
+class EnrutadorLecturas:
+    """
+    Reparte las lecturas entre la réplica y la primaria. Las escrituras
+    siempre van a la primaria (get_conn); db.py avisa con marcar_escritura()
+    cuando una sesión confirma una escritura.
+
+    La sesión es la que se haya puesto con `with sesion(clave):` en el hilo
+    actual (None si no hay, p. ej. la GUI, que tiene un solo usuario).
+    """
+
+    def __init__(self, primaria, replica=None, tras_escribir=LEER_PRIMARIA_TRAS_ESCRIBIR,
+                 retraso_max=REPLICA_RETRASO_MAX, revisar_cada=REPLICA_REVISAR_CADA,
+                 pausa_tras_falla=REPLICA_PAUSA_TRAS_FALLA, reloj=time.monotonic):
+        self.primaria = primaria
+        self.replica = replica
+        self.tras_escribir = tras_escribir
+        self.retraso_max = retraso_max
+        self.revisar_cada = revisar_cada
+        self.pausa_tras_falla = pausa_tras_falla
+        self.reloj = reloj
+        self.retraso = None          # último retraso medido, en segundos
+        self._escrituras = {}        # sesión -> hasta cuándo lee de la primaria
+        self._revisar_en = 0.0
+        self._apartada_hasta = 0.0   # réplica retrasada o caída hasta este momento
+        self._lock = threading.Lock()
+        self.stats = {"replica": 0, "primaria": 0, "tras_escritura": 0, "retrasada": 0, "fallas": 0}
+
+    def get_conn_lectura(self):
+        """Regresa (conexión, es_replica); la conexión es None si ninguna responde."""
+        if self.replica is not None:
+            conn = self._conn_replica()
+            if conn is not None:
+                return conn, True
+        self._contar("primaria")
+        return self.primaria.get_conn(), False
+
+    def marcar_escritura(self, *sesiones):
+        """La sesión actual (o las que se pasen) acaba de confirmar una escritura."""
+        if self.replica is None:
+            return
+        ahora = self.reloj()
+        with self._lock:
+            if len(self._escrituras) >= MAX_SESIONES_ESCRITURA:
+                self._escrituras = {s: t for s, t in self._escrituras.items() if t > ahora}
+            for clave in sesiones or (_sesion.get(),):
+                self._escrituras[clave] = ahora + self.tras_escribir
+
+    def fallo_replica(self, error):
+        """La réplica no respondió: las lecturas van a la primaria un rato."""
+        with self._lock:
+            self.stats["fallas"] += 1
+            self._apartada_hasta = self.reloj() + self.pausa_tras_falla
+        print(f"Réplica no disponible, se lee de la primaria por {self.pausa_tras_falla:g} s:", error)
+
+    def _conn_replica(self):
+        ahora = self.reloj()
+        with self._lock:
+            if self._escrituras.get(_sesion.get(), 0.0) > ahora:
+                self.stats["tras_escritura"] += 1
+                return None
+            if self._apartada_hasta > ahora:
+                return None
+            revisar = ahora >= self._revisar_en
+            if revisar:
+                self._revisar_en = ahora + self.revisar_cada  # solo un hilo mide
+
+        conn = self.replica.get_conn()
+        if conn is None:
+            self.fallo_replica("sin conexión")
+            return None
+        if revisar:
+            try:
+                retraso = self.replica.backend.retraso(conn)
+            except self.replica.backend.Error as e:
+                print("No se pudo medir el retraso de la réplica:", e)
+                retraso = None
+            self.retraso = retraso
+            if retraso is None or retraso > self.retraso_max:
+                conn.close()
+                with self._lock:
+                    self.stats["retrasada"] += 1
+                    self._apartada_hasta = ahora + self.revisar_cada
+                return None
+        self._contar("replica")
+        return conn
+
+    def _contar(self, clave):
+        with self._lock:
+            self.stats[clave] += 1
+
+
+def sesion_actual():
+    return _sesion.get()
+
+
+@contextmanager
+def sesion(clave):
+    """
+    with sesion(usuario_id): ...
+    Las lecturas dentro del bloque ven las escrituras de la misma sesión
+    aunque la réplica todavía no las tenga.
+    """
+    token = _sesion.set(clave)
+    try:
+        yield
+    finally:
+        _sesion.reset(token)
+
+
+manager = ConnectionManager(db_backends.crear_backend(DB_CONFIG))
+_backend_replica = db_backends.crear_backend_replica(DB_CONFIG)
+manager_replica = ConnectionManager(_backend_replica) if _backend_replica is not None else None
+lecturas = EnrutadorLecturas(manager, manager_replica)
+
+
+def get_conn():
+    return manager.get_conn()
+
+
+def get_conn_lectura():
+    """(conexión, es_replica) para una transacción de solo lectura."""
+    return lecturas.get_conn_lectura()
+
+
+def marcar_escritura(*sesiones):
+    lecturas.marcar_escritura(*sesiones)
+
+
+def estadisticas():
+    stats = manager.estadisticas()
+    if lecturas.replica is not None:
+        for nombre, valor in lecturas.replica.estadisticas().items():
+            stats[f"replica_{nombre}"] = valor
+        for nombre, valor in lecturas.stats.items():
+            stats[f"lecturas_{nombre}"] = valor
+        stats["replica_retraso"] = lecturas.retraso
+    return stats
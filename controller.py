@@ -1,33 +1,237 @@
 # controller.py parte 2
 from models import Inventario, Producto, Carrito, Usuario
 import db
+import cola_pedidos
+import connection_manager
+import importador
+import os
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List
 
 
-def cargar_inventario_desde_db() -> Inventario:
-    inv = Inventario()
-    rows = db.listar_productos()
-    for r in rows:
-        p = Producto(r['id'], r['nombre'], r['precio'], r['cantidad'])
-        inv.agregar_producto(p)
-    return inv
+# Caché del inventario para todo el proceso. Se sincroniza con dos marcas de
+# la BD: la versión del catálogo, que incrementan las ediciones de productos
+# (ver db.listar_productos_cambiados), y la hora del servidor con la que las
+# ventas marcan el stock que cambian (ver db.listar_stock_cambiado).
+_cache_inventario = {"version": None, "marca": None, "inventario": None}
+_lock_inventario = threading.Lock()
+
+
+def _producto_desde_row(r) -> Producto:
+    return Producto(r['id'], r['nombre'], r['precio'], r['cantidad'])
+
+
+def cargar_inventario_desde_db(forzar: bool = False) -> Inventario:
+    """
+    Regresa el inventario. Después de la primera carga se piden solo los
+    productos editados desde la última sincronización y los que cambiaron
+    de stock por ventas recientes, y se aplican sobre el mismo objeto
+    Inventario (costo proporcional a los cambios).
+    forzar=True recarga el catálogo completo.
+    """
+    with _lock_inventario:
+        cache = _cache_inventario
+        inv = cache["inventario"]
+        if not forzar and inv is not None:
+            marcas = db.get_marcas_catalogo()
+            if marcas is not None:
+                version, marca = marcas
+                # Las marcas se leyeron antes que los cambios: lo que se
+                # confirme en medio se vuelve a aplicar la próxima vez (es
+                # idempotente). Ventas después de ediciones: es la lectura
+                # más reciente
+                editados = [] if version == cache["version"] else db.listar_productos_cambiados(cache["version"])
+                vendidos = db.listar_stock_cambiado(cache["marca"])
+                if editados is not None and vendidos is not None:
+                    inv.aplicar_cambios(_producto_desde_row(r) for r in editados + vendidos)
+                    cache["version"], cache["marca"] = version, marca
+                    return inv
+
+        # Marcas primero y luego el catálogo por páginas (sin armar una lista
+        # con todas las filas): si algo cambia en medio se aplicará de nuevo
+        # en la siguiente sincronización
+        marcas = db.get_marcas_catalogo()
+        inv = Inventario()
+        try:
+            for r in db.iterar_productos():
+                inv.agregar_producto(_producto_desde_row(r))
+        except db.Error as e:
+            print("Error al cargar inventario:", e)
+            return Inventario()
+        # Los índices de búsqueda se arman aquí (normalmente en un hilo de
+        # fondo) y no en la primera tecla que se escriba en la GUI
+        inv.construir_indices()
+        if marcas is not None:
+            cache["version"], cache["marca"] = marcas
+            cache["inventario"] = inv
+        return inv
+
+
+def invalidar_cache_inventario():
+    with _lock_inventario:
+        _cache_inventario["version"] = None
+        _cache_inventario["marca"] = None
+        _cache_inventario["inventario"] = None
+
+
+# Usuarios recientes por correo y por id (cambio de cajero en el turno: el
+# mismo puñado de correos una y otra vez). Los correos que no existen se
+# recuerdan poco tiempo, por si alguien los registra desde otra caja.
+USUARIOS_CACHE_TAMANO = int(os.getenv("USUARIOS_CACHE_TAMANO", 256))
+USUARIOS_CACHE_TTL = float(os.getenv("USUARIOS_CACHE_TTL", 300))
+USUARIOS_CACHE_TTL_AUSENTE = float(os.getenv("USUARIOS_CACHE_TTL_AUSENTE", 5))
+
+_NO_ESTA = object()
+
+
+class CacheUsuarios:
+    """
+    LRU de objetos Usuario con caducidad. Cada usuario se guarda con dos
+    llaves, ("correo", correo) e ("id", id); un correo inexistente se guarda
+    como None (entrada negativa) con un TTL más corto. obtener() regresa
+    el Usuario, None (se sabe que no existe) o _NO_ESTA (hay que ir a la BD).
+    """
+
+    def __init__(self, tamano=USUARIOS_CACHE_TAMANO, ttl=USUARIOS_CACHE_TTL,
+                 ttl_ausente=USUARIOS_CACHE_TTL_AUSENTE, reloj=time.monotonic):
+        self.tamano = tamano
+        self.ttl = ttl
+        self.ttl_ausente = ttl_ausente
+        self._reloj = reloj
+        self._entradas = OrderedDict()   # llave -> (vence, Usuario o None)
+        self._lock = threading.Lock()
+
+    def obtener(self, llave):
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is None:
+                return _NO_ESTA
+            if entrada[0] <= self._reloj():
+                del self._entradas[llave]
+                return _NO_ESTA
+            self._entradas.move_to_end(llave)
+            return entrada[1]
+
+    def guardar(self, usuario):
+        with self._lock:
+            vence = self._reloj() + self.ttl
+            self._poner(("correo", usuario.correo), (vence, usuario))
+            self._poner(("id", usuario.usuario_id), (vence, usuario))
+
+    def guardar_ausente(self, correo):
+        with self._lock:
+            self._poner(("correo", correo), (self._reloj() + self.ttl_ausente, None))
+
+    def invalidar(self, correo=None, uid=None):
+        with self._lock:
+            self._entradas.pop(("correo", correo), None)
+            self._entradas.pop(("id", uid), None)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def _poner(self, llave, entrada):
+        self._entradas[llave] = entrada
+        self._entradas.move_to_end(llave)
+        while len(self._entradas) > self.tamano:
+            self._entradas.popitem(last=False)
+
+
+_cache_usuarios = CacheUsuarios()
+
+
+def _usuario_desde_row(row) -> Usuario:
+    return Usuario(row["id"], row["nombre"], row["correo"], row.get("rol", "cliente"))
 
 
 def crear_usuario_y_obtener_id(nombre: str, correo: str, rol: str = "cliente") -> int:
-    return db.create_usuario(nombre, correo, rol)
+    user = registrar_usuario(nombre, correo, rol)
+    return user.usuario_id if user else None
+
+
+def registrar_usuario(nombre: str, correo: str, rol: str = "cliente"):
+    """
+    Registra el usuario (o encuentra el que ya tiene ese correo) y regresa
+    el Usuario en un solo viaje a la BD; si ya está en caché, sin ir a la BD.
+    Regresa None si falla.
+    """
+    user = _cache_usuarios.obtener(("correo", correo))
+    if user is not _NO_ESTA and user is not None:
+        return user
+    row = db.upsert_usuario(nombre, correo, rol)
+    # Escritura: la entrada negativa del correo (si había) ya no sirve
+    _cache_usuarios.invalidar(correo=correo)
+    if not row:
+        return None
+    user = _usuario_desde_row(row)
+    _cache_usuarios.guardar(user)
+    return user
 
 
 def obtener_usuario_por_correo(correo: str):
-    row = db.get_usuario_por_correo(correo)
+    user = _cache_usuarios.obtener(("correo", correo))
+    if user is not _NO_ESTA:
+        return user
+    try:
+        with db.transaccion() as tx:
+            row = db.get_usuario_por_correo(correo, tx=tx)
+    except db.Error as e:
+        # Un error no se guarda como "no existe"
+        print("Error al obtener usuario por correo:", e)
+        return None
     if not row:
+        _cache_usuarios.guardar_ausente(correo)
         return None
-    return Usuario(row["id"], row["nombre"], row["correo"], row.get("rol", "cliente"))
+    user = _usuario_desde_row(row)
+    _cache_usuarios.guardar(user)
+    return user
+
+
+def obtener_usuario(uid: int):
+    user = _cache_usuarios.obtener(("id", uid))
+    if user is not _NO_ESTA:
+        return user
+    row = db.get_usuario(uid)
+    if not row:
+        return None
+    user = _usuario_desde_row(row)
+    _cache_usuarios.guardar(user)
+    return user
+
+
+def invalidar_cache_usuarios():
+    _cache_usuarios.limpiar()
+
+
+# Con AGRUPAR_PEDIDOS=1 los cobros de todo el proceso (varias cajas en el
+# servicio) pasan por una sola cola con commit agrupado (ver cola_pedidos.py)
+AGRUPAR_PEDIDOS = os.getenv("AGRUPAR_PEDIDOS", "0") == "1"
+_cola_pedidos = None
+_lock_cola_pedidos = threading.Lock()
+
+
+def _obtener_cola_pedidos():
+    global _cola_pedidos
+    with _lock_cola_pedidos:
+        if _cola_pedidos is None:
+            _cola_pedidos = cola_pedidos.ColaPedidos()
+        return _cola_pedidos
 
 
 def crear_pedido_db(usuario_id: int, tipo_entrega: str, carrito: Carrito):
+    """
+    Crea el pedido descontando el stock de forma atómica en la BD.
+    Regresa (pedido_id, faltantes): si algún producto no tiene stock suficiente
+    el pedido no se crea y faltantes trae las líneas afectadas
+    (producto_id, solicitado, disponible).
+    """
     items = [(pid, qty) for pid, qty in carrito.items.items()]
-    pid = db.crear_pedido(usuario_id, tipo_entrega, items)
-    return pid
+    if AGRUPAR_PEDIDOS:
+        return _obtener_cola_pedidos().crear_pedido_estricto(usuario_id, tipo_entrega, items)
+    return db.crear_pedido_estricto(usuario_id, tipo_entrega, items)
 
 
 def listar_historial_por_usuario(usuario_id: int):
@@ -37,5 +241,40 @@ def listar_historial_por_usuario(usuario_id: int):
     return db.listar_pedidos_por_usuario(usuario_id)
 
 
+def listar_historial_pagina(usuario_id: int, antes_de=None, limite: int = 50):
+    """
+    Una página del historial (más recientes primero). Para la siguiente,
+    pasa antes_de=(created_at, id) del último pedido recibido.
+    """
+    return db.listar_pedidos_por_usuario_pagina(usuario_id, antes_de, limite)
+
+
+def importar_catalogo(ruta: str, al_progresar=None) -> dict:
+    """
+    Importación masiva (ver importador.py). El inventario en memoria se
+    reconstruye una sola vez al final, no por cada producto importado.
+    """
+    resumen = importador.importar_catalogo(ruta, al_progresar=al_progresar)
+    if resumen["importadas"]:
+        cargar_inventario_desde_db(forzar=True)
+    return resumen
+
+
+def resumen_cliente(usuario_id: int) -> dict:
+    """
+    Pedidos y total gastado de un cliente (una sola fila de resumen_usuario).
+    Si aún no ha comprado regresa ceros.
+    """
+    resumen = db.get_resumen_usuario(usuario_id)
+    if resumen is None:
+        return {"usuario_id": usuario_id, "pedidos": 0, "total_gastado": 0, "ultimo_pedido": None}
+    return resumen
+
+
 def actualizar_producto_db(pid: int, nombre: str, precio: float, cantidad: int) -> bool:
     return db.update_producto(pid, nombre, precio, cantidad)
+
+
+def estadisticas_conexiones() -> dict:
+    """Estado del pool compartido (conexiones abiertas, en uso, pings, etc.)."""
+    return connection_manager.estadisticas()
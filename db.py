@@ -1,419 +1,1109 @@
 # db.py parte 2
 import os
-from dotenv import load_dotenv
-import mysql.connector
-from mysql.connector import Error, pooling
+import random
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache, wraps
 
-load_dotenv()
-
-# Config de conexión a MySQL
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": int(os.getenv("DB_PORT", 3306)),
-    "database": os.getenv("DB_NAME", "proyecto2"),
-    "user": os.getenv("DB_USER", "root"),
-    "password": os.getenv("DB_PASSWORD", "MC_Pedro1171"),
-    "autocommit": False,
-    "charset": "utf8mb4",
-}
-
-POOL_NAME = os.getenv("POOL_NAME", "proyecto2_pool")
-POOL_SIZE = int(os.getenv("POOL_SIZE", 5))
-
-try:
-    pool = pooling.MySQLConnectionPool(
-        pool_name=POOL_NAME,
-        pool_size=POOL_SIZE,
-        **DB_CONFIG
-    )
-    print(f"Pool de conexiones '{POOL_NAME}' creado exitosamente.")
-except Error as e:
-    print(f"Error al crear el pool de conexiones: {e}")
-    pool = None
+import connection_manager
+import metricas
+from models import a_decimal
+# La config vive en connection_manager (que ya carga el .env); se re-exporta aquí
+from connection_manager import DB_CONFIG, POOL_NAME, POOL_SIZE
+
+# Reintentos de crear_pedido ante contención entre cajas
+# 1213 = deadlock, 1205 = lock wait timeout
+ERRORES_REINTENTABLES = (1213, 1205)
+REINTENTOS_PEDIDO = int(os.getenv("REINTENTOS_PEDIDO", 3))
+ESPERA_BASE_REINTENTO = float(os.getenv("ESPERA_BASE_REINTENTO", 0.05))
+
+# Una venta marca su stock con la hora del servidor al ejecutar el UPDATE,
+# pero se ve hasta su commit; listar_stock_cambiado vuelve a leer este margen
+# hacia atrás para no perder ventas que confirmen tarde. Debe cubrir la
+# transacción de pedido más larga (incluida la espera por candados).
+MARGEN_STOCK_MS = float(os.getenv("MARGEN_STOCK_MS", 60000))
+
+# Backend elegido con DB_BACKEND (mysql o sqlite), ver db_backends.py.
+# Las conexiones salen del administrador único de connection_manager.py.
+backend = connection_manager.manager.backend
+Error = backend.Error
 
 
 def get_conn():
-    if pool is None:
-        print("Error: pool no inicializado.")
-        return None
+    return connection_manager.get_conn()
+
+
+# ========== UNIDAD DE TRABAJO ==========
+
+class UnidadDeTrabajo:
+    """
+    Una conexión y una transacción. Se obtiene con `with transaccion() as tx:`
+    y se puede pasar como tx=... a las funciones de este módulo para que varias
+    operaciones compartan la misma transacción.
+
+    ejecutar/uno/todos usan sentencias preparadas que se guardan por conexión,
+    así una consulta frecuente solo se analiza la primera vez que esa conexión
+    la ve. replica=True si la conexión es de la réplica de lectura;
+    escribio=True en cuanto se manda algo que no sea un SELECT.
+    """
+
+    def __init__(self, conn, replica=False):
+        self.conn = conn
+        self.replica = replica
+        self.escribio = False
+        self._cursores = []
+
+    def cursor(self, dictionary=False):
+        """Cursor normal (sin preparar), para DDL o SQL que se usa una sola vez."""
+        self.escribio = True  # no se sabe qué se va a mandar por él
+        cur = self.conn.cursor(dictionary=dictionary)
+        self._cursores.append(cur)
+        return cur
+
+    def ejecutar(self, sql, params=(), dictionary=False):
+        """Ejecuta una sentencia preparada y regresa su cursor (rowcount, lastrowid...)."""
+        return self._correr(sql, params, dictionary, leer=False)
+
+    def uno(self, sql, params=()):
+        rows = self._correr(sql, params, True, leer=True)
+        return rows[0] if rows else None
+
+    def todos(self, sql, params=()):
+        return self._correr(sql, params, True, leer=True)
+
+    def _correr(self, sql, params, dictionary, leer):
+        if not self.escribio and not _solo_lee(sql):
+            self.escribio = True
+        cur, sql = backend.sentencia_preparada(self.conn, sql, dictionary)
+        # El tiempo de una consulta incluye leer sus filas
+        with metricas.medir_sql(sql, params):
+            cur.execute(sql, tuple(params))
+            return cur.fetchall() if leer else cur
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def _cerrar(self):
+        for cur in self._cursores:
+            try:
+                cur.close()
+            except Error:
+                pass
+        self._cursores = []
+
+
+@lru_cache(maxsize=512)
+def _solo_lee(sql):
+    return sql.lstrip()[:7].upper().startswith(("SELECT", "SHOW", "EXPLAIN"))
+
+
+@contextmanager
+def transaccion(lectura=False):
+    """
+    with transaccion() as tx:
+        pid = create_producto("Combo", 99.0, 10, tx=tx)
+        update_producto_stock(otro_id, 0, tx=tx)
+
+    Hace commit al salir del bloque, o rollback si hubo excepción.
+    Lanza Error si no se pudo obtener conexión.
+
+    lectura=True es para bloques que solo leen: pueden ir a la réplica de
+    lectura si hay una (ver connection_manager.EnrutadorLecturas).
+    """
+    with metricas.medir("conexion.espera"):
+        if lectura:
+            conn, replica = connection_manager.get_conn_lectura()
+        else:
+            conn, replica = get_conn(), False
+    if not conn:
+        metricas.contar("conexion.fallida")
+        raise Error("No se pudo obtener conexión.")
+    tx = UnidadDeTrabajo(conn, replica)
     try:
-        return pool.get_connection()
-    except Error as e:
-        print("Error al obtener conexión:", e)
-        return None
+        yield tx
+        with metricas.medir("commit"):
+            conn.commit()
+        if tx.escribio:
+            # las siguientes lecturas de esta sesión deben ver lo escrito
+            connection_manager.marcar_escritura()
+    except BaseException as e:
+        conn.rollback()
+        if replica and isinstance(e, Error):
+            connection_manager.lecturas.fallo_replica(e)
+        raise
+    finally:
+        tx._cerrar()
+        conn.close()
+
+
+def _operacion(mensaje_error, si_falla=None, lectura=False):
+    """
+    Decorador para las funciones de acceso a datos. La función recibe siempre
+    un tx: el que le pasen o uno nuevo solo para ella. Con tx propio los
+    errores se imprimen y se regresa si_falla (como siempre ha hecho este
+    módulo); con tx ajeno se propagan para que el dueño haga rollback.
+
+    Con lectura=True el tx propio puede ser de la réplica de lectura; si la
+    réplica falla, la misma lectura se repite en la primaria.
+    """
+    def decorador(funcion):
+        nombre = "db." + funcion.__name__
+
+        @metricas.medido(nombre)
+        @wraps(funcion)
+        def envoltura(*args, tx=None, **kwargs):
+            if tx is not None:
+                return funcion(*args, tx=tx, **kwargs)
+            try:
+                if lectura:
+                    resultado = _leer(funcion, args, kwargs)
+                    if resultado is not _EN_PRIMARIA:
+                        return resultado
+                with transaccion() as nuevo:
+                    return funcion(*args, tx=nuevo, **kwargs)
+            except Error as e:
+                metricas.contar(f"{nombre}.error")
+                print(f"{mensaje_error}:", e)
+                return si_falla() if callable(si_falla) else si_falla
+        return envoltura
+    return decorador
+
+
+_EN_PRIMARIA = object()
+
+
+def _leer(funcion, args, kwargs):
+    """
+    Corre una lectura donde diga el enrutador. Si corrió en la réplica y
+    falló (transaccion ya apartó la réplica), regresa _EN_PRIMARIA para
+    repetirla allá.
+    """
+    tx = None
+    try:
+        with transaccion(lectura=True) as tx:
+            return funcion(*args, tx=tx, **kwargs)
+    except Error:
+        if tx is None or not tx.replica:
+            raise
+        return _EN_PRIMARIA
 
 
 # ========== INIT DB ==========
+
+# Índices secundarios (tabla, nombre, columnas); init_db crea los que falten.
+# test_app.TestPlanesConsulta revisa con EXPLAIN que las consultas los usen.
+INDICES = [
+    # listar_productos_cambiados: WHERE version > ? ORDER BY version
+    ("productos", "idx_productos_version", "version"),
+    # listar_stock_cambiado: WHERE stock_marca > ?
+    ("productos", "idx_productos_stock_marca", "stock_marca"),
+    # historial: WHERE usuario_id = ? ORDER BY created_at DESC, id DESC
+    ("pedidos", "idx_pedidos_usuario_fecha", "usuario_id, created_at, id"),
+    # detalle de un pedido: WHERE pedido_id = ?
+    ("detalle_pedido", "idx_detalle_pedido_pedido", "pedido_id"),
+    # reportes por rango de fechas (iterar_ventas)
+    ("pedidos", "idx_pedidos_fecha", "created_at, id"),
+]
+
+
 def init_db():
     """
     Crea las tablas si no existen.
     Asegúrate de que la estructura coincida con tu diseño.
     """
-    conn = get_conn()
-    if not conn:
-        print("No se pudo obtener conexión para init_db")
-        return
-
     try:
-        cur = conn.cursor()
-
-        # Tabla usuarios (correo único + rol)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nombre VARCHAR(100) NOT NULL,
-                correo VARCHAR(150) NOT NULL UNIQUE,
-                rol VARCHAR(20) NOT NULL DEFAULT 'cliente',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Tabla productos
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS productos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nombre VARCHAR(100) NOT NULL,
-                precio DECIMAL(10,2) NOT NULL,
-                cantidad INT NOT NULL DEFAULT 0
-            )
-        """)
-
-        # Tabla pedidos
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                usuario_id INT NOT NULL,
-                tipo_entrega VARCHAR(20) NOT NULL,
-                total DECIMAL(10,2) NOT NULL DEFAULT 0,
-                estado VARCHAR(20) NOT NULL DEFAULT 'creado',
-                created_at DATETIME NOT NULL,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-            )
-        """)
-
-        # Tabla detalle_pedido
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS detalle_pedido (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                pedido_id INT NOT NULL,
-                producto_id INT NOT NULL,
-                cantidad INT NOT NULL,
-                precio_unitario DECIMAL(10,2) NOT NULL,
-                FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
-                FOREIGN KEY (producto_id) REFERENCES productos(id)
-            )
-        """)
-
-        # Crear admin por defecto si no existe
-        cur.execute("SELECT COUNT(*) FROM usuarios WHERE rol = 'admin'")
-        (count_admin,) = cur.fetchone()
-        if count_admin == 0:
-            cur.execute(
-                "INSERT INTO usuarios (nombre, correo, rol) VALUES (%s, %s, %s)",
-                ("Administrador", "admin@mcd.com", "admin")
-            )
-            print("Usuario administrador creado: admin@mcd.com")
-
-        conn.commit()
+        with transaccion() as tx:
+            cur = tx.cursor()
+
+            # Tabla usuarios (correo único + rol)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS usuarios (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    nombre VARCHAR(100) NOT NULL,
+                    correo VARCHAR(150) NOT NULL UNIQUE,
+                    rol VARCHAR(20) NOT NULL DEFAULT 'cliente',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Tabla productos
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS productos (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    nombre VARCHAR(100) NOT NULL,
+                    precio DECIMAL(10,2) NOT NULL,
+                    cantidad INT NOT NULL DEFAULT 0,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    stock_marca BIGINT NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Tabla pedidos
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS pedidos (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    usuario_id INT NOT NULL,
+                    tipo_entrega VARCHAR(20) NOT NULL,
+                    total DECIMAL(10,2) NOT NULL DEFAULT 0,
+                    estado VARCHAR(20) NOT NULL DEFAULT 'creado',
+                    created_at DATETIME NOT NULL,
+                    FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+                )
+            """)
+
+            # Tabla detalle_pedido
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS detalle_pedido (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    pedido_id INT NOT NULL,
+                    producto_id INT NOT NULL,
+                    cantidad INT NOT NULL,
+                    precio_unitario DECIMAL(10,2) NOT NULL,
+                    FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
+                    FOREIGN KEY (producto_id) REFERENCES productos(id)
+                )
+            """)
+
+            # Versión del catálogo: las ediciones de productos (crear, editar,
+            # importar, ajustar stock a mano) la incrementan al inicio de su
+            # transacción y marcan las filas que tocan con el nuevo valor. Sirve
+            # para pedir solo los productos editados (listar_productos_cambiados).
+            # Las ventas no la tocan: marcan stock_marca con la hora del servidor
+            # (listar_stock_cambiado), así no pasan todas por esta fila.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS catalogo_version (
+                    id INT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                )
+            """)
+            cur.execute("SELECT COUNT(*) FROM catalogo_version")
+            (count_version,) = cur.fetchone()
+            if count_version == 0:
+                cur.execute("INSERT INTO catalogo_version (id, version) VALUES (1, 0)")
+
+            # Resúmenes que crear_pedido mantiene en su misma transacción
+            # (ver _actualizar_resumenes y reconstruir_resumenes)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS resumen_usuario (
+                    usuario_id INT PRIMARY KEY,
+                    pedidos INT NOT NULL DEFAULT 0,
+                    total_gastado DECIMAL(12,2) NOT NULL DEFAULT 0,
+                    ultimo_pedido DATETIME NULL,
+                    FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS resumen_producto_dia (
+                    dia DATE NOT NULL,
+                    producto_id INT NOT NULL,
+                    unidades INT NOT NULL DEFAULT 0,
+                    ingresos DECIMAL(12,2) NOT NULL DEFAULT 0,
+                    PRIMARY KEY (dia, producto_id),
+                    FOREIGN KEY (producto_id) REFERENCES productos(id)
+                )
+            """)
+
+            # BDs creadas con un esquema anterior (p. ej. data/sample_db.sqlite3)
+            columnas = backend.columnas(cur, "usuarios")
+            if "rol" not in columnas:
+                cur.execute("ALTER TABLE usuarios ADD COLUMN rol VARCHAR(20) NOT NULL DEFAULT 'cliente'")
+            if "created_at" not in columnas:
+                cur.execute("ALTER TABLE usuarios ADD COLUMN created_at TIMESTAMP NULL")
+            columnas = backend.columnas(cur, "productos")
+            if "version" not in columnas:
+                cur.execute("ALTER TABLE productos ADD COLUMN version BIGINT NOT NULL DEFAULT 0")
+            if "stock_marca" not in columnas:
+                cur.execute("ALTER TABLE productos ADD COLUMN stock_marca BIGINT NOT NULL DEFAULT 0")
+            for tabla, nombre, columnas_indice in INDICES:
+                if nombre not in backend.indices(cur, tabla):
+                    cur.execute(f"CREATE INDEX {nombre} ON {tabla} ({columnas_indice})")
+
+            # BD con pedidos anteriores a los resúmenes: se llenan una vez
+            cur.execute("SELECT 1 FROM resumen_usuario LIMIT 1")
+            sin_resumen = not cur.fetchall()
+            cur.execute("SELECT 1 FROM pedidos LIMIT 1")
+            if sin_resumen and cur.fetchall():
+                reconstruir_resumenes(tx=tx)
+                print("Resúmenes de pedidos reconstruidos.")
+
+            # Crear admin por defecto si no existe
+            cur.execute("SELECT COUNT(*) FROM usuarios WHERE rol = 'admin'")
+            (count_admin,) = cur.fetchone()
+            if count_admin == 0:
+                cur.execute(
+                    "INSERT INTO usuarios (nombre, correo, rol) VALUES (%s, %s, %s)",
+                    ("Administrador", "admin@mcd.com", "admin")
+                )
+                print("Usuario administrador creado: admin@mcd.com")
+
         print("Tablas verificadas/creadas correctamente.")
 
     except Error as e:
         print("Error en init_db:", e)
-        conn.rollback()
-
-    finally:
-        cur.close()
-        conn.close()
 
 
 # ========== CRUD USUARIOS ==========
 
-def get_usuario(uid):
-    conn = get_conn()
-    if not conn:
-        return None
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM usuarios WHERE id = %s", (uid,))
-        row = cur.fetchone()
-        return row
-    except Error as e:
-        print("Error al obtener usuario:", e)
-        return None
-    finally:
-        cur.close()
-        conn.close()
+@_operacion("Error al obtener usuario")
+def get_usuario(uid, tx=None):
+    return tx.uno("SELECT * FROM usuarios WHERE id = %s", (uid,))
 
 
-def get_usuario_por_correo(correo):
-    conn = get_conn()
-    if not conn:
-        return None
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM usuarios WHERE correo = %s", (correo,))
-        row = cur.fetchone()
-        return row
-    except Error as e:
-        print("Error al obtener usuario por correo:", e)
-        return None
-    finally:
-        cur.close()
-        conn.close()
+@_operacion("Error al obtener usuario por correo")
+def get_usuario_por_correo(correo, tx=None):
+    return tx.uno("SELECT * FROM usuarios WHERE correo = %s", (correo,))
 
 
-def create_usuario(nombre, correo, rol="cliente"):
+@_operacion("Error al crear usuario")
+def create_usuario(nombre, correo, rol="cliente", tx=None):
     """
     Crea un usuario nuevo si el correo no existe.
     Si el correo ya existe, regresa el id del usuario existente.
     """
-    conn = get_conn()
-    if not conn:
-        return None
-
-    try:
-        cur = conn.cursor()
-        sql = "INSERT INTO usuarios (nombre, correo, rol) VALUES (%s, %s, %s)"
-        cur.execute(sql, (nombre, correo, rol))
-        conn.commit()
-        return cur.lastrowid
+    row = upsert_usuario(nombre, correo, rol, tx=tx)
+    return row["id"] if row else None
 
-    except Error as e:
-        print("Error al crear usuario:", e)
-        # 1062 = Duplicate entry
-        if e.errno == 1062:
-            # ya existe ese correo, regresamos su id
-            try:
-                cur2 = conn.cursor(dictionary=True)
-                cur2.execute("SELECT id FROM usuarios WHERE correo = %s", (correo,))
-                row = cur2.fetchone()
-                if row:
-                    return row["id"]
-            except Error as e2:
-                print("Error al obtener usuario existente:", e2)
-                return None
-        return None
 
-    finally:
-        cur.close()
-        conn.close()
+@_operacion("Error al registrar usuario")
+def upsert_usuario(nombre, correo, rol="cliente", tx=None):
+    """
+    Como create_usuario, pero regresa la fila {id, nombre, correo, rol}: la
+    nueva o la que ya existía con ese correo (sin modificarla). Es una sola
+    sentencia (en MySQL, dos si el correo ya existía).
+    """
+    return backend.insertar_o_obtener(
+        tx, "usuarios", ("nombre", "correo", "rol"), (nombre, correo, rol), "correo"
+    )
 
 
 # ========== CRUD PRODUCTOS ==========
 
-def create_producto(nombre, precio, cantidad):
-    conn = get_conn()
-    if not conn:
-        return None
+@_operacion("Error al crear producto")
+def create_producto(nombre, precio, cantidad, tx=None):
+    version = _marcar_catalogo_modificado(tx)
+    cur = tx.ejecutar(
+        "INSERT INTO productos (nombre, precio, cantidad, version) VALUES (%s, %s, %s, %s)",
+        (nombre, precio, cantidad, version)
+    )
+    return cur.lastrowid
 
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO productos (nombre, precio, cantidad) VALUES (%s, %s, %s)",
-            (nombre, precio, cantidad)
-        )
-        conn.commit()
-        pid = cur.lastrowid
-        return pid
-    except Error as e:
-        print("Error al crear producto:", e)
-        return None
-    finally:
-        cur.close()
-        conn.close()
 
+@_operacion("Error al importar productos", si_falla=0)
+def upsert_productos(filas, tx=None):
+    """
+    Inserta o actualiza varios productos con una sola sentencia.
+    filas: [(id o None, nombre, precio, cantidad), ...]. Con id se actualiza
+    ese producto si ya existe (o se crea con ese id); sin id se crea uno nuevo.
+    Si un id se repite solo se envía su última fila (una sentencia no toca la
+    misma fila dos veces, en ningún motor). Regresa cuántas filas se enviaron.
+    """
+    ultima = {fila[0]: i for i, fila in enumerate(filas) if fila[0] is not None}
+    filas = [fila for i, fila in enumerate(filas) if fila[0] is None or ultima[fila[0]] == i]
+    if not filas:
+        return 0
+    version = _marcar_catalogo_modificado(tx)
+    params = []
+    for pid, nombre, precio, cantidad in filas:
+        params += [pid, nombre, precio, cantidad, version]
+    tx.ejecutar(
+        backend.sql_upsert("productos", ("id", "nombre", "precio", "cantidad", "version"), len(filas)),
+        params
+    )
+    return len(filas)
 
-def listar_productos():
-    conn = get_conn()
-    if not conn:
-        return []
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM productos")
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print("Error al listar productos:", e)
-        return []
-    finally:
-        cur.close()
-        conn.close()
 
+@_operacion("Error al listar productos", si_falla=list, lectura=True)
+def listar_productos(tx=None):
+    return tx.todos("SELECT * FROM productos")
 
-def get_producto(pid):
-    conn = get_conn()
-    if not conn:
-        return None
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM productos WHERE id = %s", (pid,))
-        row = cur.fetchone()
-        return row
-    except Error as e:
-        print("Error al obtener producto:", e)
-        return None
-    finally:
-        cur.close()
-        conn.close()
 
+@_operacion("Error al listar productos", si_falla=list, lectura=True)
+def listar_productos_pagina(despues_de_id=0, limite=500, tx=None):
+    """
+    Una página del catálogo por id (paginación por llave, no por OFFSET):
+    para la siguiente página pasa el id del último producto recibido.
+    """
+    return tx.todos(
+        "SELECT * FROM productos WHERE id > %s ORDER BY id LIMIT %s",
+        (despues_de_id, limite)
+    )
 
-def update_producto(pid, nombre, precio, cantidad):
-    conn = get_conn()
-    if not conn:
-        return False
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE productos SET nombre=%s, precio=%s, cantidad=%s WHERE id=%s",
-            (nombre, precio, cantidad, pid)
-        )
-        conn.commit()
-        return cur.rowcount > 0
-    except Error as e:
-        print("Error al actualizar producto:", e)
-        return False
-    finally:
-        cur.close()
-        conn.close()
 
+def iterar_productos(tam_pagina=500):
+    """
+    Recorre todo el catálogo de página en página, sin cargarlo completo en
+    memoria. Cada página es una consulta corta: no se retiene la conexión
+    entre páginas. A diferencia de las demás funciones, si falla una página
+    se lanza Error (para no confundir un recorrido cortado con uno completo).
+
+    Siempre lee de la primaria: controller etiqueta el resultado con la
+    versión del catálogo de la primaria y una réplica atrasada lo dejaría
+    con cambios perdidos.
+    """
+    ultimo_id = 0
+    while True:
+        with transaccion() as tx:
+            pagina = listar_productos_pagina(ultimo_id, tam_pagina, tx=tx)
+        yield from pagina
+        if len(pagina) < tam_pagina:
+            return
+        ultimo_id = pagina[-1]["id"]
 
-def update_producto_stock(pid, nueva_cantidad):
-    conn = get_conn()
-    if not conn:
-        return False
-    try:
-        cur = conn.cursor()
-        cur.execute("UPDATE productos SET cantidad = %s WHERE id = %s",
-                    (nueva_cantidad, pid))
-        conn.commit()
-        changed = cur.rowcount > 0
-        return changed
-    except Error as e:
-        print("Error al actualizar stock:", e)
-        return False
-    finally:
-        cur.close()
-        conn.close()
 
+@_operacion("Error al obtener versión del catálogo")
+def get_version_catalogo(tx=None):
+    """Número que cambia cada vez que se crea o edita algún producto (no con las ventas)."""
+    row = tx.uno("SELECT version FROM catalogo_version WHERE id = 1")
+    return int(row["version"]) if row else None
 
-# ========== CRUD PEDIDOS / HISTORIAL ==========
 
-def crear_pedido(usuario_id, tipo_entrega, items):
+@_operacion("Error al obtener versión del catálogo")
+def get_marcas_catalogo(tx=None):
     """
-    items es una lista de tuplas: (producto_id, cantidad)
+    (versión del catálogo, marca de stock actual) en una sola consulta: las
+    dos marcas desde las que se pide la siguiente sincronización.
     """
-    conn = get_conn()
-    if not conn:
-        return None
+    row = tx.uno(f"SELECT version, {backend.sql_marca_ahora} AS marca FROM catalogo_version WHERE id = 1")
+    return (int(row["version"]), int(row["marca"])) if row else None
 
-    try:
-        cur = conn.cursor()
 
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+@_operacion("Error al listar productos cambiados")
+def listar_productos_cambiados(desde_version, tx=None):
+    """
+    Productos creados o modificados después de desde_version (usa el índice
+    de productos.version). Lee antes la versión con get_version_catalogo
+    para usarla como la siguiente marca. Regresa None si hubo error, para no
+    confundirlo con "no hubo cambios".
+    """
+    return tx.todos(
+        "SELECT * FROM productos WHERE version > %s ORDER BY version",
+        (desde_version,)
+    )
 
-        # Crear pedido
-        cur.execute(
-            "INSERT INTO pedidos (usuario_id, tipo_entrega, total, estado, created_at) "
-            "VALUES (%s, %s, %s, %s, %s)",
-            (usuario_id, tipo_entrega, 0, 'creado', now)
-        )
-        pid = cur.lastrowid
 
-        total = 0
+@_operacion("Error al listar stock cambiado")
+def listar_stock_cambiado(desde_marca, tx=None):
+    """
+    Productos cuyo stock cambió por ventas desde desde_marca (de
+    get_marcas_catalogo), más los de los últimos MARGEN_STOCK_MS antes de
+    ella: las marcas no se confirman en orden, y un producto repetido se
+    vuelve a aplicar sin problema. Regresa None si hubo error.
+    """
+    return tx.todos(
+        "SELECT * FROM productos WHERE stock_marca > %s",
+        (desde_marca - int(MARGEN_STOCK_MS * 1000),)
+    )
+
+
+def _marcar_catalogo_modificado(tx):
+    """
+    Incrementa la versión del catálogo y regresa el nuevo valor, para marcar
+    con él las filas de productos que se editen en esta transacción. Solo
+    para ediciones (pocas): el candado sobre catalogo_version ordena a esos
+    escritores, así las versiones se confirman en orden. Las ventas no lo
+    usan, ver listar_stock_cambiado.
+    """
+    return backend.incrementar_version_catalogo(tx)
 
-        for producto_id, cantidad in items:
-            prod = get_producto(producto_id)
-            if not prod:
-                continue
 
-            precio_unit = float(prod["precio"])
+@_operacion("Error al obtener producto", lectura=True)
+def get_producto(pid, tx=None):
+    return tx.uno("SELECT * FROM productos WHERE id = %s", (pid,))
 
-            # detalle
-            cur.execute(
-                "INSERT INTO detalle_pedido (pedido_id, producto_id, cantidad, precio_unitario) "
-                "VALUES (%s, %s, %s, %s)",
-                (pid, producto_id, cantidad, precio_unit)
-            )
 
-            total += precio_unit * cantidad
+@_operacion("Error al actualizar producto", si_falla=False)
+def update_producto(pid, nombre, precio, cantidad, tx=None):
+    version = _marcar_catalogo_modificado(tx)
+    cur = tx.ejecutar(
+        "UPDATE productos SET nombre=%s, precio=%s, cantidad=%s, version=%s WHERE id=%s",
+        (nombre, precio, cantidad, version, pid)
+    )
+    return cur.rowcount > 0
 
-            # actualizar stock
-            new_stock = int(prod["cantidad"]) - cantidad
-            if new_stock < 0:
-                new_stock = 0
 
-            cur.execute(
-                "UPDATE productos SET cantidad = %s WHERE id = %s",
-                (new_stock, producto_id)
-            )
+@_operacion("Error al actualizar stock", si_falla=False)
+def update_producto_stock(pid, nueva_cantidad, tx=None):
+    version = _marcar_catalogo_modificado(tx)
+    cur = tx.ejecutar(
+        "UPDATE productos SET cantidad = %s, version = %s WHERE id = %s",
+        (nueva_cantidad, version, pid)
+    )
+    return cur.rowcount > 0
 
-        # guardar total
-        cur.execute("UPDATE pedidos SET total = %s WHERE id = %s", (total, pid))
 
-        conn.commit()
-        return pid
+# ========== CRUD PEDIDOS / HISTORIAL ==========
 
-    except Error as e:
-        print("Error al crear pedido:", e)
-        conn.rollback()
-        return None
+@metricas.medido("db.crear_pedido")
+def crear_pedido(usuario_id, tipo_entrega, items, tx=None):
+    """
+    items es una lista de tuplas: (producto_id, cantidad)
 
-    finally:
-        cur.close()
-        conn.close()
+    Todo el pedido se resuelve en la misma conexión y con un número fijo de
+    consultas, sin importar cuántas líneas tenga:
+      1. SELECT ... FOR UPDATE de todos los productos del pedido
+      2. INSERT del pedido (ya con su total)
+      3. INSERT multi-fila en detalle_pedido
+      4. UPDATE único del stock de todos los productos
+    Los productos que no existen se ignoran y el stock se deja en 0 si no
+    alcanza, igual que antes. Para rechazar el pedido cuando falta stock
+    usa crear_pedido_estricto.
+    """
+    pid, _ = _crear_pedido(usuario_id, tipo_entrega, items, estricto=False, tx=tx)
+    return pid
 
 
-def get_pedido(pid):
-    conn = get_conn()
-    if not conn:
-        return None
+@metricas.medido("db.crear_pedido_estricto")
+def crear_pedido_estricto(usuario_id, tipo_entrega, items, tx=None):
+    """
+    Igual que crear_pedido, pero el stock se descuenta de forma atómica y
+    condicional dentro de la BD (cantidad >= lo pedido). Si alguna línea no
+    tiene stock suficiente (o el producto no existe) no se crea nada.
 
-    try:
-        cur = conn.cursor(dictionary=True)
+    Regresa (pedido_id, faltantes). faltantes es una lista de dicts con
+    producto_id, solicitado y disponible; si no está vacía, pedido_id es None.
+    """
+    return _crear_pedido(usuario_id, tipo_entrega, items, estricto=True, tx=tx)
+
+
+def _crear_pedido(usuario_id, tipo_entrega, items, estricto, tx=None):
+    items = [(int(producto_id), int(cantidad)) for producto_id, cantidad in items]
+    if estricto:
+        items = [(producto_id, cantidad) for producto_id, cantidad in items if cantidad > 0]
+
+    if tx is not None:
+        # Transacción del que llama: sin reintentos, los errores se propagan
+        if estricto:
+            return _insertar_pedido_estricto(tx, usuario_id, tipo_entrega, items, propia=False)
+        return _insertar_pedido(tx, usuario_id, tipo_entrega, items)
+
+    for intento in range(REINTENTOS_PEDIDO + 1):
+        try:
+            with transaccion() as nuevo:
+                if estricto:
+                    return _insertar_pedido_estricto(nuevo, usuario_id, tipo_entrega, items, propia=True)
+                return _insertar_pedido(nuevo, usuario_id, tipo_entrega, items)
+        except Error as e:
+            if e.errno not in ERRORES_REINTENTABLES or intento == REINTENTOS_PEDIDO:
+                metricas.contar("db.crear_pedido.error")
+                print("Error al crear pedido:", e)
+                return None, []
+            metricas.contar("db.crear_pedido.reintento")
+            # deadlock o lock wait timeout: esperar un poco y volver a intentar
+            espera = ESPERA_BASE_REINTENTO * (2 ** intento)
+            time.sleep(espera + random.uniform(0, espera))
+
+
+def _lineas_y_descuentos(items, productos):
+    lineas = [
+        (producto_id, cantidad, a_decimal(productos[producto_id]["precio"]))
+        for producto_id, cantidad in items
+        if producto_id in productos
+    ]
+    descuentos = {}
+    for producto_id, cantidad, _ in lineas:
+        descuentos[producto_id] = descuentos.get(producto_id, 0) + cantidad
+    return lineas, descuentos
+
+
+def _insertar_pedido(tx, usuario_id, tipo_entrega, items):
+    # Bloquear y leer todos los productos en una sola consulta.
+    # Se ordenan por id para que dos cajas bloqueen siempre en el mismo orden.
+    ids = sorted({producto_id for producto_id, _ in items})
+    productos = {}
+    if ids:
+        marcas = ", ".join(["%s"] * len(ids))
+        rows = tx.todos(
+            f"SELECT id, precio, cantidad FROM productos WHERE id IN ({marcas}) "
+            "ORDER BY id FOR UPDATE",
+            ids
+        )
+        productos = {row["id"]: row for row in rows}
+
+    lineas, descuentos = _lineas_y_descuentos(items, productos)
+    pid = _insertar_encabezado_y_detalle(tx, usuario_id, tipo_entrega, lineas)
+
+    if descuentos:
+        # actualizar stock: un solo UPDATE con CASE para todos los productos
+        casos, params = _caso_por_id(descuentos)
+        marcas = ", ".join(["%s"] * len(descuentos))
+        tx.ejecutar(
+            f"UPDATE productos SET cantidad = GREATEST(cantidad - {casos}, 0), "
+            f"stock_marca = {backend.sql_marca_ahora} WHERE id IN ({marcas})",
+            params + list(descuentos)
+        )
+    return pid, []
+
+
+def _insertar_pedido_estricto(tx, usuario_id, tipo_entrega, items, propia):
+    solicitados = {}
+    for producto_id, cantidad in items:
+        solicitados[producto_id] = solicitados.get(producto_id, 0) + cantidad
+    if not solicitados:
+        return _insertar_encabezado_y_detalle(tx, usuario_id, tipo_entrega, []), []
+
+    if not propia:
+        # En una transacción ajena solo se deshace lo de este pedido
+        tx.cursor().execute("SAVEPOINT crear_pedido")
+
+    # Descuento condicional: solo se toca la fila si alcanza el stock.
+    # El UPDATE bloquea las filas, así que nadie más puede venderlas hasta el commit.
+    ids = sorted(solicitados)
+    casos, params = _caso_por_id({pid: solicitados[pid] for pid in ids})
+    marcas = ", ".join(["%s"] * len(ids))
+    cur = tx.ejecutar(
+        f"UPDATE productos SET cantidad = cantidad - {casos}, stock_marca = {backend.sql_marca_ahora} "
+        f"WHERE id IN ({marcas}) AND cantidad >= {casos}",
+        params + ids + params
+    )
+    descontados = cur.rowcount
+
+    if descontados != len(ids):
+        # Deshacer y reportar el stock real de cada línea que no alcanzó
+        if propia:
+            tx.rollback()
+        else:
+            tx.cursor().execute("ROLLBACK TO SAVEPOINT crear_pedido")
+        rows = tx.todos(f"SELECT id, cantidad FROM productos WHERE id IN ({marcas})", ids)
+        disponibles = {row["id"]: int(row["cantidad"]) for row in rows}
+        faltantes = [
+            {"producto_id": pid, "solicitado": solicitados[pid], "disponible": disponibles.get(pid, 0)}
+            for pid in ids
+            if disponibles.get(pid, 0) < solicitados[pid]
+        ]
+        return None, faltantes
+
+    # Las filas ya están bloqueadas por el UPDATE: el precio leído es consistente
+    rows = tx.todos(f"SELECT id, precio, cantidad FROM productos WHERE id IN ({marcas})", ids)
+    productos = {row["id"]: row for row in rows}
+    lineas, _ = _lineas_y_descuentos(items, productos)
+    pid = _insertar_encabezado_y_detalle(tx, usuario_id, tipo_entrega, lineas)
+    return pid, []
+
+
+def _caso_por_id(valores):
+    """Arma 'CASE id WHEN %s THEN %s ... END' y sus parámetros."""
+    casos = " ".join(["WHEN %s THEN %s"] * len(valores))
+    params = []
+    for producto_id, valor in valores.items():
+        params.extend((producto_id, valor))
+    return f"CASE id {casos} END", params
+
+
+def _insertar_encabezado_y_detalle(tx, usuario_id, tipo_entrega, lineas):
+    return _insertar_pedidos(tx, [(usuario_id, tipo_entrega, lineas)])[0]
+
+
+def _insertar_pedidos(tx, pedidos):
+    """
+    Inserta varios pedidos ya validados, [(usuario_id, tipo_entrega, lineas)],
+    y regresa sus ids en el mismo orden. Cada encabezado es un INSERT (cada
+    uno necesita su id); el detalle de todos va en un solo INSERT.
+    """
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ids, detalle, para_resumen = [], [], []
+    for usuario_id, tipo_entrega, lineas in pedidos:
+        # Decimal exacto: el mismo total que Carrito.total() con esos precios
+        total = sum((precio_unit * cantidad for _, cantidad, precio_unit in lineas), Decimal("0.00"))
+        cur = tx.ejecutar(
+            "INSERT INTO pedidos (usuario_id, tipo_entrega, total, estado, created_at) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (usuario_id, tipo_entrega, total, 'creado', now)
+        )
+        pid = cur.lastrowid
+        ids.append(pid)
+        for producto_id, cantidad, precio_unit in lineas:
+            detalle.extend((pid, producto_id, cantidad, precio_unit))
+        para_resumen.append((usuario_id, total, lineas))
+
+    if detalle:
+        # detalle: un solo INSERT con todas las filas
+        valores = ", ".join(["(%s, %s, %s, %s)"] * (len(detalle) // 4))
+        tx.ejecutar(
+            "INSERT INTO detalle_pedido (pedido_id, producto_id, cantidad, precio_unitario) "
+            f"VALUES {valores}",
+            detalle
+        )
+    _actualizar_resumenes(tx, now, para_resumen)
+    return ids
 
-        cur.execute("SELECT * FROM pedidos WHERE id = %s", (pid,))
-        pedido = cur.fetchone()
 
-        if not pedido:
-            return None
+def _actualizar_resumenes(tx, now, pedidos):
+    """
+    Suma los pedidos, [(usuario_id, total, lineas)], a resumen_usuario y
+    resumen_producto_dia (una fila por usuario y por producto, un INSERT por
+    tabla). Las filas por producto se tocan en orden de id, igual que
+    productos, y esos productos ya están bloqueados por estos pedidos: no se
+    agrega contención nueva.
+    """
+    por_usuario = {}
+    por_producto = {}
+    for usuario_id, total, lineas in pedidos:
+        n, gastado = por_usuario.get(usuario_id, (0, Decimal("0.00")))
+        por_usuario[usuario_id] = (n + 1, gastado + total)
+        for producto_id, cantidad, precio_unit in lineas:
+            unidades, ingresos = por_producto.get(producto_id, (0, Decimal("0.00")))
+            por_producto[producto_id] = (unidades + cantidad, ingresos + precio_unit * cantidad)
+
+    params = []
+    for usuario_id in sorted(por_usuario):
+        params.extend((usuario_id,) + por_usuario[usuario_id] + (now,))
+    tx.ejecutar(
+        backend.sql_upsert(
+            "resumen_usuario", ("usuario_id", "pedidos", "total_gastado", "ultimo_pedido"), len(por_usuario),
+            llave=("usuario_id",), sumar=("pedidos", "total_gastado"),
+        ),
+        params
+    )
+    if not por_producto:
+        return
+    dia = now[:10]
+    params = []
+    for producto_id in sorted(por_producto):
+        params.extend((dia, producto_id) + por_producto[producto_id])
+    tx.ejecutar(
+        backend.sql_upsert(
+            "resumen_producto_dia", ("dia", "producto_id", "unidades", "ingresos"), len(por_producto),
+            llave=("dia", "producto_id"), sumar=("unidades", "ingresos"),
+        ),
+        params
+    )
 
-        cur.execute("SELECT * FROM detalle_pedido WHERE pedido_id = %s", (pid,))
-        detalles = cur.fetchall()
 
-        pedido["detalles"] = detalles
-        return pedido
+@_operacion("Error al crear pedidos", si_falla=None)
+def crear_pedidos_estrictos(pedidos, tx=None):
+    """
+    Varios pedidos estrictos, [(usuario_id, tipo_entrega, items)], en una
+    sola transacción (un solo commit). Regresa una lista con un
+    (pedido_id, faltantes) por pedido, como crear_pedido_estricto; los
+    pedidos sin stock no afectan a los demás. Se atienden en orden: si dos
+    piden lo último de un producto, se lo lleva el primero.
+
+    Los productos de todos los pedidos se bloquean con un solo SELECT ...
+    FOR UPDATE y el stock se descuenta con un solo UPDATE; el detalle de
+    todos los pedidos va en un solo INSERT. Si algo falla en la BD regresa
+    None y no se crea ningún pedido (ver cola_pedidos.py).
+    """
+    normalizados = []
+    for usuario_id, tipo_entrega, items in pedidos:
+        items = [(int(producto_id), int(cantidad)) for producto_id, cantidad in items]
+        solicitados = {}
+        for producto_id, cantidad in items:
+            if cantidad > 0:
+                solicitados[producto_id] = solicitados.get(producto_id, 0) + cantidad
+        normalizados.append((usuario_id, tipo_entrega, [i for i in items if i[1] > 0], solicitados))
+
+    ids = sorted({producto_id for *_, solicitados in normalizados for producto_id in solicitados})
+    productos = {}
+    if ids:
+        marcas = ", ".join(["%s"] * len(ids))
+        rows = tx.todos(
+            f"SELECT id, precio, cantidad FROM productos WHERE id IN ({marcas}) "
+            "ORDER BY id FOR UPDATE",
+            ids
+        )
+        productos = {row["id"]: row for row in rows}
+
+    # Las filas están bloqueadas: el stock se reparte aquí, pedido por pedido
+    disponibles = {pid: int(row["cantidad"]) for pid, row in productos.items()}
+    resultados = [None] * len(normalizados)
+    aceptados, posiciones = [], []
+    for i, (usuario_id, tipo_entrega, items, solicitados) in enumerate(normalizados):
+        faltantes = [
+            {"producto_id": pid, "solicitado": solicitados[pid], "disponible": disponibles.get(pid, 0)}
+            for pid in sorted(solicitados)
+            if disponibles.get(pid, 0) < solicitados[pid]
+        ]
+        if faltantes:
+            resultados[i] = (None, faltantes)
+            continue
+        for pid, cantidad in solicitados.items():
+            disponibles[pid] -= cantidad
+        lineas, _ = _lineas_y_descuentos(items, productos)
+        aceptados.append((usuario_id, tipo_entrega, lineas))
+        posiciones.append(i)
+
+    if not aceptados:
+        return resultados
+    descuentos = {
+        pid: int(productos[pid]["cantidad"]) - disponibles[pid]
+        for pid in ids if pid in productos and disponibles[pid] != int(productos[pid]["cantidad"])
+    }
+    if descuentos:
+        casos, params = _caso_por_id(descuentos)
+        marcas = ", ".join(["%s"] * len(descuentos))
+        tx.ejecutar(
+            f"UPDATE productos SET cantidad = cantidad - {casos}, stock_marca = {backend.sql_marca_ahora} "
+            f"WHERE id IN ({marcas})",
+            params + list(descuentos)
+        )
+    for i, pid in zip(posiciones, _insertar_pedidos(tx, aceptados)):
+        resultados[i] = (pid, [])
+    return resultados
 
-    except Error as e:
-        print("Error al obtener pedido:", e)
-        return None
 
-    finally:
-        cur.close()
-        conn.close()
+@_operacion("Error al obtener pedido", lectura=True)
+def get_pedido(pid, tx=None):
+    """
+    Encabezado del pedido con sus líneas en "detalles"; cada línea trae
+    también el nombre del producto (producto_nombre). Una sola consulta.
+    """
+    return get_pedidos([pid], tx=tx).get(pid)
 
 
-def listar_pedidos_por_usuario(usuario_id):
+@_operacion("Error al obtener pedidos", si_falla=dict, lectura=True)
+def get_pedidos(pids, tx=None):
+    """
+    Versión por lotes de get_pedido: regresa {pedido_id: pedido} con los
+    pedidos que existan, todos en una sola consulta (JOIN con el detalle y
+    los productos). Sin ORDER BY: ordenar por columnas de dos tablas del JOIN
+    le cuesta a MySQL una tabla temporal y un filesort, así que las líneas se
+    ordenan aquí (son pocas por pedido).
+    """
+    pids = list(dict.fromkeys(pids))
+    if not pids:
+        return {}
+    marcas = ", ".join(["%s"] * len(pids))
+    rows = tx.todos(f"""
+        SELECT p.id, p.usuario_id, p.tipo_entrega, p.total, p.estado, p.created_at,
+               d.id AS detalle_id, d.producto_id, d.cantidad, d.precio_unitario,
+               pr.nombre AS producto_nombre
+        FROM pedidos p
+        LEFT JOIN detalle_pedido d ON d.pedido_id = p.id
+        LEFT JOIN productos pr ON pr.id = d.producto_id
+        WHERE p.id IN ({marcas})
+    """, pids)
+
+    pedidos = {}
+    for row in rows:
+        pedido = pedidos.get(row["id"])
+        if pedido is None:
+            pedido = pedidos[row["id"]] = {
+                "id": row["id"],
+                "usuario_id": row["usuario_id"],
+                "tipo_entrega": row["tipo_entrega"],
+                "total": row["total"],
+                "estado": row["estado"],
+                "created_at": row["created_at"],
+                "detalles": [],
+            }
+        if row["detalle_id"] is not None:
+            pedido["detalles"].append({
+                "id": row["detalle_id"],
+                "pedido_id": row["id"],
+                "producto_id": row["producto_id"],
+                "producto_nombre": row["producto_nombre"],
+                "cantidad": row["cantidad"],
+                "precio_unitario": row["precio_unitario"],
+            })
+    for pedido in pedidos.values():
+        pedido["detalles"].sort(key=lambda d: d["id"])
+    return {pid: pedidos[pid] for pid in pids if pid in pedidos}
+
+
+@_operacion("Error al listar pedidos por usuario", si_falla=list, lectura=True)
+def listar_pedidos_por_usuario(usuario_id, tx=None):
     """
     Regresa una lista de pedidos con datos básicos para un usuario dado.
     """
-    conn = get_conn()
-    if not conn:
-        return []
+    return tx.todos("""
+        SELECT id, tipo_entrega, total, estado, created_at
+        FROM pedidos
+        WHERE usuario_id = %s
+        ORDER BY created_at DESC
+    """, (usuario_id,))
 
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
+
+@_operacion("Error al listar pedidos por usuario", si_falla=list, lectura=True)
+def listar_pedidos_por_usuario_pagina(usuario_id, antes_de=None, limite=50, tx=None):
+    """
+    Una página del historial, del más reciente al más viejo. antes_de es la
+    llave (created_at, id) del último pedido de la página anterior; None para
+    la primera página.
+    """
+    if antes_de is None:
+        return tx.todos("""
             SELECT id, tipo_entrega, total, estado, created_at
             FROM pedidos
             WHERE usuario_id = %s
-            ORDER BY created_at DESC
-        """, (usuario_id,))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print("Error al listar pedidos por usuario:", e)
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """, (usuario_id, limite))
+    created_at, pedido_id = antes_de
+    return tx.todos("""
+        SELECT id, tipo_entrega, total, estado, created_at
+        FROM pedidos
+        WHERE usuario_id = %s
+          AND (created_at < %s OR (created_at = %s AND id < %s))
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, (usuario_id, created_at, created_at, pedido_id, limite))
+
+
+def iterar_pedidos_por_usuario(usuario_id, tam_pagina=100):
+    """
+    Recorre el historial completo de un usuario de página en página.
+    Igual que iterar_productos, lanza Error si falla una página.
+    """
+    antes_de = None
+    while True:
+        with transaccion(lectura=True) as tx:
+            pagina = listar_pedidos_por_usuario_pagina(usuario_id, antes_de, tam_pagina, tx=tx)
+        yield from pagina
+        if len(pagina) < tam_pagina:
+            return
+        antes_de = (pagina[-1]["created_at"], pagina[-1]["id"])
+
+
+# ========== VENTAS (para analitica.py) ==========
+
+@_operacion("Error al listar pedidos por fecha", si_falla=list, lectura=True)
+def listar_pedidos_rango_pagina(desde, hasta, despues_de=None, limite=1000, tx=None):
+    """
+    Pedidos con desde <= created_at < hasta, del más viejo al más nuevo.
+    despues_de es la llave (created_at, id) del último de la página anterior.
+    """
+    if despues_de is None:
+        return tx.todos("""
+            SELECT id, tipo_entrega, total, created_at
+            FROM pedidos
+            WHERE created_at >= %s AND created_at < %s
+            ORDER BY created_at, id
+            LIMIT %s
+        """, (desde, hasta, limite))
+    created_at, pedido_id = despues_de
+    return tx.todos("""
+        SELECT id, tipo_entrega, total, created_at
+        FROM pedidos
+        WHERE created_at >= %s AND created_at < %s
+          AND (created_at > %s OR (created_at = %s AND id > %s))
+        ORDER BY created_at, id
+        LIMIT %s
+    """, (desde, hasta, created_at, created_at, pedido_id, limite))
+
+
+@_operacion("Error al listar detalle de pedidos", si_falla=list, lectura=True)
+def listar_detalles_de_pedidos(pids, tx=None):
+    """Líneas (pedido_id, producto_id, cantidad, precio_unitario) de varios pedidos."""
+    if not pids:
         return []
-    finally:
-        cur.close()
-        conn.close()
+    marcas = ", ".join(["%s"] * len(pids))
+    return tx.todos(f"""
+        SELECT pedido_id, producto_id, cantidad, precio_unitario
+        FROM detalle_pedido
+        WHERE pedido_id IN ({marcas})
+    """, list(pids))
+
+
+def iterar_ventas(desde, hasta, tam_pagina=1000):
+    """
+    Recorre los pedidos del rango por páginas y regresa (pedidos, detalles)
+    de cada una. Cada página es una transacción corta de solo lectura, así
+    un reporte largo no detiene las ventas. Lanza Error si falla una página.
+    """
+    despues_de = None
+    while True:
+        with transaccion(lectura=True) as tx:
+            pedidos = listar_pedidos_rango_pagina(desde, hasta, despues_de, tam_pagina, tx=tx)
+            detalles = listar_detalles_de_pedidos([p["id"] for p in pedidos], tx=tx)
+        if pedidos:
+            yield pedidos, detalles
+        if len(pedidos) < tam_pagina:
+            return
+        despues_de = (pedidos[-1]["created_at"], pedidos[-1]["id"])
+
+
+# ========== RESÚMENES ==========
+
+@_operacion("Error al obtener resumen del usuario")
+def get_resumen_usuario(usuario_id, tx=None):
+    """{usuario_id, pedidos, total_gastado, ultimo_pedido} o None si no ha comprado."""
+    return tx.uno("SELECT * FROM resumen_usuario WHERE usuario_id = %s", (usuario_id,))
+
+
+@_operacion("Error al obtener ventas del día", si_falla=list, lectura=True)
+def listar_ventas_producto_dia(dia, tx=None):
+    """Unidades e ingresos por producto de un día ('YYYY-MM-DD')."""
+    return tx.todos(
+        "SELECT producto_id, unidades, ingresos FROM resumen_producto_dia WHERE dia = %s ORDER BY producto_id",
+        (dia,)
+    )
+
+
+_SQL_RESUMEN_USUARIO = """
+    SELECT usuario_id, COUNT(*) AS pedidos, SUM(total) AS total_gastado,
+           MAX(created_at) AS ultimo_pedido
+    FROM pedidos
+    GROUP BY usuario_id
+"""
+_SQL_RESUMEN_PRODUCTO_DIA = """
+    SELECT DATE(p.created_at) AS dia, d.producto_id, SUM(d.cantidad) AS unidades,
+           SUM(d.cantidad * d.precio_unitario) AS ingresos
+    FROM detalle_pedido d
+    JOIN pedidos p ON p.id = d.pedido_id
+    GROUP BY DATE(p.created_at), d.producto_id
+"""
+
+
+@_operacion("Error al reconstruir resúmenes", si_falla=False)
+def reconstruir_resumenes(tx=None):
+    """
+    Vuelve a calcular los resúmenes desde pedidos y detalle_pedido.
+    Recorre las tablas completas: es para mantenimiento (o si
+    verificar_resumenes encuentra diferencias), no para el día a día.
+    """
+    cur = tx.cursor()
+    cur.execute("DELETE FROM resumen_producto_dia")
+    cur.execute("DELETE FROM resumen_usuario")
+    cur.execute(
+        "INSERT INTO resumen_usuario (usuario_id, pedidos, total_gastado, ultimo_pedido) "
+        + _SQL_RESUMEN_USUARIO
+    )
+    cur.execute(
+        "INSERT INTO resumen_producto_dia (dia, producto_id, unidades, ingresos) "
+        + _SQL_RESUMEN_PRODUCTO_DIA
+    )
+    return True
+
+
+@_operacion("Error al verificar resúmenes")
+def verificar_resumenes(tx=None):
+    """
+    Compara los resúmenes contra un cálculo desde cero. Regresa la lista de
+    diferencias (vacía si todo cuadra); None si no se pudo verificar.
+    """
+    cur = tx.cursor(dictionary=True)
+
+    def leer(sql, llave, columnas):
+        cur.execute(sql)
+        return {
+            tuple(str(r[c]) for c in llave): tuple(_normalizar_resumen(r[c]) for c in columnas)
+            for r in cur.fetchall()
+        }
+
+    diferencias = []
+    comparaciones = [
+        ("resumen_usuario", ("usuario_id",), ("pedidos", "total_gastado"), _SQL_RESUMEN_USUARIO),
+        ("resumen_producto_dia", ("dia", "producto_id"), ("unidades", "ingresos"), _SQL_RESUMEN_PRODUCTO_DIA),
+    ]
+    for tabla, llave, columnas, sql_desde_cero in comparaciones:
+        guardado = leer(f"SELECT * FROM {tabla}", llave, columnas)
+        esperado = leer(sql_desde_cero, llave, columnas)
+        for k in sorted(set(guardado) | set(esperado)):
+            if guardado.get(k) != esperado.get(k):
+                diferencias.append({
+                    "tabla": tabla, "llave": k,
+                    "guardado": guardado.get(k), "esperado": esperado.get(k),
+                })
+    return diferencias
+
+
+def _normalizar_resumen(valor):
+    # SQLite regresa REAL y MySQL Decimal: se comparan en centavos
+    if isinstance(valor, (float, Decimal)):
+        return a_decimal(valor)
+    return valor
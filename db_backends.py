@@ -0,0 +1,629 @@
+# db_backends.py
+"""
+Backends de almacenamiento para db.py.
+
+Cada backend entrega conexiones con la misma interfaz que mysql.connector
+(cursor(dictionary=True), execute con marcadores %s, commit, rollback, close),
+así las funciones de db.py no necesitan saber contra qué BD corren.
+
+El backend se elige con DB_BACKEND en el .env:
+    DB_BACKEND=mysql    (por defecto) servidor MySQL con pool de conexiones
+    DB_BACKEND=sqlite   archivo local, ver DB_SQLITE_PATH
+
+Opcionalmente hay una réplica de solo lectura del mismo tipo
+(DB_REPLICA_HOST con MySQL, DB_SQLITE_REPLICA_PATH con SQLite); ver
+crear_backend_replica y connection_manager.EnrutadorLecturas.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+# Sentencias preparadas que se guardan por conexión (las menos usadas se cierran)
+SENTENCIAS_POR_CONEXION = int(os.getenv("SENTENCIAS_POR_CONEXION", 64))
+
+
+class CacheSentencias:
+    """
+    Cursores preparados de una conexión, por (sql, dictionary), en orden LRU.
+    Se guarda también el objeto str del SQL: el cursor preparado de
+    mysql.connector reutiliza la sentencia solo si recibe el mismo objeto.
+    """
+
+    def __init__(self, limite=SENTENCIAS_POR_CONEXION):
+        self.limite = limite
+        self._cursores = OrderedDict()
+
+    def obtener(self, clave, crear):
+        entrada = self._cursores.get(clave)
+        if entrada is not None:
+            self._cursores.move_to_end(clave)
+            return entrada
+        entrada = (crear(), clave[0])
+        self._cursores[clave] = entrada
+        if len(self._cursores) > self.limite:
+            _, (viejo, _) = self._cursores.popitem(last=False)
+            try:
+                viejo.close()
+            except Exception:
+                pass
+        return entrada
+
+
+class Backend:
+    """
+    Interfaz común de los backends.
+
+    Los backends con usa_pool = True solo saben abrir, validar y reiniciar
+    conexiones crudas; el pool lo pone connection_manager. Los demás
+    reutilizan sus conexiones por su cuenta en get_conn().
+    """
+
+    nombre = None
+    usa_pool = True
+    Error = Exception
+    # Expresión SQL: hora del servidor en microsegundos desde 1970. Con ella
+    # las ventas marcan el stock que cambian (ver db.listar_stock_cambiado)
+    sql_marca_ahora = None
+
+    def conectar(self):
+        """Abre una conexión nueva (sin pool)."""
+        raise NotImplementedError
+
+    def validar(self, conn):
+        """Ping barato; regresa False si la conexión ya no sirve."""
+        return True
+
+    def reiniciar(self, conn, completo=False):
+        """
+        Deja la conexión limpia antes de regresarla al pool. completo=True
+        además reinicia la sesión (variables, tablas temporales...).
+        """
+        conn.rollback()
+
+    def retraso(self, conn):
+        """
+        Segundos que esta réplica va detrás de la primaria, o None si no se
+        sabe (la replicación está detenida o no es réplica).
+        """
+        return 0.0
+
+    def get_conn(self):
+        """Regresa una conexión lista para usar o None (solo si usa_pool = False)."""
+        raise NotImplementedError
+
+    def sentencia_preparada(self, conn, sql, dictionary=False):
+        """
+        Regresa (cursor, sql) para ejecutar sql como sentencia preparada,
+        reutilizando el cursor si esa conexión ya la preparó antes.
+        """
+        return conn._sentencias.obtener(
+            (sql, dictionary),
+            lambda: conn.cursor(dictionary=dictionary)
+        )
+
+    def columnas(self, cur, tabla):
+        """Regresa el conjunto de columnas de una tabla (para migraciones en init_db)."""
+        raise NotImplementedError
+
+    def indices(self, cur, tabla):
+        """Regresa el conjunto de nombres de índices de una tabla."""
+        raise NotImplementedError
+
+    def incrementar_version_catalogo(self, tx):
+        """Incrementa catalogo_version dentro de tx y regresa el nuevo valor."""
+        raise NotImplementedError
+
+    def sql_upsert(self, tabla, columnas, n_filas, llave=("id",), sumar=()):
+        """
+        INSERT de n_filas filas que, si la llave ya existe, actualiza las
+        demás columnas en lugar de fallar. Con llave NULL siempre inserta.
+        Las columnas de `sumar` se acumulan (valor actual + nuevo) en lugar
+        de reemplazarse.
+        """
+        raise NotImplementedError
+
+    def insertar_o_obtener(self, tx, tabla, columnas, valores, unica):
+        """
+        Inserta una fila o, si ya existe otra con el mismo valor en la columna
+        única `unica`, la deja como está. Regresa la fila que quedó en la
+        tabla (id + columnas) en un solo viaje a la BD cuando se puede.
+        """
+        raise NotImplementedError
+
+    def explicar(self, cur, sql, params=()):
+        """
+        Plan de ejecución de sql, un dict por tabla leída:
+        {"tabla", "escaneo_completo", "ordenamiento", "detalle"}.
+        escaneo_completo = recorre toda la tabla (o todo un índice);
+        ordenamiento = ordena en una tabla temporal (filesort).
+        """
+        raise NotImplementedError
+
+
+# ========== MySQL ==========
+
+class MySQLBackend(Backend):
+    nombre = "mysql"
+    # UTC y aritmética de fechas: no depende de la zona horaria de la sesión
+    sql_marca_ahora = "TIMESTAMPDIFF(MICROSECOND, '1970-01-01 00:00:00', UTC_TIMESTAMP(6))"
+
+    def __init__(self, config):
+        import mysql.connector
+
+        self._mysql = mysql.connector
+        self.Error = mysql.connector.Error
+        self.config = config
+
+    def conectar(self):
+        conn = self._mysql.connect(**self.config)
+        conn._sentencias = CacheSentencias()
+        return conn
+
+    def validar(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except self.Error:
+            return False
+
+    def reiniciar(self, conn, completo=False):
+        # Solo se cierra la transacción abierta (in_transaction no va al servidor).
+        # reset_session() cuesta un viaje y borra las sentencias preparadas,
+        # por eso solo se usa con POOL_REINICIO_COMPLETO=1.
+        if completo:
+            conn.reset_session()
+            conn._sentencias = CacheSentencias()
+        elif conn.in_transaction:
+            conn.rollback()
+
+    def retraso(self, conn):
+        cur = conn.cursor(dictionary=True)
+        try:
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except self.Error:
+                cur.execute("SHOW SLAVE STATUS")  # MySQL anterior a 8.0.22
+            row = cur.fetchone()
+        finally:
+            cur.close()
+        if not row:
+            return None
+        segundos = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float(segundos) if segundos is not None else None
+
+    def sentencia_preparada(self, conn, sql, dictionary=False):
+        return conn._sentencias.obtener(
+            (sql, dictionary),
+            lambda: conn.cursor(prepared=True, dictionary=dictionary)
+        )
+
+    def columnas(self, cur, tabla):
+        cur.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (tabla,)
+        )
+        return {row[0] for row in cur.fetchall()}
+
+    def indices(self, cur, tabla):
+        cur.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (tabla,)
+        )
+        return {row[0] for row in cur.fetchall()}
+
+    def incrementar_version_catalogo(self, tx):
+        # LAST_INSERT_ID(expr) regresa el nuevo valor en el mismo viaje
+        cur = tx.ejecutar(
+            "UPDATE catalogo_version SET version = LAST_INSERT_ID(version + 1) WHERE id = 1"
+        )
+        return cur.lastrowid
+
+    def sql_upsert(self, tabla, columnas, n_filas, llave=("id",), sumar=()):
+        fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+        actualizar = ", ".join(
+            f"{c} = {c} + VALUES({c})" if c in sumar else f"{c} = VALUES({c})"
+            for c in columnas if c not in llave
+        )
+        return (
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES "
+            + ", ".join([fila] * n_filas)
+            + f" ON DUPLICATE KEY UPDATE {actualizar}"
+        )
+
+    def insertar_o_obtener(self, tx, tabla, columnas, valores, unica):
+        # LAST_INSERT_ID(id) hace que lastrowid traiga el id de la fila que
+        # ya existía; rowcount = 1 solo si se insertó (0 si no cambió nada)
+        cur = tx.ejecutar(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['%s'] * len(columnas))}) "
+            "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)",
+            tuple(valores)
+        )
+        if cur.rowcount == 1:
+            return {"id": cur.lastrowid, **dict(zip(columnas, valores))}
+        # Ya existía: la fila guardada puede tener otros datos (p. ej. otro nombre)
+        return tx.uno(
+            f"SELECT id, {', '.join(columnas)} FROM {tabla} WHERE id = %s", (cur.lastrowid,)
+        )
+
+    def explicar(self, cur, sql, params=()):
+        cur.execute("EXPLAIN " + sql, tuple(params))
+        nombres = [col[0] for col in cur.description]
+        plan = []
+        for row in cur.fetchall():
+            fila = row if isinstance(row, dict) else dict(zip(nombres, row))
+            extra = fila.get("Extra") or ""
+            plan.append({
+                "tabla": fila.get("table"),
+                # ALL = toda la tabla, index = todo el índice
+                "escaneo_completo": fila.get("type") in ("ALL", "index"),
+                "ordenamiento": "Using filesort" in extra,
+                "detalle": f"type={fila.get('type')} key={fila.get('key')} {extra}".strip(),
+            })
+        return plan
+
+
+# ========== SQLite ==========
+
+class ErrorSQLite(Exception):
+    """
+    Error de SQLite con el mismo errno que usaría MySQL para los casos que
+    db.py revisa (1062 = duplicado, 1205 = BD bloqueada / lock wait timeout).
+    """
+
+    def __init__(self, msg, errno=None):
+        super().__init__(msg)
+        self.errno = errno
+        self.msg = msg
+
+
+# sqlite3 no sabe guardar Decimal: como texto, la columna DECIMAL lo convierte
+# a número sin pasar por float en Python
+sqlite3.register_adapter(Decimal, str)
+
+# Códigos extendidos de sqlite3 (Python >= 3.11 los expone en sqlite_errorcode)
+_SQLITE_BUSY = 5
+_SQLITE_LOCKED = 6
+_SQLITE_CONSTRAINT_PRIMARYKEY = 1555
+_SQLITE_CONSTRAINT_UNIQUE = 2067
+
+
+def _convertir_error(e):
+    codigo = getattr(e, "sqlite_errorcode", None)
+    errno = None
+    if codigo in (_SQLITE_CONSTRAINT_UNIQUE, _SQLITE_CONSTRAINT_PRIMARYKEY) or (
+            isinstance(e, sqlite3.IntegrityError) and "UNIQUE" in str(e)):
+        errno = 1062
+    elif codigo in (_SQLITE_BUSY, _SQLITE_LOCKED) or "database is locked" in str(e):
+        errno = 1205
+    return ErrorSQLite(str(e), errno)
+
+
+# Traducción del dialecto MySQL que usa db.py al de SQLite
+_REEMPLAZOS = [
+    (re.compile(r"\bINT AUTO_INCREMENT PRIMARY KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\bGREATEST\(", re.I), "MAX("),
+    (re.compile(r"%s"), "?"),
+]
+_FOR_UPDATE = re.compile(r"\s+FOR UPDATE\b", re.I)
+
+
+@lru_cache(maxsize=512)
+def _traducir(sql):
+    """
+    Regresa (sql_sqlite, escribe). escribe es True si la sentencia modifica
+    datos o bloquea filas (SELECT ... FOR UPDATE), para abrir la transacción
+    con BEGIN IMMEDIATE antes de ejecutarla.
+    """
+    bloquea = bool(_FOR_UPDATE.search(sql))
+    sql = _FOR_UPDATE.sub("", sql)
+    for patron, reemplazo in _REEMPLAZOS:
+        sql = patron.sub(reemplazo, sql)
+    verbo = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    escribe = bloquea or verbo not in ("SELECT", "PRAGMA", "EXPLAIN", "WITH")
+    return sql, escribe
+
+
+def _fila_dict(cur, row):
+    return {col[0]: valor for col, valor in zip(cur.description, row)}
+
+
+class _CursorSQLite:
+    def __init__(self, conexion, dictionary=False):
+        self._conexion = conexion
+        self._cur = conexion._raw.cursor()
+        if dictionary:
+            self._cur.row_factory = _fila_dict
+
+    def execute(self, sql, params=()):
+        sql, escribe = _traducir(sql)
+        try:
+            if escribe:
+                self._conexion._iniciar_transaccion()
+            self._cur.execute(sql, tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _convertir_error(e) from e
+        return self
+
+    def executemany(self, sql, seq_params):
+        sql, _ = _traducir(sql)
+        try:
+            self._conexion._iniciar_transaccion()
+            self._cur.executemany(sql, [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise _convertir_error(e) from e
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cur.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+
+class _ConexionSQLite:
+    """
+    Conexión SQLite con la interfaz de mysql.connector.
+    Las lecturas sueltas corren en autocommit; la primera escritura (o
+    SELECT ... FOR UPDATE) abre una transacción con BEGIN IMMEDIATE, que dura
+    hasta commit() o rollback(). Si viene del caché por hilo, close() la
+    regresa al caché en lugar de cerrarla.
+    """
+
+    def __init__(self, raw, al_cerrar=None):
+        self._raw = raw
+        self._al_cerrar = al_cerrar
+        self._en_transaccion = False
+        # sqlite3 ya guarda compiladas las sentencias (cached_statements);
+        # aquí solo se reutilizan los cursores
+        self._sentencias = CacheSentencias()
+
+    def cursor(self, dictionary=False, **kwargs):
+        return _CursorSQLite(self, dictionary=dictionary)
+
+    def _iniciar_transaccion(self):
+        if not self._en_transaccion:
+            self._raw.execute("BEGIN IMMEDIATE")
+            self._en_transaccion = True
+
+    def commit(self):
+        if self._en_transaccion:
+            self._en_transaccion = False
+            try:
+                self._raw.execute("COMMIT")
+            except sqlite3.Error as e:
+                raise _convertir_error(e) from e
+
+    def rollback(self):
+        if self._en_transaccion:
+            self._en_transaccion = False
+            self._raw.execute("ROLLBACK")
+
+    def ping(self):
+        self._raw.execute("SELECT 1")
+
+    def close(self):
+        self.rollback()
+        if self._al_cerrar is not None:
+            self._al_cerrar(self)
+        else:
+            self._raw.close()
+
+
+class SQLiteBackend(Backend):
+    """
+    Backend SQLite en modo WAL (lectores no bloquean al escritor).
+    Cada hilo guarda sus propias conexiones abiertas y las reutiliza,
+    así no se paga abrir el archivo en cada consulta. Con solo_lectura=True
+    (réplica) las conexiones rechazan cualquier escritura; `primaria` es la
+    ruta de la BD de la que se copia, para medir el retraso.
+    """
+
+    nombre = "sqlite"
+    usa_pool = False
+    Error = ErrorSQLite
+    sql_marca_ahora = "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+
+    def __init__(self, ruta, busy_timeout_ms=5000, solo_lectura=False, primaria=None):
+        self.ruta = ruta
+        self.busy_timeout_ms = busy_timeout_ms
+        self.solo_lectura = solo_lectura
+        self.primaria = primaria
+        self._local = threading.local()
+
+    def conectar(self):
+        try:
+            raw = sqlite3.connect(
+                self.ruta,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute("PRAGMA synchronous=NORMAL")
+            raw.execute("PRAGMA foreign_keys=ON")
+            raw.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            if self.solo_lectura:
+                raw.execute("PRAGMA query_only=ON")
+        except sqlite3.Error as e:
+            raise _convertir_error(e) from e
+        return _ConexionSQLite(raw)
+
+    def validar(self, conn):
+        try:
+            conn.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    # Lo que cambia con las escrituras de la aplicación: versión del catálogo,
+    # última venta que tocó stock y último pedido (con su fecha)
+    _SQL_ESTADO = (
+        "SELECT (SELECT version FROM catalogo_version WHERE id = 1), "
+        "(SELECT MAX(stock_marca) FROM productos), "
+        "(SELECT MAX(id) FROM pedidos), "
+        "(SELECT created_at FROM pedidos ORDER BY id DESC LIMIT 1)"
+    )
+
+    def retraso(self, conn):
+        """
+        SQLite no tiene replicación: la réplica es una copia que llega de
+        fuera. Se compara con el archivo de la primaria; si tienen lo mismo,
+        0. Si no, se cuenta desde el cambio más reciente que sí tiene la
+        réplica (cota por arriba: lo que le falta es posterior). None sin
+        primaria configurada o si la réplica no tiene cambios con fecha.
+        """
+        if self.primaria is None:
+            return None
+        try:
+            estado = conn._raw.execute(self._SQL_ESTADO).fetchone()
+            primaria = sqlite3.connect(Path(self.primaria).as_uri() + "?mode=ro", uri=True,
+                                       timeout=self.busy_timeout_ms / 1000)
+            try:
+                estado_primaria = primaria.execute(self._SQL_ESTADO).fetchone()
+            finally:
+                primaria.close()
+        except sqlite3.Error as e:
+            raise _convertir_error(e) from e
+        if estado == estado_primaria:
+            return 0.0
+        _, marca, _, creado = estado
+        momentos = []
+        if marca:
+            momentos.append(marca / 1_000_000)
+        if creado:
+            momentos.append(datetime.strptime(str(creado)[:19], "%Y-%m-%d %H:%M:%S").timestamp())
+        return max(time.time() - max(momentos), 0.0) if momentos else None
+
+    def get_conn(self):
+        libres = getattr(self._local, "libres", None)
+        if libres is None:
+            libres = self._local.libres = []
+        if libres:
+            return libres.pop()
+        try:
+            conn = self.conectar()
+        except ErrorSQLite as e:
+            print("Error al abrir la BD SQLite:", e)
+            return None
+        conn._al_cerrar = self._devolver
+        return conn
+
+    def _devolver(self, conexion):
+        libres = getattr(self._local, "libres", None)
+        if libres is None:
+            libres = self._local.libres = []
+        libres.append(conexion)
+
+    def columnas(self, cur, tabla):
+        cur.execute(f"PRAGMA table_info({tabla})")
+        return {row[1] if not isinstance(row, dict) else row["name"] for row in cur.fetchall()}
+
+    def indices(self, cur, tabla):
+        cur.execute(f"PRAGMA index_list({tabla})")
+        return {row[1] if not isinstance(row, dict) else row["name"] for row in cur.fetchall()}
+
+    def incrementar_version_catalogo(self, tx):
+        row = tx.uno("UPDATE catalogo_version SET version = version + 1 WHERE id = 1 RETURNING version")
+        return int(row["version"])
+
+    def sql_upsert(self, tabla, columnas, n_filas, llave=("id",), sumar=()):
+        fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+        actualizar = ", ".join(
+            f"{c} = {c} + excluded.{c}" if c in sumar else f"{c} = excluded.{c}"
+            for c in columnas if c not in llave
+        )
+        return (
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES "
+            + ", ".join([fila] * n_filas)
+            + f" ON CONFLICT ({', '.join(llave)}) DO UPDATE SET {actualizar}"
+        )
+
+    def insertar_o_obtener(self, tx, tabla, columnas, valores, unica):
+        # DO UPDATE sin cambios (y no DO NOTHING) para que RETURNING también
+        # regrese la fila cuando ya existía
+        return tx.uno(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['%s'] * len(columnas))}) "
+            f"ON CONFLICT ({unica}) DO UPDATE SET {unica} = excluded.{unica} "
+            f"RETURNING id, {', '.join(columnas)}",
+            tuple(valores)
+        )
+
+    def explicar(self, cur, sql, params=()):
+        # Filas (id, parent, notused, detail), p. ej.
+        # "SEARCH pedidos USING INDEX idx_pedidos_usuario_fecha (usuario_id=?)"
+        cur.execute("EXPLAIN QUERY PLAN " + sql, tuple(params))
+        plan = []
+        for row in cur.fetchall():
+            detalle = row[3] if not isinstance(row, dict) else row["detail"]
+            palabras = detalle.split()
+            plan.append({
+                "tabla": palabras[1] if palabras[0] in ("SCAN", "SEARCH") and len(palabras) > 1 else None,
+                "escaneo_completo": palabras[0] == "SCAN" and "CONSTANT ROW" not in detalle,
+                "ordenamiento": "USE TEMP B-TREE" in detalle,
+                "detalle": detalle,
+            })
+        return plan
+
+
+def _ruta_sqlite(ruta):
+    if not os.path.isabs(ruta):
+        ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), ruta)
+    return ruta
+
+
+def crear_backend(config):
+    """Crea el backend configurado en DB_BACKEND (mysql por defecto)."""
+    nombre = os.getenv("DB_BACKEND", "mysql").strip().lower()
+    if nombre == "sqlite":
+        return SQLiteBackend(_ruta_sqlite(os.getenv("DB_SQLITE_PATH", "data/sample_db.sqlite3")))
+    if nombre != "mysql":
+        print(f"DB_BACKEND desconocido '{nombre}', se usa mysql.")
+    return MySQLBackend(config)
+
+
+def crear_backend_replica(config):
+    """
+    Backend de la réplica de lectura, o None si no hay una configurada:
+    DB_REPLICA_HOST (y DB_REPLICA_PORT) con MySQL, mismo usuario y BD que la
+    primaria; DB_SQLITE_REPLICA_PATH con SQLite.
+    """
+    if os.getenv("DB_BACKEND", "mysql").strip().lower() == "sqlite":
+        ruta = os.getenv("DB_SQLITE_REPLICA_PATH", "")
+        if not ruta:
+            return None
+        primaria = _ruta_sqlite(os.getenv("DB_SQLITE_PATH", "data/sample_db.sqlite3"))
+        return SQLiteBackend(_ruta_sqlite(ruta), solo_lectura=True, primaria=primaria)
+    host = os.getenv("DB_REPLICA_HOST", "")
+    if not host:
+        return None
+    return MySQLBackend(dict(config, host=host, port=int(os.getenv("DB_REPLICA_PORT", config["port"]))))
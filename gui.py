@@ -1,10 +1,23 @@
 # gui.py parte 2
 import tkinter as tk
-from tkinter import messagebox, ttk
-from models import Producto, Carrito
+from tkinter import filedialog, messagebox, ttk
+from models import MAX_RESULTADOS_BUSQUEDA, Carrito, Inventario
+from tareas import EjecutorTareas
+from lista_virtual import ListaVirtual
 import controller
 import db
 
+# Pedidos por página del historial (las siguientes se cargan al bajar)
+HISTORIAL_POR_PAGINA = 50
+
+
+def _texto_producto(p):
+    return f"{p.producto_id} | {p.nombre} - ${p.precio:.2f} (Stock: {p.cantidad})"
+
+
+def _texto_pedido(p):
+    return f"{p['id']} | {p['created_at']} | {p['tipo_entrega']} | ${p['total']:.2f}"
+
 
 class LoginWindow(tk.Toplevel):
     def __init__(self, master, on_login_success):
@@ -12,6 +25,7 @@ class LoginWindow(tk.Toplevel):
         self.title("Login / Registro McD")
         self.geometry("400x250")
         self.on_login_success = on_login_success
+        self.tareas = master.tareas
 
         tk.Label(self, text="Nombre:").pack(pady=5)
         self.entry_nombre = tk.Entry(self)
@@ -30,11 +44,11 @@ class LoginWindow(tk.Toplevel):
         frame_btns = tk.Frame(self)
         frame_btns.pack(pady=10)
 
-        btn_registrar = tk.Button(frame_btns, text="Registrarse", command=self.registrar)
-        btn_registrar.grid(row=0, column=0, padx=5)
+        self.btn_registrar = tk.Button(frame_btns, text="Registrarse", command=self.registrar)
+        self.btn_registrar.grid(row=0, column=0, padx=5)
 
-        btn_login = tk.Button(frame_btns, text="Iniciar sesión", command=self.login)
-        btn_login.grid(row=0, column=1, padx=5)
+        self.btn_login = tk.Button(frame_btns, text="Iniciar sesión", command=self.login)
+        self.btn_login.grid(row=0, column=1, padx=5)
 
     def registrar(self):
         nombre = self.entry_nombre.get().strip()
@@ -48,32 +62,33 @@ class LoginWindow(tk.Toplevel):
         if rol not in ("cliente", "admin"):
             rol = "cliente"
 
-        uid = controller.crear_usuario_y_obtener_id(nombre, correo, rol)
-        if uid is None:
-            messagebox.showerror("Error", "No se pudo registrar el usuario.")
-            return
-
-        user = controller.obtener_usuario_por_correo(correo)
-        if not user:
-            messagebox.showerror("Error", "No se pudo recuperar el usuario después de registrarlo.")
-            return
+        def listo(user):
+            if not user:
+                messagebox.showerror("Error", "No se pudo registrar el usuario.")
+                return
+            messagebox.showinfo("Registro", f"Usuario registrado / encontrado: {user.mostrar_datos()}")
+            self.on_login_success(user)
+            self.destroy()
 
-        messagebox.showinfo("Registro", f"Usuario registrado / encontrado: {user.mostrar_datos()}")
-        self.on_login_success(user)
-        self.destroy()
+        self.tareas.enviar("login", controller.registrar_usuario, nombre, correo, rol,
+                           al_terminar=listo, ocupados=(self.btn_registrar, self.btn_login))
 
     def login(self):
         correo = self.entry_correo.get().strip()
         if not correo:
             messagebox.showwarning("Datos faltantes", "Ingresa el correo para iniciar sesión.")
             return
-        user = controller.obtener_usuario_por_correo(correo)
-        if not user:
-            messagebox.showerror("No encontrado", "No existe un usuario con ese correo. Regístrate primero.")
-            return
-        messagebox.showinfo("Login correcto", f"Bienvenido {user.mostrar_datos()}")
-        self.on_login_success(user)
-        self.destroy()
+
+        def listo(user):
+            if not user:
+                messagebox.showerror("No encontrado", "No existe un usuario con ese correo. Regístrate primero.")
+                return
+            messagebox.showinfo("Login correcto", f"Bienvenido {user.mostrar_datos()}")
+            self.on_login_success(user)
+            self.destroy()
+
+        self.tareas.enviar("login", controller.obtener_usuario_por_correo, correo,
+                           al_terminar=listo, ocupados=(self.btn_registrar, self.btn_login))
 
 
 class App(tk.Tk):
@@ -82,20 +97,64 @@ class App(tk.Tk):
         self.title("McD - Prototipo POO")
         self.geometry("900x550")
 
-        db.init_db()
-        self.inventario = controller.cargar_inventario_desde_db()
-        if not self.inventario.productos:
-            self._crear_productos_demo()
-            self.inventario = controller.cargar_inventario_desde_db()
+        # Todo el acceso a BD corre en segundo plano (ver tareas.py)
+        self.tareas = EjecutorTareas(self)
+        self.protocol("WM_DELETE_WINDOW", self._cerrar)
 
+        self.inventario = Inventario()
+        self._productos_todos = None      # inventario.listar() de la última carga
         self.usuario = None
         self.carrito = None
+        self._historial = []              # pedidos cargados, del más nuevo al más viejo
+        self._historial_completo = False
 
         self._crear_menu()
         self._crear_widgets_principales()
 
-        # Mostrar ventana de login/registro al inicio
-        self.after(500, self._abrir_login_inicial)
+        # El login consulta usuarios: se abre cuando init_db ya terminó
+        def listo(inventario):
+            self._on_inventario_cargado(inventario)
+            self._abrir_login_inicial()
+
+        def fallo(error):
+            print("Error al preparar la base de datos:", error)
+            self._abrir_login_inicial()
+
+        self.tareas.enviar(
+            "arranque", self._preparar_bd,
+            al_terminar=listo, al_fallar=fallo,
+            ocupados=(self.btn_refrescar, self.btn_pagar),
+        )
+
+    def _cerrar(self):
+        self.tareas.cerrar()
+        self.destroy()
+
+    def _preparar_bd(self):
+        """Corre en segundo plano al arrancar."""
+        db.init_db()
+        inventario = controller.cargar_inventario_desde_db()
+        if not inventario.productos:
+            self._crear_productos_demo()
+            inventario = controller.cargar_inventario_desde_db()
+        return inventario
+
+    def _recargar_inventario(self, al_terminar=None):
+        def listo(inventario):
+            self._on_inventario_cargado(inventario)
+            if al_terminar is not None:
+                al_terminar()
+
+        self.tareas.enviar("inventario", controller.cargar_inventario_desde_db,
+                           al_terminar=listo, ocupados=(self.btn_refrescar,))
+
+    def _on_inventario_cargado(self, inventario):
+        self.inventario = inventario
+        self._productos_todos = None
+        self._rellenar_lista_productos()
+        # el carrito cobra con los precios vigentes
+        if self.carrito is not None and self.carrito.actualizar_precios(self.inventario.productos):
+            self._actualizar_lista_carrito()
 
     def _abrir_login_inicial(self):
         LoginWindow(self, self._on_login_success)
@@ -109,6 +168,7 @@ class App(tk.Tk):
             self.btn_admin.config(state=tk.NORMAL)
         else:
             self.btn_admin.config(state=tk.DISABLED)
+        self._actualizar_historial()
 
     def _crear_menu(self):
         menubar = tk.Menu(self)
@@ -117,7 +177,7 @@ class App(tk.Tk):
         menu_archivo = tk.Menu(menubar, tearoff=0)
         menu_archivo.add_command(label="Login / Cambio de usuario", command=self._abrir_login_inicial)
         menu_archivo.add_separator()
-        menu_archivo.add_command(label="Salir", command=self.quit)
+        menu_archivo.add_command(label="Salir", command=self._cerrar)
         menubar.add_cascade(label="Archivo", menu=menu_archivo)
 
     def _crear_productos_demo(self):
@@ -144,9 +204,20 @@ class App(tk.Tk):
         left.pack(side=tk.LEFT, fill=tk.BOTH, expand=False, padx=10)
 
         tk.Label(left, text="Productos").pack()
-        self.lst_productos = tk.Listbox(left, width=40, height=20)
-        self.lst_productos.pack()
+        # Búsqueda mientras se escribe (índice de palabras de Inventario)
+        self.var_buscar = tk.StringVar()
+        self.var_buscar.trace_add("write", lambda *_: self._rellenar_lista_productos())
+        tk.Entry(left, textvariable=self.var_buscar, width=40).pack(pady=2)
+        frame_prod = tk.Frame(left)
+        frame_prod.pack()
+        self.lst_productos = tk.Listbox(frame_prod, width=40, height=20)
+        self.lst_productos.pack(side=tk.LEFT)
+        scroll_prod = tk.Scrollbar(frame_prod, orient=tk.VERTICAL)
+        scroll_prod.pack(side=tk.RIGHT, fill=tk.Y)
         self.lst_productos.bind("<<ListboxSelect>>", self.event_seleccionar_producto)
+        # Solo se repintan las filas que cambian (ver lista_virtual.py)
+        self.vista_productos = ListaVirtual(self.lst_productos, _texto_producto,
+                                            clave=lambda p: p.producto_id, barra=scroll_prod)
 
         self.btn_agregar = tk.Button(left, text="Agregar al carrito", command=self.event_agregar_al_carrito)
         self.btn_agregar.pack(pady=5)
@@ -159,6 +230,7 @@ class App(tk.Tk):
         tk.Label(right, text="Carrito").pack()
         self.lst_carrito = tk.Listbox(right, width=50, height=10)
         self.lst_carrito.pack()
+        self.vista_carrito = ListaVirtual(self.lst_carrito, self._texto_carrito)
 
         form = tk.Frame(right)
         form.pack(pady=5)
@@ -188,9 +260,10 @@ class App(tk.Tk):
         self.lst_historial = tk.Listbox(frame_hist, height=8)
         self.lst_historial.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        scroll_hist = tk.Scrollbar(frame_hist, orient=tk.VERTICAL, command=self.lst_historial.yview)
+        scroll_hist = tk.Scrollbar(frame_hist, orient=tk.VERTICAL)
         scroll_hist.pack(side=tk.RIGHT, fill=tk.Y)
-        self.lst_historial.config(yscrollcommand=scroll_hist.set)
+        self.vista_historial = ListaVirtual(self.lst_historial, _texto_pedido, clave=lambda p: p['id'],
+                                            barra=scroll_hist, al_llegar_al_final=self._cargar_pagina_historial)
 
         self.lst_historial.bind("<<ListboxSelect>>", self.event_ver_detalle_pedido)
 
@@ -212,14 +285,16 @@ class App(tk.Tk):
         tk.Label(frame_list, text="Productos existentes").pack()
         lst_admin = tk.Listbox(frame_list, width=30)
         lst_admin.pack(fill=tk.BOTH, expand=True)
+        vista_admin = ListaVirtual(
+            lst_admin, lambda p: f"{p['id']} | {p['nombre']} - ${p['precio']} (Stock: {p['cantidad']})",
+            clave=lambda p: p['id'],
+        )
 
         def refrescar_admin_list():
-            lst_admin.delete(0, tk.END)
-            productos = db.listar_productos()
-            for p in productos:
-                lst_admin.insert(tk.END, f"{p['id']} | {p['nombre']} - ${p['precio']} (Stock: {p['cantidad']})")
+            def listo(productos):
+                vista_admin.actualizar(productos)
 
-        refrescar_admin_list()
+            self.tareas.enviar("admin_lista", db.listar_productos, al_terminar=listo, ocupados=(lst_admin,))
 
         frame_form = tk.Frame(win)
         frame_form.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
@@ -252,54 +327,60 @@ class App(tk.Tk):
             if not nombre:
                 messagebox.showwarning("Dato faltante", "El nombre no puede estar vacío.")
                 return
-            pid = db.create_producto(nombre, precio, cantidad)
-            if pid:
-                messagebox.showinfo("OK", "Producto creado correctamente.")
-                refrescar_admin_list()
-                self.inventario = controller.cargar_inventario_desde_db()
-                self._rellenar_lista_productos()
-                limpiar_form()
-            else:
-                messagebox.showerror("Error", "No se pudo crear el producto.")
+
+            def listo(pid):
+                if pid:
+                    messagebox.showinfo("OK", "Producto creado correctamente.")
+                    refrescar_admin_list()
+                    self._recargar_inventario()
+                    limpiar_form()
+                else:
+                    messagebox.showerror("Error", "No se pudo crear el producto.")
+
+            self.tareas.enviar("admin_guardar", db.create_producto, nombre, precio, cantidad,
+                               al_terminar=listo, ocupados=botones)
 
         def evento_editar_producto():
-            sel = lst_admin.curselection()
-            if not sel:
+            pid = vista_admin.clave_seleccionada()
+            if pid is None:
                 messagebox.showwarning("Selecciona", "Selecciona un producto para editar.")
                 return
-            idx = sel[0]
-            line = lst_admin.get(idx)
-            pid = int(line.split("|")[0].strip())
-            prod = db.get_producto(pid)
-            if not prod:
-                messagebox.showerror("Error", "No se encontró el producto.")
-                return
-            # llenar form
-            entry_nombre.delete(0, tk.END)
-            entry_nombre.insert(0, prod['nombre'])
-            entry_precio.delete(0, tk.END)
-            entry_precio.insert(0, str(prod['precio']))
-            entry_cantidad.delete(0, tk.END)
-            entry_cantidad.insert(0, str(prod['cantidad']))
-
-            def guardar_cambios():
-                nombre = entry_nombre.get().strip()
-                try:
-                    precio = float(entry_precio.get())
-                    cantidad = int(entry_cantidad.get())
-                except ValueError:
-                    messagebox.showerror("Error", "Precio o cantidad inválidos.")
+
+            def listo(prod):
+                if not prod:
+                    messagebox.showerror("Error", "No se encontró el producto.")
                     return
-                ok = controller.actualizar_producto_db(pid, nombre, precio, cantidad)
+                # llenar form
+                entry_nombre.delete(0, tk.END)
+                entry_nombre.insert(0, prod['nombre'])
+                entry_precio.delete(0, tk.END)
+                entry_precio.insert(0, str(prod['precio']))
+                entry_cantidad.delete(0, tk.END)
+                entry_cantidad.insert(0, str(prod['cantidad']))
+                btn_guardar.config(command=lambda: guardar_cambios(pid))
+
+            # si se selecciona otro producto antes de que llegue este, gana el último
+            self.tareas.enviar("admin_producto", db.get_producto, pid, al_terminar=listo)
+
+        def guardar_cambios(pid):
+            nombre = entry_nombre.get().strip()
+            try:
+                precio = float(entry_precio.get())
+                cantidad = int(entry_cantidad.get())
+            except ValueError:
+                messagebox.showerror("Error", "Precio o cantidad inválidos.")
+                return
+
+            def listo(ok):
                 if ok:
                     messagebox.showinfo("OK", "Producto actualizado.")
                     refrescar_admin_list()
-                    self.inventario = controller.cargar_inventario_desde_db()
-                    self._rellenar_lista_productos()
+                    self._recargar_inventario()
                 else:
                     messagebox.showerror("Error", "No se pudo actualizar el producto.")
 
-            btn_guardar.config(command=guardar_cambios)
+            self.tareas.enviar("admin_guardar", controller.actualizar_producto_db, pid, nombre, precio, cantidad,
+                               al_terminar=listo, ocupados=botones)
 
         btn_agregar = tk.Button(frame_form, text="Agregar", command=evento_agregar_producto)
         btn_agregar.grid(row=3, column=0, pady=10)
@@ -310,14 +391,44 @@ class App(tk.Tk):
         btn_guardar = tk.Button(frame_form, text="Guardar cambios")
         btn_guardar.grid(row=4, column=0, columnspan=2, pady=10)
 
+        def evento_importar():
+            ruta = filedialog.askopenfilename(
+                parent=win,
+                title="Importar catálogo",
+                filetypes=[("CSV o JSONL", "*.csv *.jsonl"), ("Todos", "*.*")],
+            )
+            if not ruta:
+                return
+
+            def listo(resumen):
+                msg = f"Importados {resumen['importadas']} de {resumen['leidas']} productos."
+                if resumen["errores"]:
+                    msg += f"\n\n{len(resumen['errores'])} filas con error, p. ej.:\n"
+                    msg += "\n".join(f"línea {l}: {m}" for l, m in resumen["errores"][:10])
+                messagebox.showinfo("Importación", msg, parent=win)
+                refrescar_admin_list()
+                self._recargar_inventario()
+
+            self.tareas.enviar("admin_importar", controller.importar_catalogo, ruta,
+                               al_terminar=listo, ocupados=botones)
+
+        btn_importar = tk.Button(frame_form, text="Importar CSV/JSONL...", command=evento_importar)
+        btn_importar.grid(row=5, column=0, columnspan=2, pady=10)
+
+        botones = (btn_agregar, btn_editar, btn_guardar, btn_importar)
+        refrescar_admin_list()
+
     # ================== Productos / Carrito ==================
     def _rellenar_lista_productos(self):
-        self.lst_productos.delete(0, tk.END)
-        for p in self.inventario.listar():
-            self.lst_productos.insert(
-                tk.END,
-                f"{p.producto_id} | {p.nombre} - ${p.precio:.2f} (Stock: {p.cantidad})"
-            )
+        texto = self.var_buscar.get()
+        if texto.strip():
+            self.vista_productos.actualizar(self.inventario.buscar_texto(texto, MAX_RESULTADOS_BUSQUEDA))
+            return
+        # Misma lista hasta la siguiente carga: al borrar la búsqueda
+        # ListaVirtual no vuelve a recorrer todo el catálogo
+        if self._productos_todos is None:
+            self._productos_todos = self.inventario.listar()
+        self.vista_productos.actualizar(self._productos_todos, fija=True)
 
     def event_seleccionar_producto(self, evt):
         # aquí podrías mostrar detalles si quieres
@@ -328,13 +439,10 @@ class App(tk.Tk):
             messagebox.showwarning("Sesión", "Debes iniciar sesión para comprar.")
             return
 
-        sel = self.lst_productos.curselection()
-        if not sel:
+        pid = self.vista_productos.clave_seleccionada()
+        if pid is None:
             messagebox.showwarning("Atención", "Selecciona un producto primero.")
             return
-        idx = sel[0]
-        line = self.lst_productos.get(idx)
-        pid = int(line.split("|")[0].strip())
         prod = self.inventario.buscar(pid)
         if prod and prod.cantidad > 0:
             self.carrito.add(prod, 1)
@@ -342,30 +450,22 @@ class App(tk.Tk):
         else:
             messagebox.showerror("Sin stock", "No hay stock disponible para ese producto.")
 
+    def _texto_carrito(self, pid):
+        prod = self.inventario.buscar(pid)
+        return f"{prod.nombre} x{self.carrito.items[pid]} - ${self.carrito.subtotal(pid):.2f}"
+
     def _actualizar_lista_carrito(self):
-        self.lst_carrito.delete(0, tk.END)
-        for pid, qty in self.carrito.items.items():
-            prod = self.inventario.buscar(pid)
-            if prod:
-                self.lst_carrito.insert(tk.END, f"{prod.nombre} x{qty} - ${prod.precio*qty:.2f}")
-        total = self.carrito.total(self.inventario.productos)
+        self.vista_carrito.actualizar(pid for pid in self.carrito.items if self.inventario.buscar(pid))
+        total = self.carrito.total()
         self.lbl_total.config(text=f"Total: ${total:.2f}")
 
     def event_eliminar_seleccion(self):
-        sel = self.lst_carrito.curselection()
-        if not sel:
+        pid = self.vista_carrito.clave_seleccionada()
+        if pid is None:
             messagebox.showinfo("Info", "Selecciona un ítem del carrito para eliminar.")
             return
-        idx = sel[0]
-        line = self.lst_carrito.get(idx)
-        nombre = line.split(" x")[0]
-        pid = None
-        for p in self.inventario.listar():
-            if p.nombre == nombre:
-                pid = p.producto_id
-                break
-        if pid is not None:
-            prod = self.inventario.buscar(pid)
+        prod = self.inventario.buscar(pid)
+        if prod is not None:
             self.carrito.remove(prod, 1)
             self._actualizar_lista_carrito()
 
@@ -379,55 +479,101 @@ class App(tk.Tk):
             return
 
         tipo_entrega = self.combo_entrega.get()
-        pid = controller.crear_pedido_db(self.usuario.usuario_id, tipo_entrega, self.carrito)
-        if not pid:
-            messagebox.showerror("Error", "No se pudo crear el pedido.")
-            return
 
-        messagebox.showinfo("Pedido creado", f"Pedido #{pid} creado. Gracias por su compra.")
-        self.carrito.clear()
-        self._actualizar_lista_carrito()
+        def trabajo():
+            pid, faltantes = controller.crear_pedido_db(self.usuario.usuario_id, tipo_entrega, self.carrito)
+            pedido = db.get_pedido(pid) if pid else None
+            return pid, faltantes, pedido, controller.cargar_inventario_desde_db()
+
+        def listo(resultado):
+            pid, faltantes, pedido, inventario = resultado
+            self._on_inventario_cargado(inventario)
+            if faltantes:
+                msg = "No hay stock suficiente para:\n"
+                for f in faltantes:
+                    prod = self.inventario.buscar(f["producto_id"])
+                    nombre = prod.nombre if prod else f"Prod {f['producto_id']}"
+                    msg += f"- {nombre}: pediste {f['solicitado']}, hay {f['disponible']}\n"
+                messagebox.showerror("Sin stock", msg)
+                return
+            if not pid:
+                messagebox.showerror("Error", "No se pudo crear el pedido.")
+                return
 
-        self.inventario = controller.cargar_inventario_desde_db()
-        self._rellenar_lista_productos()
+            messagebox.showinfo("Pedido creado", f"Pedido #{pid} creado. Gracias por su compra.")
+            self.carrito.clear()
+            self._actualizar_lista_carrito()
+            if pedido:
+                self._agregar_al_historial(pedido)
 
-        self._actualizar_historial()
+        # El carrito no se puede tocar mientras se cobra
+        self.tareas.enviar(
+            "pagar", trabajo, al_terminar=listo,
+            ocupados=(self.btn_pagar, self.btn_agregar, self.btn_eliminar),
+        )
 
     def event_refrescar(self):
-        self.inventario = controller.cargar_inventario_desde_db()
-        self._rellenar_lista_productos()
-        messagebox.showinfo("Refrescado", "Inventario actualizado desde la base de datos.")
+        self._recargar_inventario(
+            al_terminar=lambda: messagebox.showinfo("Refrescado", "Inventario actualizado desde la base de datos.")
+        )
 
     # ================== Historial ==================
     def _actualizar_historial(self):
-        if not self.usuario:
+        """Vuelve a empezar el historial desde la página más reciente."""
+        self._historial = []
+        self._historial_completo = False
+        self.vista_historial.actualizar([])
+        self._cargar_pagina_historial(forzar=True)
+
+    def _cargar_pagina_historial(self, forzar=False):
+        """Trae la siguiente página en segundo plano (al bajar cerca del final)."""
+        if not self.usuario or self._historial_completo:
             return
-        self.lst_historial.delete(0, tk.END)
-        pedidos = controller.listar_historial_por_usuario(self.usuario.usuario_id)
-        for p in pedidos:
-            self.lst_historial.insert(
-                tk.END,
-                f"{p['id']} | {p['created_at']} | {p['tipo_entrega']} | ${p['total']:.2f}"
-            )
+        if not forzar and self.tareas.ocupado("historial"):
+            return
+        usuario_id = self.usuario.usuario_id
+        ultimo = self._historial[-1] if self._historial else None
+        antes_de = (ultimo['created_at'], ultimo['id']) if ultimo else None
+
+        def listo(pagina):
+            if not self.usuario or self.usuario.usuario_id != usuario_id:
+                return  # cambió la sesión mientras se cargaba
+            if len(pagina) < HISTORIAL_POR_PAGINA:
+                self._historial_completo = True
+            # un pedido recién cobrado puede venir ya al inicio de la lista
+            vistos = {p['id'] for p in self._historial}
+            self._historial.extend(p for p in pagina if p['id'] not in vistos)
+            self.vista_historial.actualizar(self._historial)
+
+        self.tareas.enviar("historial", controller.listar_historial_pagina, usuario_id, antes_de,
+                           HISTORIAL_POR_PAGINA, al_terminar=listo)
+
+    def _agregar_al_historial(self, pedido):
+        """Pone el pedido recién cobrado arriba, sin recargar lo demás."""
+        if not self.usuario or pedido['usuario_id'] != self.usuario.usuario_id:
+            return
+        if any(p['id'] == pedido['id'] for p in self._historial):
+            return
+        self._historial.insert(0, pedido)
+        self.vista_historial.actualizar(self._historial)
 
     def event_ver_detalle_pedido(self, evt):
-        sel = self.lst_historial.curselection()
-        if not sel:
+        pid = self.vista_historial.clave_seleccionada()
+        if pid is None:
             return
-        idx = sel[0]
-        line = self.lst_historial.get(idx)
-        pid = int(line.split("|")[0].strip())
 
-        pedido = db.get_pedido(pid)
-        if not pedido:
-            messagebox.showerror("Error", "No se encontró el pedido.")
-            return
+        def listo(pedido):
+            if not pedido:
+                messagebox.showerror("Error", "No se encontró el pedido.")
+                return
+
+            detalles = pedido.get("detalles", [])
+            msg = f"Pedido #{pedido['id']}\nTipo entrega: {pedido['tipo_entrega']}\nTotal: ${pedido['total']}\n\nDetalle:\n"
+            for d in detalles:
+                nombre = d['producto_nombre'] or f"Prod {d['producto_id']}"
+                msg += f"- {nombre} x{d['cantidad']} @ ${d['precio_unitario']}\n"
 
-        detalles = pedido.get("detalles", [])
-        msg = f"Pedido #{pedido['id']}\nTipo entrega: {pedido['tipo_entrega']}\nTotal: ${pedido['total']}\n\nDetalle:\n"
-        for d in detalles:
-            prod = db.get_producto(d['producto_id'])
-            nombre = prod['nombre'] if prod else f"Prod {d['producto_id']}"
-            msg += f"- {nombre} x{d['cantidad']} @ ${d['precio_unitario']}\n"
+            messagebox.showinfo("Detalle de pedido", msg)
 
-        messagebox.showinfo("Detalle de pedido", msg)
+        # solo se muestra el último pedido seleccionado
+        self.tareas.enviar("detalle", db.get_pedido, pid, al_terminar=listo)
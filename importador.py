@@ -0,0 +1,180 @@
+# importador.py
+"""
+Importación masiva del catálogo de productos desde CSV o JSONL.
+
+El archivo se lee en streaming (nunca completo en memoria) y los productos se
+mandan en lotes de tam_lote filas con un solo INSERT ... upsert cada uno
+(db.upsert_productos); cada lotes_por_tx lotes se confirma una transacción.
+Las filas inválidas no detienen la importación: se reportan con su número de
+línea en resumen["errores"]. Si la BD rechaza una transacción, se repite por
+lote y luego por fila, para que solo las filas rechazadas queden como error.
+
+Columnas: id (opcional), nombre, precio, cantidad. Si una fila trae id y ese
+producto ya existe, se actualiza; si no trae id, se crea un producto nuevo.
+
+Uso (desde la raíz del proyecto):
+    python importador.py catalogo.csv [tam_lote]
+"""
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+import db
+
+TAM_LOTE = 1000
+LOTES_POR_TX = 10
+# Rangos de las columnas: precio DECIMAL(10,2), cantidad INT
+PRECIO_MAX = 99_999_999.99
+CANTIDAD_MAX = 2**31 - 1
+
+
+def _leer_csv(archivo):
+    lector = csv.DictReader(archivo)
+    for fila in lector:
+        # line_num apunta a la última línea leída (la de esta fila)
+        yield lector.line_num, fila
+
+
+def _leer_jsonl(archivo):
+    for linea, texto in enumerate(archivo, start=1):
+        texto = texto.strip()
+        if not texto:
+            continue
+        try:
+            fila = json.loads(texto)
+        except ValueError as e:
+            yield linea, e
+            continue
+        yield linea, fila if isinstance(fila, dict) else ValueError("se esperaba un objeto JSON")
+
+
+def _validar(fila):
+    """Regresa (id o None, nombre, precio, cantidad) o lanza ValueError."""
+    if isinstance(fila, Exception):
+        raise ValueError(str(fila))
+    nombre = str(fila.get("nombre") or "").strip()
+    if not nombre:
+        raise ValueError("falta nombre")
+    if len(nombre) > 100:
+        raise ValueError("nombre de más de 100 caracteres")
+    try:
+        precio = float(fila.get("precio"))
+    except (TypeError, ValueError):
+        raise ValueError(f"precio inválido: {fila.get('precio')!r}")
+    if not math.isfinite(precio):
+        raise ValueError(f"precio inválido: {fila.get('precio')!r}")
+    precio = round(precio, 2)
+    try:
+        cantidad = int(fila.get("cantidad", 0) or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"cantidad inválida: {fila.get('cantidad')!r}")
+    if precio < 0 or cantidad < 0:
+        raise ValueError("precio y cantidad no pueden ser negativos")
+    if precio > PRECIO_MAX or cantidad > CANTIDAD_MAX:
+        raise ValueError("precio o cantidad fuera de rango")
+    pid = fila.get("id")
+    if pid in (None, ""):
+        pid = None
+    else:
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            raise ValueError(f"id inválido: {pid!r}")
+    return pid, nombre, precio, cantidad
+
+
+def _confirmar(lotes):
+    """Todos los lotes en una transacción; regresa el error de la BD o None."""
+    try:
+        with db.transaccion() as tx:
+            for lote in lotes:
+                db.upsert_productos([fila for _, fila in lote], tx=tx)
+    except db.Error as e:
+        return e
+    return None
+
+
+def _guardar(lotes, resumen):
+    """
+    Confirma varios lotes en una transacción. Si la BD la rechaza se repite
+    cada lote por separado y, el que vuelva a fallar, fila por fila: solo
+    las filas que la BD no acepte van a errores.
+    """
+    error = _confirmar(lotes)
+    if error is None:
+        resumen["importadas"] += sum(len(lote) for lote in lotes)
+    elif len(lotes) > 1:
+        for lote in lotes:
+            _guardar([lote], resumen)
+    elif len(lotes[0]) > 1:
+        for fila in lotes[0]:
+            _guardar([[fila]], resumen)
+    else:
+        resumen["errores"].append((lotes[0][0][0], f"BD: {error}"))
+
+
+def importar_catalogo(ruta, formato=None, tam_lote=TAM_LOTE, lotes_por_tx=LOTES_POR_TX, al_progresar=None):
+    """
+    Importa el archivo y regresa un resumen:
+    {"leidas", "importadas", "errores": [(linea, mensaje), ...], "segundos"}.
+    formato: "csv" o "jsonl" (por defecto, según la extensión).
+    al_progresar(resumen) se llama después de cada transacción.
+    """
+    if formato is None:
+        formato = "jsonl" if os.path.splitext(ruta)[1].lower() in (".jsonl", ".json") else "csv"
+    leer = _leer_jsonl if formato == "jsonl" else _leer_csv
+
+    inicio = time.perf_counter()
+    resumen = {"leidas": 0, "importadas": 0, "errores": [], "segundos": 0.0}
+    lotes, lote = [], []
+    with open(ruta, newline="", encoding="utf-8-sig") as archivo:
+        for linea, fila in leer(archivo):
+            resumen["leidas"] += 1
+            try:
+                lote.append((linea, _validar(fila)))
+            except ValueError as e:
+                resumen["errores"].append((linea, str(e)))
+                continue
+            if len(lote) >= tam_lote:
+                lotes.append(lote)
+                lote = []
+                if len(lotes) >= lotes_por_tx:
+                    _guardar(lotes, resumen)
+                    lotes = []
+                    if al_progresar is not None:
+                        al_progresar(resumen)
+    if lote:
+        lotes.append(lote)
+    if lotes:
+        _guardar(lotes, resumen)
+    resumen["segundos"] = time.perf_counter() - inicio
+    if al_progresar is not None:
+        al_progresar(resumen)
+    return resumen
+
+
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit("Uso: python importador.py catalogo.csv|catalogo.jsonl [tam_lote]")
+    ruta = sys.argv[1]
+    tam_lote = int(sys.argv[2]) if len(sys.argv) > 2 else TAM_LOTE
+
+    def progreso(resumen):
+        print(f"  {resumen['leidas']} leídas, {resumen['importadas']} importadas, "
+              f"{len(resumen['errores'])} con error", flush=True)
+
+    db.init_db()
+    resumen = importar_catalogo(ruta, tam_lote=tam_lote, al_progresar=progreso)
+    for linea, mensaje in resumen["errores"][:50]:
+        print(f"  línea {linea}: {mensaje}")
+    if len(resumen["errores"]) > 50:
+        print(f"  ... y {len(resumen['errores']) - 50} errores más")
+    print(f"Importados {resumen['importadas']} de {resumen['leidas']} productos "
+          f"en {resumen['segundos']:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
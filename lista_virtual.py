@@ -0,0 +1,251 @@
+# lista_virtual.py
+"""
+Listbox que se actualiza por diferencias.
+
+ListaVirtual envuelve un tk.Listbox y recuerda qué clave (producto_id, id de
+pedido...) va en cada fila. actualizar() recibe los elementos nuevos y solo
+toca las filas que cambiaron: borra las que ya no están, inserta las nuevas y
+reescribe las que cambiaron de texto. La selección se lee por clave con
+clave_seleccionada(), sin volver a parsear el texto de la fila.
+
+Con más de VIRTUALIZAR_DESDE elementos el Listbox solo tiene las filas que
+caben en pantalla (su height) y la barra de desplazamiento mueve esa ventana
+sobre la lista completa; solo se les da formato a las filas visibles.
+
+al_llegar_al_final (opcional) se llama cuando la parte visible queda a
+CERCA_DEL_FINAL filas o menos del final, para cargar la siguiente página.
+
+Con actualizar(lista, fija=True) quien llama promete no modificar esa
+lista: si se vuelve a pasar el mismo objeto no se recorre de nuevo (se
+reutilizan sus claves) y solo se repinta la ventana visible.
+"""
+import tkinter as tk
+
+VIRTUALIZAR_DESDE = 1000
+# Filas que avanza cada paso de la rueda del mouse en modo virtual
+PASO_RUEDA = 3
+CERCA_DEL_FINAL = 10
+
+
+class ListaVirtual:
+    def __init__(self, lista, formato, clave=None, barra=None, virtualizar_desde=VIRTUALIZAR_DESDE,
+                 al_llegar_al_final=None):
+        self.lista = lista
+        self.formato = formato
+        self.clave = clave or (lambda elemento: elemento)
+        self.barra = barra
+        self.virtualizar_desde = virtualizar_desde
+        self.al_llegar_al_final = al_llegar_al_final
+        self.alto = max(1, int(lista.cget("height")))
+        self.virtual = False
+        self.stats = {"insertadas": 0, "borradas": 0, "reescritas": 0, "repintadas": 0}
+
+        self._elementos = []
+        self._claves = []
+        self._indices = {}     # clave -> posición en la lista completa
+        self._fija = None      # (lista, claves, índices) de la última lista fija
+        self._filas = []       # (clave, texto) de lo que hay en el Listbox
+        self._inicio = 0       # primera fila pintada (solo en modo virtual)
+        self._seleccionada = None
+
+        lista.config(yscrollcommand=self._al_mover_lista)
+        if barra is not None:
+            barra.config(command=self._desplazar)
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            lista.bind(evento, self._rueda, add="+")
+        lista.bind("<Up>", lambda e: self._flecha(-1), add="+")
+        lista.bind("<Down>", lambda e: self._flecha(1), add="+")
+
+    def __len__(self):
+        return len(self._elementos)
+
+    # ========== API ==========
+
+    def actualizar(self, elementos, fija=False):
+        """
+        Muestra `elementos` (en ese orden) tocando solo las filas que cambiaron.
+        fija=True: `elementos` es una lista que no se va a modificar.
+        """
+        self._recordar_seleccion()
+        primera = self._filas[0][0] if self.virtual and self._filas else None
+
+        if fija and self._fija is not None and elementos is self._fija[0]:
+            self._elementos, self._claves, self._indices = self._fija
+        else:
+            self._elementos = elementos if fija else list(elementos)
+            self._claves = [self.clave(e) for e in self._elementos]
+            self._indices = {c: i for i, c in enumerate(self._claves)}
+            if fija:
+                self._fija = (self._elementos, self._claves, self._indices)
+
+        virtual = len(self._elementos) > self.virtualizar_desde
+        if virtual and self.virtual and self._inicio > 0:
+            # la ventana se queda sobre la misma fila aunque cambie lo de arriba
+            # (si estaba hasta arriba, se queda arriba y se ve lo nuevo)
+            self._inicio = self._indices.get(primera, self._inicio)
+        else:
+            self._inicio = 0
+        self.virtual = virtual
+        self._pintar()
+
+    def clave_seleccionada(self):
+        """Clave de la fila seleccionada, o None."""
+        sel = self.lista.curselection()
+        if sel and sel[0] < len(self._filas):
+            return self._filas[sel[0]][0]
+        # en modo virtual la seleccionada puede haber salido de la ventana
+        if self.virtual and self._seleccionada in self._indices and not self._pintada(self._seleccionada):
+            return self._seleccionada
+        return None
+
+    def elemento(self, clave):
+        i = self._indices.get(clave)
+        return self._elementos[i] if i is not None else None
+
+    def mover_a(self, inicio):
+        """Modo virtual: pinta la ventana que empieza en la fila `inicio`."""
+        if not self.virtual:
+            return
+        inicio = max(0, min(int(inicio), len(self._elementos) - self.alto))
+        if inicio != self._inicio:
+            self._recordar_seleccion()
+            self._inicio = inicio
+            self._pintar()
+
+    # ========== Pintado ==========
+
+    def _pintar(self):
+        if self.virtual:
+            fin = min(self._inicio + self.alto, len(self._elementos))
+            visibles = range(self._inicio, fin)
+        else:
+            visibles = range(len(self._elementos))
+        self._aplicar([(self._claves[i], self.formato(self._elementos[i])) for i in visibles])
+        self._restaurar_seleccion()
+        if self.virtual:
+            total, hasta = len(self._elementos), self._inicio + len(self._filas)
+            if self.barra is not None:
+                self.barra.set(self._inicio / total, hasta / total)
+            self._revisar_final(hasta)
+
+    def _aplicar(self, nuevas):
+        viejas = self._filas
+        claves_nuevas = {c for c, _ in nuevas}
+        quedan = [f for f in viejas if f[0] in claves_nuevas]
+        claves_quedan = {c for c, _ in quedan}
+
+        # Si cambió el orden o casi nada coincide sale más barato repintar todo
+        if not quedan or [c for c, _ in quedan] != [c for c, _ in nuevas if c in claves_quedan]:
+            self.lista.delete(0, tk.END)
+            if nuevas:
+                self.lista.insert(tk.END, *[t for _, t in nuevas])
+            self._filas = nuevas
+            self.stats["repintadas"] += 1
+            return
+
+        # 1) borrar, de abajo hacia arriba, las corridas de filas que ya no están
+        i = len(viejas) - 1
+        while i >= 0:
+            if viejas[i][0] in claves_nuevas:
+                i -= 1
+                continue
+            fin = i
+            while i >= 0 and viejas[i][0] not in claves_nuevas:
+                i -= 1
+            self.lista.delete(i + 1, fin)
+            self.stats["borradas"] += fin - i
+
+        # 2) insertar las nuevas y reescribir las que cambiaron de texto
+        i = j = 0
+        while i < len(nuevas):
+            if j < len(quedan) and quedan[j][0] == nuevas[i][0]:
+                if quedan[j][1] == nuevas[i][1]:
+                    i += 1
+                    j += 1
+                    continue
+                desde = i
+                while (i < len(nuevas) and j < len(quedan)
+                       and quedan[j][0] == nuevas[i][0] and quedan[j][1] != nuevas[i][1]):
+                    i += 1
+                    j += 1
+                self.lista.delete(desde, i - 1)
+                self.lista.insert(desde, *[t for _, t in nuevas[desde:i]])
+                self.stats["reescritas"] += i - desde
+            else:
+                desde = i
+                while i < len(nuevas) and not (j < len(quedan) and quedan[j][0] == nuevas[i][0]):
+                    i += 1
+                self.lista.insert(desde, *[t for _, t in nuevas[desde:i]])
+                self.stats["insertadas"] += i - desde
+        self._filas = nuevas
+
+    # ========== Selección ==========
+
+    def _pintada(self, clave):
+        return any(c == clave for c, _ in self._filas)
+
+    def _recordar_seleccion(self):
+        sel = self.lista.curselection()
+        if sel and sel[0] < len(self._filas):
+            self._seleccionada = self._filas[sel[0]][0]
+        elif not self.virtual or self._pintada(self._seleccionada):
+            self._seleccionada = None  # se deseleccionó estando a la vista
+
+    def _restaurar_seleccion(self):
+        clave = self._seleccionada
+        if clave not in self._indices:
+            self._seleccionada = None
+            return
+        fila = self._indices[clave] - self._inicio
+        if 0 <= fila < len(self._filas) and not self.lista.curselection():
+            self.lista.selection_set(fila)
+
+    # ========== Desplazamiento ==========
+
+    def _al_mover_lista(self, primero, ultimo):
+        # en modo virtual la barra la maneja _pintar
+        if self.virtual:
+            return
+        if self.barra is not None:
+            self.barra.set(primero, ultimo)
+        self._revisar_final(float(ultimo) * len(self._elementos))
+
+    def _revisar_final(self, visto_hasta):
+        if self.al_llegar_al_final is not None and self._elementos \
+                and visto_hasta >= len(self._elementos) - CERCA_DEL_FINAL:
+            self.al_llegar_al_final()
+
+    def _desplazar(self, *args):
+        """command de la barra: ("moveto", fracción) o ("scroll", n, "units"|"pages")."""
+        if not self.virtual:
+            return self.lista.yview(*args)
+        if args[0] == "moveto":
+            self.mover_a(round(float(args[1]) * len(self._elementos)))
+        elif args[0] == "scroll":
+            paso = int(args[1]) * (self.alto if args[2] == "pages" else 1)
+            self.mover_a(self._inicio + paso)
+
+    def _rueda(self, evento):
+        if not self.virtual:
+            return None
+        arriba = getattr(evento, "num", None) == 4 or getattr(evento, "delta", 0) > 0
+        self.mover_a(self._inicio + (-PASO_RUEDA if arriba else PASO_RUEDA))
+        return "break"
+
+    def _flecha(self, paso):
+        # Tk mueve la selección solo dentro de las filas pintadas; en el borde
+        # de la ventana hay que recorrerla
+        if not self.virtual:
+            return None
+        sel = self.lista.curselection()
+        if not sel or 0 <= sel[0] + paso < len(self._filas):
+            return None
+        siguiente = self._inicio + sel[0] + paso
+        if not 0 <= siguiente < len(self._elementos):
+            return "break"
+        self.lista.selection_clear(0, tk.END)
+        self._seleccionada = self._claves[siguiente]
+        self._inicio += paso
+        self._pintar()
+        self.lista.event_generate("<<ListboxSelect>>")
+        return "break"
@@ -1,7 +1,19 @@
 # main.py Parte 2
-from gui import App
+"""
+Uso:
+    python main.py                      # caja con la GUI de Tkinter
+    python main.py servicio [dirección] # servicio de pedidos sin GUI (ver servicio.py)
+"""
+import sys
+
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "servicio":
+        import servicio
+        servicio.main(sys.argv[2:])
+        return
+
+    from gui import App
     app = App()
     app.mainloop()
 
@@ -0,0 +1,260 @@
+# metricas.py
+"""
+Instrumentación de la capa de BD: cuánto tarda cada operación de db.py,
+cada sentencia SQL, cada espera por una conexión del pool y cada commit.
+
+Apagada no cuesta casi nada (una revisión de ACTIVAS por llamada). Se
+prende y se apaga en tiempo de ejecución:
+    metricas.activar() / metricas.desactivar() / metricas.reiniciar()
+o desde el arranque con DB_METRICAS=1 en el .env.
+
+Cada nombre ("db.crear_pedido_estricto", "sql:SELECT productos",
+"conexion.espera", "commit") lleva un histograma de latencias con cubetas
+fijas. Las sentencias que tardan DB_LENTAS_MS o más van al registro de
+consultas lentas (las últimas en memoria y, si hay DB_LOG_LENTAS, también a
+ese archivo, una línea JSON por consulta con su SQL y sus parámetros).
+
+instantanea() regresa todo como dict (JSON) y prometheus() como texto para
+Prometheus; servicio.py lo publica en GET /metricas.
+"""
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from functools import lru_cache, wraps
+
+import connection_manager
+
+ACTIVAS = os.getenv("DB_METRICAS", "0") == "1"
+LENTAS_MS = float(os.getenv("DB_LENTAS_MS", 200))
+LOG_LENTAS = os.getenv("DB_LOG_LENTAS", "")
+LENTAS_EN_MEMORIA = 100
+
+# Límites superiores de las cubetas, en segundos (la última es +Inf)
+CUBETAS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_lock_archivo = threading.Lock()   # solo para el archivo DB_LOG_LENTAS
+_histogramas = {}   # nombre -> Histograma
+_contadores = {}    # nombre -> entero
+_lentas = deque(maxlen=LENTAS_EN_MEMORIA)
+
+
+class Histograma:
+    __slots__ = ("cubetas", "conteo", "suma", "maximo")
+
+    def __init__(self):
+        self.cubetas = [0] * (len(CUBETAS) + 1)
+        self.conteo = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def agregar(self, segundos):
+        self.cubetas[bisect_left(CUBETAS, segundos)] += 1
+        self.conteo += 1
+        self.suma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p):
+        """Aproximado: el límite superior de la cubeta donde cae el percentil."""
+        if not self.conteo:
+            return 0.0
+        objetivo = p * self.conteo
+        acumulado = 0
+        for i, n in enumerate(self.cubetas):
+            acumulado += n
+            if acumulado >= objetivo:
+                return CUBETAS[i] if i < len(CUBETAS) else self.maximo
+        return self.maximo
+
+
+# ========== Encendido ==========
+
+def activar():
+    global ACTIVAS
+    ACTIVAS = True
+
+
+def desactivar():
+    global ACTIVAS
+    ACTIVAS = False
+
+
+def reiniciar():
+    """Borra lo acumulado (no cambia si están activas o no)."""
+    with _lock:
+        _histogramas.clear()
+        _contadores.clear()
+        _lentas.clear()
+
+
+# ========== Registro ==========
+
+def registrar(nombre, segundos):
+    with _lock:
+        hist = _histogramas.get(nombre)
+        if hist is None:
+            hist = _histogramas[nombre] = Histograma()
+        hist.agregar(segundos)
+
+
+def contar(nombre, n=1):
+    if ACTIVAS:
+        with _lock:
+            _contadores[nombre] = _contadores.get(nombre, 0) + n
+
+
+@lru_cache(maxsize=512)
+def etiqueta_sql(sql):
+    """'SELECT ... FROM productos ...' -> 'SELECT productos' (verbo + primera tabla)."""
+    verbo = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    tabla = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)", sql, re.IGNORECASE)
+    return f"{verbo} {tabla.group(1)}" if tabla else verbo
+
+
+def registrar_sql(sql, params, segundos):
+    registrar("sql:" + etiqueta_sql(sql), segundos)
+    if segundos * 1000 >= LENTAS_MS:
+        lenta = {
+            "momento": datetime.now().isoformat(sep=" ", timespec="milliseconds"),
+            "ms": round(segundos * 1000, 2),
+            "sql": " ".join(sql.split()),
+            "params": repr(tuple(params))[:500],
+            "hilo": threading.current_thread().name,
+        }
+        linea = json.dumps(lenta, ensure_ascii=False) + "\n"
+        with _lock:
+            _lentas.append(lenta)
+        if LOG_LENTAS:
+            # fuera de _lock: una escritura lenta al disco no detiene a los
+            # demás hilos que registran métricas, solo a los que también escriben
+            with _lock_archivo:
+                try:
+                    with open(LOG_LENTAS, "a", encoding="utf-8") as archivo:
+                        archivo.write(linea)
+                except OSError as e:
+                    print("No se pudo escribir el registro de consultas lentas:", e)
+
+class _Cronometro:
+    __slots__ = ("nombre", "sql", "params", "inicio")
+
+    def __init__(self, nombre, sql=None, params=()):
+        self.nombre = nombre
+        self.sql = sql
+        self.params = params
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *error):
+        segundos = time.perf_counter() - self.inicio
+        if self.sql is not None:
+            registrar_sql(self.sql, self.params, segundos)
+        else:
+            registrar(self.nombre, segundos)
+        return False
+
+
+class _Apagado:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *error):
+        return False
+
+
+_APAGADO = _Apagado()
+
+
+def medir(nombre):
+    """with metricas.medir("commit"): ...  (no hace nada si están apagadas)"""
+    return _Cronometro(nombre) if ACTIVAS else _APAGADO
+
+
+def medir_sql(sql, params=()):
+    return _Cronometro(None, sql, params) if ACTIVAS else _APAGADO
+
+
+def medido(nombre):
+    """Decorador: mide cada llamada a la función con el histograma `nombre`."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not ACTIVAS:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                registrar(nombre, time.perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+
+# ========== Exportar ==========
+
+def instantanea():
+    """Todo lo acumulado, listo para json.dumps. Tiempos en milisegundos."""
+    with _lock:
+        histogramas = {
+            nombre: {
+                "conteo": h.conteo,
+                "promedio_ms": round(h.suma * 1000 / h.conteo, 3) if h.conteo else 0.0,
+                "p50_ms": h.percentil(0.50) * 1000,
+                "p95_ms": h.percentil(0.95) * 1000,
+                "p99_ms": h.percentil(0.99) * 1000,
+                "max_ms": round(h.maximo * 1000, 3),
+                "cubetas": dict(zip([str(c) for c in CUBETAS] + ["+Inf"], h.cubetas)),
+            }
+            for nombre, h in sorted(_histogramas.items())
+        }
+        contadores = dict(sorted(_contadores.items()))
+        lentas = list(_lentas)
+    return {
+        "activas": ACTIVAS,
+        "lentas_ms": LENTAS_MS,
+        "operaciones": histogramas,
+        "contadores": contadores,
+        "pool": connection_manager.estadisticas(),
+        "consultas_lentas": lentas,
+    }
+
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus():
+    """Formato de texto de Prometheus (histogramas acumulados por cubeta)."""
+    with _lock:
+        histogramas = [(n, list(h.cubetas), h.conteo, h.suma) for n, h in sorted(_histogramas.items())]
+        contadores = sorted(_contadores.items())
+    lineas = [
+        "# HELP proyecto_db_segundos Latencia de operaciones de BD.",
+        "# TYPE proyecto_db_segundos histogram",
+    ]
+    for nombre, cubetas, conteo, suma in histogramas:
+        etiqueta = _etiqueta(nombre)
+        acumulado = 0
+        for limite, n in zip([repr(c) for c in CUBETAS] + ["+Inf"], cubetas):
+            acumulado += n
+            lineas.append(f'proyecto_db_segundos_bucket{{operacion="{etiqueta}",le="{limite}"}} {acumulado}')
+        lineas.append(f'proyecto_db_segundos_sum{{operacion="{etiqueta}"}} {suma}')
+        lineas.append(f'proyecto_db_segundos_count{{operacion="{etiqueta}"}} {conteo}')
+    lineas += ["# HELP proyecto_db_eventos_total Eventos contados (errores, conexiones fallidas...).",
+               "# TYPE proyecto_db_eventos_total counter"]
+    for nombre, n in contadores:
+        lineas.append(f'proyecto_db_eventos_total{{evento="{_etiqueta(nombre)}"}} {n}')
+    lineas += ["# HELP proyecto_pool Estado del pool de conexiones.", "# TYPE proyecto_pool gauge"]
+    for nombre, valor in connection_manager.estadisticas().items():
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            lineas.append(f'proyecto_pool{{dato="{_etiqueta(nombre)}"}} {valor}')
+    return "\n".join(lineas) + "\n"
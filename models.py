@@ -1,8 +1,41 @@
 # models.py
-from typing import Dict
+# Las clases usan __slots__: sin __dict__ por instancia cada objeto ocupa
+# bastante menos, lo que importa con catálogos grandes en cajas con poca
+# RAM (ver benchmarks/bench_memoria.py). No se les pueden agregar atributos
+# nuevos al vuelo; si hace falta uno, hay que agregarlo a __slots__.
+import threading
+from bisect import bisect_left, bisect_right, insort
+from math import inf
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
+# ========== Dinero ==========
+# Los totales se llevan en centavos enteros (sin error de redondeo) y se
+# entregan como Decimal con 2 decimales, igual que las columnas DECIMAL(10,2).
+
+CENTAVO = Decimal("0.01")
+
+
+def a_decimal(valor) -> Decimal:
+    """Precio (float, str, Decimal) a Decimal redondeado a centavos."""
+    if not isinstance(valor, Decimal):
+        # str() da la representación corta del float: 35.1 -> "35.1", no 35.0999...
+        valor = Decimal(str(valor))
+    return valor.quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def a_centavos(valor) -> int:
+    return int(a_decimal(valor) * 100)
+
+
+def desde_centavos(centavos: int) -> Decimal:
+    return Decimal(centavos).scaleb(-2)
+
+
 class Producto:
+    __slots__ = ("producto_id", "nombre", "precio", "cantidad")
+
     def __init__(self, producto_id: int, nombre: str, precio: float, cantidad: int):
         self.producto_id = producto_id
         self.nombre = nombre
@@ -19,6 +52,8 @@ class Producto:
 
 
 class Usuario:
+    __slots__ = ("usuario_id", "nombre", "correo", "rol")
+
     def __init__(self, usuario_id: int, nombre: str, correo: str, rol: str = "cliente"):
         self.usuario_id = usuario_id
         self.nombre = nombre
@@ -30,72 +65,161 @@ class Usuario:
 
 
 class Pedido:
-    def __init__(self, pedido_id: int, usuario_id: int, tipo_entrega: str="mostrador"):
+    __slots__ = ("pedido_id", "usuario_id", "tipo_entrega", "items", "estado", "created_at",
+                 "_precios", "_total_centavos")
+
+    def __init__(self, pedido_id: int, usuario_id: int, tipo_entrega: str="mostrador",
+                 created_at: Optional[datetime] = None):
         self.pedido_id = pedido_id
         self.usuario_id = usuario_id
         self.tipo_entrega = tipo_entrega
         self.items: Dict[int, int] = {}  # producto_id -> cantidad
-        self.total = 0.0
+        self._precios: Dict[int, int] = {}  # producto_id -> precio en centavos al agregarlo
+        self._total_centavos = 0
         self.estado = "creado"
-        self.created_at = datetime.now()
+        # Los pedidos que vienen de la BD ya traen su fecha
+        self.created_at = created_at if created_at is not None else datetime.now()
+
+    @property
+    def total(self) -> Decimal:
+        return desde_centavos(self._total_centavos)
+
+    @total.setter
+    def total(self, valor):
+        self._total_centavos = a_centavos(valor)
 
     def agregar_item(self, producto: Producto, cantidad: int=1):
         cantidad = int(cantidad)
+        precio = self._precios.setdefault(producto.producto_id, a_centavos(producto.precio))
         if producto.producto_id in self.items:
             self.items[producto.producto_id] += cantidad
         else:
             self.items[producto.producto_id] = cantidad
-        self.total += producto.precio * cantidad
+        self._total_centavos += precio * cantidad
 
     def remover_item(self, producto: Producto, cantidad: int=1):
         pid = producto.producto_id
         cantidad = int(cantidad)
         if pid in self.items:
+            # Solo se descuenta lo que de verdad había, al precio con que se agregó
+            quitar = min(cantidad, self.items[pid])
+            self._total_centavos -= self._precios[pid] * quitar
             self.items[pid] -= cantidad
             if self.items[pid] <= 0:
                 del self.items[pid]
-            self.total = max(0.0, self.total - producto.precio * cantidad)
+                del self._precios[pid]
 
     def __repr__(self):
         return f"Pedido(id={self.pedido_id}, usuario={self.usuario_id}, total={self.total}, estado={self.estado})"
 
 
 class Carrito:
+    """
+    El total se lleva al día en cada add/remove (O(1)) con el precio de cada
+    producto en el momento en que se agregó. Si el inventario se recarga,
+    actualizar_precios() toma los precios nuevos, que son los que usará
+    crear_pedido al cobrar.
+    """
+
+    __slots__ = ("usuario_id", "items", "_precios", "_total_centavos")
+
     def __init__(self, usuario_id: int):
         self.usuario_id = usuario_id
         self.items: Dict[int, int] = {}  # producto_id -> cantidad
+        self._precios: Dict[int, int] = {}  # producto_id -> precio en centavos
+        self._total_centavos = 0
 
     def add(self, producto: Producto, cantidad: int=1):
         cantidad = int(cantidad)
-        self.items[producto.producto_id] = self.items.get(producto.producto_id, 0) + cantidad
+        pid = producto.producto_id
+        precio = self._precios.setdefault(pid, a_centavos(producto.precio))
+        self.items[pid] = self.items.get(pid, 0) + cantidad
+        self._total_centavos += precio * cantidad
 
     def remove(self, producto: Producto, cantidad: int=1):
         pid = producto.producto_id
         cantidad = int(cantidad)
         if pid in self.items:
+            quitar = min(cantidad, self.items[pid])
+            self._total_centavos -= self._precios[pid] * quitar
             self.items[pid] -= cantidad
             if self.items[pid] <= 0:
                 del self.items[pid]
+                del self._precios[pid]
 
     def clear(self):
         self.items.clear()
+        self._precios.clear()
+        self._total_centavos = 0
+
+    def subtotal(self, producto_id: int) -> Decimal:
+        return desde_centavos(self._precios.get(producto_id, 0) * self.items.get(producto_id, 0))
 
-    def total(self, productos: Dict[int, Producto]):
-        tot = 0.0
-        for pid, qty in self.items.items():
+    def total(self, productos: Optional[Dict[int, Producto]] = None) -> Decimal:
+        """
+        Total del carrito como Decimal. productos ya no hace falta (se deja
+        por compatibilidad): los precios se guardan al agregar.
+        """
+        return desde_centavos(self._total_centavos)
+
+    def actualizar_precios(self, productos: Dict[int, Producto]) -> bool:
+        """Toma los precios actuales del inventario; regresa True si alguno cambió."""
+        cambio = False
+        for pid in self.items:
             prod = productos.get(pid)
-            if prod:
-                tot += prod.precio * qty
-        return tot
+            if prod is None:
+                continue
+            precio = a_centavos(prod.precio)
+            if precio != self._precios[pid]:
+                self._total_centavos += (precio - self._precios[pid]) * self.items[pid]
+                self._precios[pid] = precio
+                cambio = True
+        return cambio
+
+
+# Resultados que se muestran al filtrar la lista de productos
+MAX_RESULTADOS_BUSQUEDA = 500
 
 
 class Inventario:
+    """
+    Productos por id, más índices secundarios para recorrer por id, buscar
+    por nombre exacto, por texto (prefijo de cualquier palabra del nombre,
+    sin distinguir mayúsculas) y por rango de precio.
+
+    Los índices se construyen la primera vez que se consultan (así cargar el
+    catálogo completo no paga insertar en listas ordenadas fila por fila) y
+    desde ahí se mantienen al día en agregar_producto y aplicar_cambios.
+    El controller aplica cambios desde hilos de fondo mientras la GUI busca,
+    por eso índices y cambios van bajo el mismo lock.
+    """
+
+    __slots__ = ("productos", "_indices_listos", "_ids", "_por_nombre", "_palabras", "_ids_palabras", "_precios",
+                 "_lock")
+
     def __init__(self):
         # product_id -> Producto
         self.productos: Dict[int, Producto] = {}
+        self._indices_listos = False
+        self._ids: List[int] = []                      # ids ordenados
+        self._por_nombre: Dict[str, List[int]] = {}   # nombre exacto -> ids
+        # Palabras de los nombres en minúsculas, ordenadas, y en paralelo el id
+        # de su producto (ordenado por id entre palabras iguales)
+        self._palabras: List[str] = []
+        self._ids_palabras: List[int] = []
+        self._precios: List[Tuple[float, int]] = []   # (precio, id), ordenada
+        self._lock = threading.RLock()
 
     def agregar_producto(self, producto: Producto):
-        self.productos[producto.producto_id] = producto
+        with self._lock:
+            anterior = self.productos.get(producto.producto_id)
+            if self._indices_listos and anterior is not None:
+                self._desindexar(anterior)
+            self.productos[producto.producto_id] = producto
+            if self._indices_listos:
+                if anterior is None:
+                    insort(self._ids, producto.producto_id)
+                self._indexar(producto)
 
     def buscar(self, producto_id: int):
         return self.productos.get(producto_id)
@@ -103,9 +227,172 @@ class Inventario:
     def listar(self):
         return list(self.productos.values())
 
+    def listar_desde(self, despues_de_id: int, limite: int) -> List[Producto]:
+        """
+        Hasta `limite` productos con id mayor a despues_de_id, por id
+        (paginación por llave: para la siguiente página pasa el último id).
+        """
+        with self._lock:
+            self._asegurar_indices()
+            i = bisect_right(self._ids, despues_de_id)
+            return [self.productos[pid] for pid in self._ids[i:i + limite]]
+
     def actualizar_stock(self, producto_id: int, nueva_cantidad: int):
+        # El stock no forma parte de ningún índice
         p = self.productos.get(producto_id)
         if p:
             p.cantidad = int(nueva_cantidad)
             return True
         return False
+
+    def aplicar_cambios(self, cambios: Iterable[Producto]) -> int:
+        """
+        Aplica en su lugar los productos que cambiaron: los existentes se
+        actualizan (el mismo objeto Producto) y los nuevos se agregan.
+        Regresa cuántos se aplicaron.
+        """
+        n = 0
+        with self._lock:
+            for nuevo in cambios:
+                p = self.productos.get(nuevo.producto_id)
+                if p is None:
+                    self.agregar_producto(nuevo)
+                else:
+                    reindexar = self._indices_listos and (p.nombre != nuevo.nombre or p.precio != nuevo.precio)
+                    if reindexar:
+                        self._desindexar(p)
+                    p.nombre = nuevo.nombre
+                    p.precio = nuevo.precio
+                    p.cantidad = nuevo.cantidad
+                    if reindexar:
+                        self._indexar(p)
+                n += 1
+        return n
+
+    # ---------- búsquedas por índice ----------
+
+    def buscar_por_nombre(self, nombre: str) -> Optional[Producto]:
+        """Producto con ese nombre exacto (el de menor id si hay varios)."""
+        with self._lock:
+            self._asegurar_indices()
+            ids = self._por_nombre.get(nombre)
+            return self.productos[ids[0]] if ids else None
+
+    def buscar_texto(self, texto: str, limite: Optional[int] = None) -> List[Producto]:
+        """
+        Productos cuyo nombre tiene, para cada palabra de texto, alguna
+        palabra que empieza con ella ("big m" encuentra "Big Mac").
+        Sin distinguir mayúsculas. Con una palabra salen en orden alfabético
+        de la palabra que coincidió; con varias, por id.
+        """
+        consulta = _palabras(texto)
+        if not consulta:
+            return self.listar()[:limite]
+        with self._lock:
+            self._asegurar_indices()
+            rangos = [self._rango_prefijo(q) for q in consulta]
+            if len(rangos) == 1:
+                # Un producto puede aparecer varias veces en el rango (una por
+                # palabra que coincide): se avanza hasta juntar `limite` ids
+                i, fin = rangos[0]
+                ids = {}
+                paso = fin - i if limite is None else max(limite, 1)
+                while i < fin and (limite is None or len(ids) < limite):
+                    ids.update(dict.fromkeys(self._ids_palabras[i:min(i + paso, fin)]))
+                    i += paso
+            else:
+                # Intersección empezando por la palabra con menos coincidencias.
+                # Si quedan pocos candidatos contra un rango grande, sale más
+                # barato revisar sus nombres que armar el conjunto del rango.
+                orden = sorted(range(len(consulta)), key=lambda k: rangos[k][1] - rangos[k][0])
+                i, fin = rangos[orden[0]]
+                ids = set(self._ids_palabras[i:fin])
+                for k in orden[1:]:
+                    if not ids:
+                        break
+                    i, fin = rangos[k]
+                    if len(ids) * 8 < fin - i:
+                        prefijo = " " + consulta[k]
+                        ids = {pid for pid in ids
+                               if prefijo in " " + " ".join(_palabras(self.productos[pid].nombre))}
+                    else:
+                        ids.intersection_update(self._ids_palabras[i:fin])
+                ids = sorted(ids)
+            if limite is not None:
+                ids = list(ids)[:limite]
+            return [self.productos[pid] for pid in ids]
+
+    def rango_precios(self, minimo: Optional[float] = None, maximo: Optional[float] = None) -> List[Producto]:
+        """Productos con minimo <= precio <= maximo, del más barato al más caro."""
+        with self._lock:
+            self._asegurar_indices()
+            desde = 0 if minimo is None else bisect_left(self._precios, (float(minimo), -inf))
+            hasta = len(self._precios) if maximo is None else bisect_right(self._precios, (float(maximo), inf))
+            return [self.productos[pid] for _, pid in self._precios[desde:hasta]]
+
+    # ---------- mantenimiento de índices ----------
+
+    def _rango_prefijo(self, prefijo: str) -> Tuple[int, int]:
+        """Posiciones [i, fin) de las palabras que empiezan con prefijo."""
+        return (bisect_left(self._palabras, prefijo),
+                bisect_left(self._palabras, prefijo + "\U0010ffff"))
+
+    def construir_indices(self):
+        """
+        Construye ya los índices (si no existen) para que la primera búsqueda
+        no lo pague; el controller lo llama al cargar el catálogo completo.
+        """
+        with self._lock:
+            self._asegurar_indices()
+
+    def _asegurar_indices(self):
+        if self._indices_listos:
+            return
+        por_nombre: Dict[str, List[int]] = {}
+        palabras = []
+        precios = []
+        for pid in sorted(self.productos):
+            p = self.productos[pid]
+            por_nombre.setdefault(p.nombre, []).append(pid)
+            palabras.extend((w, pid) for w in _palabras(p.nombre))
+            precios.append((p.precio, pid))
+        palabras.sort()
+        precios.sort()
+        self._por_nombre = por_nombre
+        self._palabras = [w for w, _ in palabras]
+        self._ids_palabras = [pid for _, pid in palabras]
+        self._precios = precios
+        self._ids = sorted(self.productos)
+        self._indices_listos = True
+
+    def _posicion_palabra(self, palabra: str, pid: int) -> int:
+        i = bisect_left(self._palabras, palabra)
+        fin = bisect_right(self._palabras, palabra, i)
+        return bisect_left(self._ids_palabras, pid, i, fin)
+
+    def _indexar(self, p: Producto):
+        insort(self._por_nombre.setdefault(p.nombre, []), p.producto_id)
+        for w in _palabras(p.nombre):
+            i = self._posicion_palabra(w, p.producto_id)
+            self._palabras.insert(i, w)
+            self._ids_palabras.insert(i, p.producto_id)
+        insort(self._precios, (p.precio, p.producto_id))
+
+    def _desindexar(self, p: Producto):
+        ids = self._por_nombre.get(p.nombre)
+        if ids is not None and p.producto_id in ids:
+            ids.remove(p.producto_id)
+            if not ids:
+                del self._por_nombre[p.nombre]
+        for w in _palabras(p.nombre):
+            i = self._posicion_palabra(w, p.producto_id)
+            if i < len(self._palabras) and self._palabras[i] == w and self._ids_palabras[i] == p.producto_id:
+                del self._palabras[i]
+                del self._ids_palabras[i]
+        i = bisect_left(self._precios, (p.precio, p.producto_id))
+        if i < len(self._precios) and self._precios[i] == (p.precio, p.producto_id):
+            del self._precios[i]
+
+
+def _palabras(texto: str) -> List[str]:
+    return list(dict.fromkeys(texto.casefold().split()))
@@ -0,0 +1,37 @@
+# resumenes.py
+"""
+Mantenimiento de los resúmenes de pedidos (resumen_usuario y
+resumen_producto_dia), que crear_pedido actualiza en su misma transacción.
+
+Uso (desde la raíz del proyecto):
+    python resumenes.py              # solo verifica
+    python resumenes.py reconstruir  # recalcula desde cero y verifica
+
+Reconstruir recorre pedidos y detalle_pedido completos en una transacción:
+conviene correrlo fuera del horario de ventas.
+"""
+import sys
+
+import db
+
+
+def main():
+    db.init_db()
+    if len(sys.argv) > 1 and sys.argv[1] == "reconstruir":
+        if not db.reconstruir_resumenes():
+            raise SystemExit(1)
+        print("Resúmenes reconstruidos.")
+
+    diferencias = db.verificar_resumenes()
+    if diferencias is None:
+        raise SystemExit(1)
+    for d in diferencias[:50]:
+        print(f"  {d['tabla']} {d['llave']}: guardado={d['guardado']} esperado={d['esperado']}")
+    if diferencias:
+        print(f"{len(diferencias)} diferencias. Corre: python resumenes.py reconstruir")
+        raise SystemExit(1)
+    print("Resúmenes correctos.")
+
+
+if __name__ == "__main__":
+    main()
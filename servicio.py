@@ -0,0 +1,471 @@
+# servicio.py
+"""
+Servicio de pedidos sin GUI, con asyncio.
+
+Un solo proceso atiende a muchas terminales (cajas delgadas, kioscos) por
+HTTP local o por un socket Unix, todas con el mismo pool de conexiones
+(connection_manager) y el mismo inventario en caché (controller). Las
+operaciones de controller son bloqueantes: se corren en un pool de
+HILOS_SERVICIO hilos (cada hilo usa a lo más una conexión) y como mucho
+MAX_EN_CURSO peticiones a la vez; hasta MAX_EN_ESPERA más esperan turno y
+las que pasen de ahí reciben 503 en lugar de formarse sin límite. El
+inventario se lee de memoria y se sincroniza con la BD a lo más cada
+SERVICIO_INVENTARIO_TTL segundos (ver InventarioReciente).
+
+Rutas (JSON de entrada y de salida):
+    GET  /salud
+    GET  /metricas[?formato=prometheus]   (ver metricas.py)
+    POST /metricas                 {"activas": true|false, "reiniciar": true}
+    GET  /productos?buscar=big&limite=100  o  /productos?desde=<último id>&limite=100
+    POST /login                    {"correo"}
+    POST /usuarios                 {"nombre", "correo", "rol"}
+    POST /pedidos                  {"usuario_id", "tipo_entrega", "items": [[producto_id, cantidad], ...]}
+    GET  /pedidos/<id>
+    GET  /usuarios/<id>/pedidos?limite=50&antes_fecha=...&antes_id=...
+    GET  /usuarios/<id>/resumen
+
+El dinero va como texto ("85.00") para no perder centavos.
+
+Cada conexión keep-alive es una sesión de BD (o la que mande el encabezado
+X-Sesion): si hay réplica de lectura, lo que una terminal lee justo después
+de escribir sale de la primaria (ver connection_manager.EnrutadorLecturas).
+
+Uso (desde la raíz del proyecto):
+    python main.py servicio                  # http://127.0.0.1:8080
+    python main.py servicio 0.0.0.0:9000
+    python main.py servicio unix:/tmp/pedidos.sock
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+import connection_manager
+import controller
+import db
+import metricas
+from connection_manager import POOL_SIZE
+from models import Carrito, a_decimal
+
+SERVICIO_HOST = os.getenv("SERVICIO_HOST", "127.0.0.1")
+SERVICIO_PUERTO = int(os.getenv("SERVICIO_PUERTO", 8080))
+# Un hilo por conexión del pool: más hilos solo esperarían conexión
+HILOS_SERVICIO = int(os.getenv("SERVICIO_HILOS", POOL_SIZE))
+MAX_EN_CURSO = int(os.getenv("SERVICIO_MAX_EN_CURSO", HILOS_SERVICIO * 2))
+MAX_EN_ESPERA = int(os.getenv("SERVICIO_MAX_EN_ESPERA", 200))
+MAX_CUERPO = 1024 * 1024
+LIMITE_PAGINA = 1000
+# Cada cuánto (segundos) se sincroniza el inventario con la BD; entre una
+# sincronización y otra las peticiones lo leen de memoria
+INVENTARIO_TTL = float(os.getenv("SERVICIO_INVENTARIO_TTL", 1.0))
+
+_ESTADOS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ErrorPeticion(Exception):
+    """Error que se le regresa al cliente tal cual, con su código HTTP."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _a_json(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat(sep=" ") if isinstance(valor, datetime) else valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} no se puede pasar a JSON")
+
+
+def _producto_json(p):
+    return {"id": p.producto_id, "nombre": p.nombre, "precio": a_decimal(p.precio), "cantidad": p.cantidad}
+
+
+def _usuario_json(u):
+    return {"id": u.usuario_id, "nombre": u.nombre, "correo": u.correo, "rol": u.rol}
+
+
+def _entero(valor, nombre, minimo=None, maximo=None):
+    try:
+        n = int(valor)
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, f"{nombre} debe ser un entero")
+    if minimo is not None and n < minimo:
+        raise ErrorPeticion(400, f"{nombre} debe ser >= {minimo}")
+    return min(n, maximo) if maximo is not None else n
+
+
+class InventarioReciente:
+    """
+    El inventario del controller, sincronizado a lo más cada `ttl` segundos.
+    Mientras no caduca, obtener() lo regresa sin tomar ningún lock ni ir a
+    la BD. Cuando caduca, un solo hilo lo sincroniza y los demás siguen con
+    el que ya hay (el Inventario aplica los cambios en su lugar y con su
+    propio lock, así que leerlo mientras tanto es seguro).
+    """
+
+    def __init__(self, cargar=controller.cargar_inventario_desde_db, ttl=INVENTARIO_TTL, reloj=time.monotonic):
+        self.cargar = cargar
+        self.ttl = ttl
+        self.reloj = reloj
+        self._inventario = None
+        self._vence = 0.0
+        self._sincronizando = threading.Lock()
+
+    def obtener(self):
+        inv = self._inventario
+        if inv is not None and self.reloj() < self._vence:
+            return inv
+        # sin inventario todavía hay que esperar; con uno viejo, solo sincroniza
+        # el primero que llegue
+        if not self._sincronizando.acquire(blocking=inv is None):
+            return inv
+        try:
+            if self._inventario is None or self.reloj() >= self._vence:
+                self._sincronizar()
+            return self._inventario
+        finally:
+            self._sincronizando.release()
+
+    def sincronizar(self):
+        """Sincroniza ya (p. ej. si piden un producto que aún no está en memoria)."""
+        with self._sincronizando:
+            self._sincronizar()
+            return self._inventario
+
+    def _sincronizar(self):
+        self._inventario = self.cargar()
+        self._vence = self.reloj() + self.ttl
+
+
+inventario = InventarioReciente()
+
+
+# ========== Operaciones (corren en los hilos del pool) ==========
+
+def salud(consulta, cuerpo):
+    return 200, {"ok": True, "conexiones": controller.estadisticas_conexiones()}
+
+
+def ver_metricas(consulta, cuerpo):
+    if consulta.get("formato") == "prometheus":
+        return 200, metricas.prometheus()
+    return 200, metricas.instantanea()
+
+
+def cambiar_metricas(consulta, cuerpo):
+    if cuerpo.get("reiniciar"):
+        metricas.reiniciar()
+    if cuerpo.get("activas") is True:
+        metricas.activar()
+    elif cuerpo.get("activas") is False:
+        metricas.desactivar()
+    return 200, {"activas": metricas.ACTIVAS}
+
+
+def listar_productos(consulta, cuerpo):
+    inv = inventario.obtener()
+    limite = _entero(consulta.get("limite", 100), "limite", 1, LIMITE_PAGINA)
+    texto = consulta.get("buscar", "").strip()
+    if texto:
+        productos = inv.buscar_texto(texto, limite)
+    else:
+        # desde: id del último producto de la página anterior
+        productos = inv.listar_desde(_entero(consulta.get("desde", 0), "desde", 0), limite)
+    return 200, {"productos": [_producto_json(p) for p in productos]}
+
+
+def login(consulta, cuerpo):
+    correo = str(cuerpo.get("correo") or "").strip()
+    if not correo:
+        raise ErrorPeticion(400, "falta correo")
+    user = controller.obtener_usuario_por_correo(correo)
+    if user is None:
+        raise ErrorPeticion(404, "no existe un usuario con ese correo")
+    return 200, _usuario_json(user)
+
+
+def registrar(consulta, cuerpo):
+    nombre = str(cuerpo.get("nombre") or "").strip()
+    correo = str(cuerpo.get("correo") or "").strip()
+    rol = str(cuerpo.get("rol") or "cliente").strip().lower()
+    if not nombre or not correo:
+        raise ErrorPeticion(400, "faltan nombre o correo")
+    if rol not in ("cliente", "admin"):
+        rol = "cliente"
+    user = controller.registrar_usuario(nombre, correo, rol)
+    if user is None:
+        return 500, {"error": "no se pudo registrar el usuario"}
+    return 201, _usuario_json(user)
+
+
+def crear_pedido(consulta, cuerpo):
+    usuario_id = _entero(cuerpo.get("usuario_id"), "usuario_id", 1)
+    tipo_entrega = str(cuerpo.get("tipo_entrega") or "mostrador")
+    items = cuerpo.get("items")
+    if not isinstance(items, list) or not items:
+        raise ErrorPeticion(400, "items debe ser una lista de [producto_id, cantidad]")
+
+    inv = inventario.obtener()
+    carrito = Carrito(usuario_id)
+    for item in items:
+        if not isinstance(item, (list, tuple)) or len(item) != 2:
+            raise ErrorPeticion(400, "items debe ser una lista de [producto_id, cantidad]")
+        pid = _entero(item[0], "producto_id")
+        prod = inv.buscar(pid)
+        if prod is None:
+            # puede ser nuevo y el inventario en memoria aún no lo tiene
+            inv = inventario.sincronizar()
+            prod = inv.buscar(pid)
+        if prod is None:
+            raise ErrorPeticion(400, f"no existe el producto {pid}")
+        carrito.add(prod, _entero(item[1], "cantidad", 1))
+
+    pid, faltantes = controller.crear_pedido_db(usuario_id, tipo_entrega, carrito)
+    if faltantes:
+        return 409, {"error": "sin stock suficiente", "faltantes": faltantes}
+    if not pid:
+        return 500, {"error": "no se pudo crear el pedido"}
+    # El total que quedó guardado (con los precios de la BD al cobrar), no
+    # el del carrito, que usa los del caché
+    pedido = db.get_pedido(pid)
+    return 201, {"pedido_id": pid, "total": a_decimal(pedido["total"]) if pedido else None}
+
+
+def obtener_pedido(consulta, cuerpo, pedido_id):
+    pedido = db.get_pedido(int(pedido_id))
+    if pedido is None:
+        raise ErrorPeticion(404, "no existe el pedido")
+    return 200, pedido
+
+
+def historial(consulta, cuerpo, usuario_id):
+    limite = _entero(consulta.get("limite", 50), "limite", 1, LIMITE_PAGINA)
+    antes_de = None
+    if "antes_fecha" in consulta or "antes_id" in consulta:
+        antes_de = (consulta.get("antes_fecha", ""), _entero(consulta.get("antes_id"), "antes_id"))
+    pagina = controller.listar_historial_pagina(int(usuario_id), antes_de, limite)
+    if pagina is None:
+        return 500, {"error": "no se pudo leer el historial"}
+    return 200, {"pedidos": pagina}
+
+
+def resumen(consulta, cuerpo, usuario_id):
+    return 200, controller.resumen_cliente(int(usuario_id))
+
+
+RUTAS = [
+    ("GET", re.compile(r"/salud"), salud),
+    ("GET", re.compile(r"/metricas"), ver_metricas),
+    ("POST", re.compile(r"/metricas"), cambiar_metricas),
+    ("GET", re.compile(r"/productos"), listar_productos),
+    ("POST", re.compile(r"/login"), login),
+    ("POST", re.compile(r"/usuarios"), registrar),
+    ("POST", re.compile(r"/pedidos"), crear_pedido),
+    ("GET", re.compile(r"/pedidos/(\d+)"), obtener_pedido),
+    ("GET", re.compile(r"/usuarios/(\d+)/pedidos"), historial),
+    ("GET", re.compile(r"/usuarios/(\d+)/resumen"), resumen),
+]
+
+
+def _buscar_ruta(metodo, ruta):
+    encontrada = False
+    for m, patron, operacion in RUTAS:
+        coincide = patron.fullmatch(ruta)
+        if coincide is None:
+            continue
+        if m == metodo:
+            return operacion, coincide.groups()
+        encontrada = True
+    raise ErrorPeticion(405 if encontrada else 404, f"{metodo} {ruta} no existe")
+
+
+# ========== Servidor ==========
+
+class ServicioPedidos:
+    def __init__(self, hilos=HILOS_SERVICIO, max_en_curso=MAX_EN_CURSO, max_en_espera=MAX_EN_ESPERA):
+        self.max_en_espera = max_en_espera
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="servicio-bd")
+        self._max_en_curso = max_en_curso
+        self._cupo = None         # asyncio.Semaphore, se crea dentro del loop
+        self._en_espera = 0
+        self._servidores = []
+        self._conexiones = itertools.count(1)
+        self.stats = {"peticiones": 0, "rechazadas": 0, "errores": 0}
+
+    async def iniciar(self, host=SERVICIO_HOST, puerto=SERVICIO_PUERTO, ruta_unix=None):
+        """Empieza a escuchar y regresa el asyncio.Server."""
+        self._cupo = asyncio.Semaphore(self._max_en_curso)
+        if ruta_unix:
+            servidor = await asyncio.start_unix_server(self._atender, path=ruta_unix)
+        else:
+            servidor = await asyncio.start_server(self._atender, host, puerto)
+        self._servidores.append(servidor)
+        return servidor
+
+    async def cerrar(self):
+        for servidor in self._servidores:
+            servidor.close()
+            await servidor.wait_closed()
+        self._servidores.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _atender(self, lector, escritor):
+        """Una conexión: varias peticiones seguidas mientras sea keep-alive."""
+        propia = f"conexion-{next(self._conexiones)}"
+        try:
+            while True:
+                try:
+                    peticion = await self._leer_peticion(lector)
+                except ErrorPeticion as e:
+                    await self._responder(escritor, e.estado, {"error": str(e)}, False)
+                    break
+                if peticion is None:
+                    break
+                metodo, ruta, consulta, cuerpo, seguir, sesion = peticion
+                estado, datos = await self._despachar(metodo, ruta, consulta, cuerpo, sesion or propia)
+                await self._responder(escritor, estado, datos, seguir)
+                if not seguir:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _leer_peticion(self, lector):
+        try:
+            encabezado = await lector.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise ErrorPeticion(400, "petición incompleta")
+            return None  # el cliente cerró la conexión
+        except asyncio.LimitOverrunError:
+            raise ErrorPeticion(413, "encabezados demasiado grandes")
+
+        lineas = encabezado.decode("latin-1").split("\r\n")
+        try:
+            metodo, destino, version = lineas[0].split(" ", 2)
+        except ValueError:
+            raise ErrorPeticion(400, "línea de petición inválida")
+        encabezados = {}
+        for linea in lineas[1:]:
+            if ":" in linea:
+                nombre, valor = linea.split(":", 1)
+                encabezados[nombre.strip().lower()] = valor.strip()
+
+        largo = _entero(encabezados.get("content-length", 0), "Content-Length", 0)
+        if largo > MAX_CUERPO:
+            raise ErrorPeticion(413, "cuerpo demasiado grande")
+        cuerpo = {}
+        if largo:
+            try:
+                cuerpo = json.loads(await lector.readexactly(largo))
+            except ValueError:
+                raise ErrorPeticion(400, "el cuerpo no es JSON válido")
+            if not isinstance(cuerpo, dict):
+                raise ErrorPeticion(400, "el cuerpo debe ser un objeto JSON")
+
+        partes = urlsplit(destino)
+        consulta = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        conexion = encabezados.get("connection", "").lower()
+        seguir = conexion != "close" if version == "HTTP/1.1" else conexion == "keep-alive"
+        sesion = encabezados.get("x-sesion")
+        return metodo.upper(), partes.path.rstrip("/") or "/", consulta, cuerpo, seguir, sesion
+
+    async def _despachar(self, metodo, ruta, consulta, cuerpo, sesion=None):
+        self.stats["peticiones"] += 1
+        try:
+            operacion, argumentos = _buscar_ruta(metodo, ruta)
+        except ErrorPeticion as e:
+            return e.estado, {"error": str(e)}
+
+        if self._cupo.locked() and self._en_espera >= self.max_en_espera:
+            self.stats["rechazadas"] += 1
+            return 503, {"error": "servicio ocupado, intenta de nuevo"}
+        self._en_espera += 1
+        try:
+            await self._cupo.acquire()
+        finally:
+            self._en_espera -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, _ejecutar, operacion, consulta, cuerpo, argumentos, sesion)
+        finally:
+            self._cupo.release()
+
+    async def _responder(self, escritor, estado, datos, seguir):
+        if estado >= 500:
+            self.stats["errores"] += 1
+        if isinstance(datos, str):
+            # Texto plano (p. ej. /metricas?formato=prometheus)
+            tipo, cuerpo = "text/plain; version=0.0.4", datos.encode("utf-8")
+        else:
+            tipo = "application/json"
+            cuerpo = json.dumps(datos, default=_a_json, ensure_ascii=False).encode("utf-8")
+        escritor.write(
+            f"HTTP/1.1 {estado} {_ESTADOS.get(estado, '')}\r\n"
+            f"Content-Type: {tipo}; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if seguir else 'close'}\r\n\r\n".encode("latin-1")
+            + cuerpo
+        )
+        await escritor.drain()
+
+
+def _ejecutar(operacion, consulta, cuerpo, argumentos, sesion=None):
+    try:
+        with connection_manager.sesion(sesion):
+            return operacion(consulta, cuerpo, *argumentos)
+    except ErrorPeticion as e:
+        return e.estado, {"error": str(e)}
+    except Exception as e:
+        print(f"Error en {operacion.__name__}:", e)
+        return 500, {"error": "error interno"}
+
+
+# ========== Línea de comandos ==========
+
+def _direccion(texto):
+    """'unix:/ruta.sock' -> (None, None, ruta); 'host:puerto' o 'puerto' -> (host, puerto, None)."""
+    if texto.startswith("unix:"):
+        return None, None, texto[len("unix:"):]
+    host, _, puerto = texto.rpartition(":")
+    return host or SERVICIO_HOST, int(puerto), None
+
+
+async def _servir(host, puerto, ruta_unix):
+    servicio = ServicioPedidos()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(servicio._pool, db.init_db)
+    await loop.run_in_executor(servicio._pool, inventario.sincronizar)
+    servidor = await servicio.iniciar(host, puerto, ruta_unix)
+    donde = f"unix:{ruta_unix}" if ruta_unix else f"http://{host}:{servidor.sockets[0].getsockname()[1]}"
+    print(f"Servicio de pedidos en {donde} ({HILOS_SERVICIO} hilos, {MAX_EN_CURSO} peticiones a la vez)")
+    try:
+        await servidor.serve_forever()
+    finally:
+        await servicio.cerrar()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    host, puerto, ruta_unix = _direccion(argv[0]) if argv else (SERVICIO_HOST, SERVICIO_PUERTO, None)
+    try:
+        asyncio.run(_servir(host, puerto, ruta_unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
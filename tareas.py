@@ -0,0 +1,135 @@
+# tareas.py
+"""
+Ejecución en segundo plano para la GUI.
+
+Tk solo se puede tocar desde el hilo principal, así que el trabajo de BD
+(db.* y controller.*) se manda a un pool de hilos acotado y los resultados
+regresan por una cola que el hilo de Tk revisa con after() mientras haya
+tareas pendientes. Los callbacks (al_terminar / al_fallar) siempre corren en
+el hilo de Tk.
+
+Cada tarea lleva una clave ("historial", "inventario", ...). Si se manda otra
+tarea con la misma clave antes de que termine la anterior, la anterior queda
+vieja: se cancela si aún no empezaba y, si ya estaba corriendo, su resultado
+se descarta.
+"""
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+from connection_manager import POOL_SIZE
+
+# Cada hilo ocupa a lo más una conexión: se deja al menos una libre en el pool
+HILOS_GUI = max(1, min(4, POOL_SIZE - 1))
+# ~60 cuadros por segundo mientras hay tareas pendientes
+INTERVALO_REVISION_MS = 16
+
+
+class EjecutorTareas:
+    def __init__(self, raiz, max_hilos=HILOS_GUI, intervalo_ms=INTERVALO_REVISION_MS):
+        self.raiz = raiz
+        self.intervalo_ms = intervalo_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="gui-bd")
+        self._resultados = queue.SimpleQueue()
+        self._vigentes = {}       # clave -> (número de la tarea vigente, future)
+        self._pendientes = {}     # número -> (clave, al_terminar, al_fallar, widgets)
+        self._ocupados = {}       # widget -> (tareas que lo ocupan, estado original)
+        self._siguiente = 0
+        self._revisando = False
+        self._cerrado = False
+
+    def enviar(self, clave, funcion, *args, al_terminar=None, al_fallar=None, ocupados=(), **kwargs):
+        """
+        Corre funcion(*args, **kwargs) en el pool. Los widgets de `ocupados`
+        se deshabilitan hasta que la tarea termine. Regresa el número de tarea.
+        """
+        if self._cerrado:
+            return None
+        self._siguiente += 1
+        numero = self._siguiente
+
+        anterior = self._vigentes.get(clave)
+        if anterior is not None:
+            self._descartar(anterior[0], cancelar=anterior[1])
+
+        widgets = [w for w in ocupados if w is not None]
+        for w in widgets:
+            self._marcar_ocupado(w)
+        self._pendientes[numero] = (clave, al_terminar, al_fallar, widgets)
+
+        future = self._pool.submit(funcion, *args, **kwargs)
+        self._vigentes[clave] = (numero, future)
+        future.add_done_callback(lambda f, n=numero: self._resultados.put((n, f)))
+        self._programar_revision()
+        return numero
+
+    def ocupado(self, clave):
+        return clave in self._vigentes
+
+    def revisar(self):
+        """Entrega los resultados listos. Corre en el hilo de Tk (vía after)."""
+        self._revisando = False
+        while True:
+            try:
+                numero, future = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            tarea = self._pendientes.pop(numero, None)
+            if tarea is None:
+                continue  # vieja: ya se descartó
+            clave, al_terminar, al_fallar, widgets = tarea
+            self._liberar(widgets)
+            if self._vigentes.get(clave, (None,))[0] == numero:
+                del self._vigentes[clave]
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if error is None:
+                if al_terminar is not None:
+                    al_terminar(future.result())
+            elif al_fallar is not None:
+                al_fallar(error)
+            else:
+                print(f"Error en tarea '{clave}':", error)
+        if self._pendientes:
+            self._programar_revision()
+
+    def cerrar(self):
+        self._cerrado = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _programar_revision(self):
+        if not self._revisando and not self._cerrado:
+            self._revisando = True
+            self.raiz.after(self.intervalo_ms, self.revisar)
+
+    def _descartar(self, numero, cancelar=None):
+        tarea = self._pendientes.pop(numero, None)
+        if tarea is not None:
+            self._liberar(tarea[3])
+        if cancelar is not None:
+            cancelar.cancel()
+
+    def _marcar_ocupado(self, widget):
+        cuenta, estado = self._ocupados.get(widget, (0, None))
+        if cuenta == 0:
+            try:
+                estado = widget.cget("state")
+                widget.config(state=tk.DISABLED)
+            except tk.TclError:
+                return  # el widget ya no existe
+        self._ocupados[widget] = (cuenta + 1, estado)
+
+    def _liberar(self, widgets):
+        for w in widgets:
+            if w not in self._ocupados:
+                continue
+            cuenta, estado = self._ocupados[w]
+            if cuenta > 1:
+                self._ocupados[w] = (cuenta - 1, estado)
+                continue
+            del self._ocupados[w]
+            try:
+                w.config(state=estado)
+            except tk.TclError:
+                pass
@@ -1,15 +1,50 @@
 # tests/test_app.py
+import json
+import os
+import shutil
+import tempfile
 import unittest
+from datetime import datetime, timedelta
+from time import time_ns
+from dotenv import load_dotenv
+
+# Con DB_BACKEND=sqlite las pruebas corren sobre una copia temporal de la BD
+# configurada (data/sample_db.sqlite3 por defecto) para no ensuciarla.
+#   DB_BACKEND=sqlite python -m pytest -q
+load_dotenv()
+if os.getenv("DB_BACKEND", "mysql").lower() == "sqlite":
+    _origen = os.getenv("DB_SQLITE_PATH", "data/sample_db.sqlite3")
+    if not os.path.isabs(_origen):
+        _origen = os.path.join(os.path.dirname(os.path.abspath(__file__)), _origen)
+    _copia = os.path.join(tempfile.mkdtemp(prefix="proyecto2_test_"), "test.sqlite3")
+    shutil.copy(_origen, _copia)
+    os.environ["DB_SQLITE_PATH"] = _copia
+
 from models import Producto, Carrito, Pedido, Inventario
 import db
 
+
+def _bd_disponible():
+    """Si se puede abrir una conexión con la BD configurada (con MySQL: si el servidor responde)."""
+    conn = db.get_conn()
+    if conn is None:
+        return False
+    conn.close()
+    return True
+
+
+# Las pruebas que usan la BD se saltan (en lugar de fallar a media prueba)
+# si no hay servidor, p. ej. con DB_BACKEND=mysql y MySQL apagado
+BD_DISPONIBLE = _bd_disponible()
+requiere_bd = unittest.skipUnless(BD_DISPONIBLE, f"sin conexión con la BD ({db.backend.nombre})")
+
 class TestModelsAndDB(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
         Se ejecuta una vez antes de todos los tests.
-        Verifica/crea tablas en la BD real (MySQL).
-        OJO: usa la misma BD configurada en db.py (proyecto2).
+        Verifica/crea tablas en la BD real (MySQL o SQLite según DB_BACKEND).
+        OJO: con MySQL usa la misma BD configurada en db.py (proyecto2).
         """
         db.init_db()
 
@@ -20,6 +55,8 @@ class TestModelsAndDB(unittest.TestCase):
         self.assertEqual(p.cantidad, 3)
         p.actualizar_stock(10)
         self.assertEqual(p.cantidad, 13)
+        # __slots__: sin __dict__ por instancia
+        self.assertFalse(hasattr(p, "__dict__"))
 
     def test_carrito_total_and_add_remove(self):
         inv = Inventario()
@@ -35,6 +72,34 @@ class TestModelsAndDB(unittest.TestCase):
         carrito.remove(p1, 1)  # quita 1 de A -> queda 1*A + 1*B = 10 + 5 = 15
         self.assertAlmostEqual(carrito.total(inv.productos), 15.0)
 
+    def test_inventario_indices_secundarios(self):
+        inv = Inventario()
+        inv.agregar_producto(Producto(1, "Big Mac", 85.0, 10))
+        inv.agregar_producto(Producto(2, "Papas Medianas", 35.0, 20))
+        self.assertEqual([p.producto_id for p in inv.buscar_texto("big m")], [1])
+        # después de construir los índices, los cambios los mantienen al día
+        inv.agregar_producto(Producto(3, "Papas Grandes", 45.0, 5))
+        inv.aplicar_cambios([Producto(2, "Papitas", 30.0, 20)])
+        self.assertEqual(sorted(p.producto_id for p in inv.buscar_texto("PAP")), [2, 3])
+        self.assertEqual([p.producto_id for p in inv.buscar_texto("papas")], [3])
+        self.assertEqual(inv.buscar_texto("pap", limite=1)[0].producto_id, 3)  # "papas" < "papitas"
+        self.assertIs(inv.buscar_por_nombre("Papitas"), inv.buscar(2))
+        self.assertIsNone(inv.buscar_por_nombre("Papas Medianas"))
+        self.assertEqual([p.producto_id for p in inv.rango_precios(30, 45)], [2, 3])
+        self.assertEqual([p.producto_id for p in inv.rango_precios(minimo=40)], [3, 1])
+        self.assertEqual([p.producto_id for p in inv.listar_desde(1, 10)], [2, 3])
+        self.assertEqual([p.producto_id for p in inv.listar_desde(0, 2)], [1, 2])
+
+    def test_inventario_aplicar_cambios(self):
+        inv = Inventario()
+        p1 = Producto(1, "A", 10.0, 5)
+        inv.agregar_producto(p1)
+        n = inv.aplicar_cambios([Producto(1, "A2", 11.0, 4), Producto(2, "B", 5.0, 3)])
+        self.assertEqual(n, 2)
+        self.assertIs(inv.buscar(1), p1)
+        self.assertEqual((p1.nombre, p1.precio, p1.cantidad), ("A2", 11.0, 4))
+        self.assertEqual(inv.buscar(2).nombre, "B")
+
     def test_pedido_agregar_y_remover(self):
         p = Producto(1, "X", 12.0, 10)
         pedido = Pedido(1, 1, "mostrador")
@@ -43,7 +108,69 @@ class TestModelsAndDB(unittest.TestCase):
         pedido.remover_item(p, 1)  # queda 1 * 12 = 12
         self.assertAlmostEqual(pedido.total, 12.0)
 
-    # ==== TESTS QUE USAN BD REAL (MySQL) ====
+    def test_carrito_total_exacto_e_incremental(self):
+        from decimal import Decimal
+        inv = Inventario()
+        p = Producto(1, "Refresco", 0.1, 100)
+        inv.agregar_producto(p)
+        carrito = Carrito(1)
+        for _ in range(3):
+            carrito.add(p)
+        # con float 0.1 * 3 = 0.30000000000000004
+        self.assertEqual(carrito.total(), Decimal("0.30"))
+        carrito.remove(p, 5)  # quitar de más no deja el total negativo
+        self.assertEqual((carrito.total(), carrito.items), (Decimal("0.00"), {}))
+
+        carrito.add(p, 2)
+        inv.aplicar_cambios([Producto(1, "Refresco", 0.15, 100)])
+        self.assertTrue(carrito.actualizar_precios(inv.productos))
+        self.assertEqual(carrito.total(), Decimal("0.30"))
+
+    # ==== TESTS QUE USAN BD REAL (MySQL o SQLite) ====
+    @requiere_bd
+    def test_db_resumenes_en_crear_pedido(self):
+        import time
+        from decimal import Decimal
+        uid = db.create_usuario("Test Resumen", f"testresumen_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Resumen A", 10.0, 50)
+        p2 = db.create_producto("Resumen B", 0.5, 50)
+        db.crear_pedido(uid, "mesa", [(p1, 1), (p2, 3), (p2, 1)])
+        db.crear_pedido_estricto(uid, "mesa", [(p1, 2)])
+        db.crear_pedido_estricto(uid, "mesa", [(p1, 1000)])  # sin stock: no cuenta
+
+        resumen = db.get_resumen_usuario(uid)
+        self.assertEqual((resumen["pedidos"], Decimal(str(resumen["total_gastado"]))), (2, Decimal("32.00")))
+        hoy = {r["producto_id"]: r for r in db.listar_ventas_producto_dia(datetime.now().strftime("%Y-%m-%d"))}
+        self.assertEqual((hoy[p1]["unidades"], hoy[p2]["unidades"]), (3, 4))
+        self.assertEqual(db.verificar_resumenes(), [])
+
+        with db.transaccion() as tx:
+            tx.ejecutar("UPDATE resumen_usuario SET pedidos = 99 WHERE usuario_id = %s", (uid,))
+        diferencias = db.verificar_resumenes()
+        self.assertEqual([(d["tabla"], d["llave"]) for d in diferencias], [("resumen_usuario", (str(uid),))])
+        self.assertTrue(db.reconstruir_resumenes())
+        self.assertEqual(db.verificar_resumenes(), [])
+
+    @requiere_bd
+    def test_db_total_pedido_igual_al_carrito(self):
+        import time
+        from decimal import Decimal
+        uid = db.create_usuario("Test Centavos", f"testcent_{time.time_ns()}@example.com")
+        inv = Inventario()
+        for precio in (0.1, 0.2, 19.99, 35.05):
+            pid = db.create_producto(f"Centavos {precio}", precio, 100)
+            inv.agregar_producto(Producto(pid, "", db.get_producto(pid)["precio"], 100))
+        carrito = Carrito(uid)
+        for prod in inv.listar():
+            carrito.add(prod, 3)
+
+        pid, faltantes = db.crear_pedido_estricto(uid, "mesa", list(carrito.items.items()))
+        self.assertEqual(faltantes, [])
+        total_bd = Decimal(str(db.get_pedido(pid)["total"]))
+        self.assertEqual(total_bd, carrito.total())
+        self.assertEqual(carrito.total(), Decimal("166.02"))
+
+    @requiere_bd
     def test_db_create_and_get_producto(self):
         pid = db.create_producto("Prueba DB", 9.9, 7)
         self.assertIsNotNone(pid, "create_producto regresó None, hay problema de conexión o inserción.")
@@ -53,6 +180,7 @@ class TestModelsAndDB(unittest.TestCase):
         self.assertEqual(float(prod['precio']), 9.9)
         self.assertEqual(int(prod['cantidad']), 7)
 
+    @requiere_bd
     def test_db_create_usuario_and_pedido(self):
         # correo único usando timestamp
         import time
@@ -76,7 +204,1232 @@ class TestModelsAndDB(unittest.TestCase):
         self.assertEqual(len(pedido['detalles']), 1)
         detalle = pedido['detalles'][0]
         self.assertEqual(detalle['producto_id'], pid)
+        self.assertEqual(detalle['producto_nombre'], "ItemPedido")
         self.assertEqual(detalle['cantidad'], 1)
 
+    @requiere_bd
+    def test_usuarios_upsert_y_cache(self):
+        import time
+        import controller
+        correo = f"cajero_{time.time_ns()}@example.com"
+        fila = db.upsert_usuario("Cajero", correo)
+        self.assertEqual((fila["nombre"], fila["correo"], fila["rol"]), ("Cajero", correo, "cliente"))
+        # el correo repetido regresa la fila que ya estaba, sin cambiarla
+        otra = db.upsert_usuario("Otro nombre", correo, "admin")
+        self.assertEqual((otra["id"], otra["nombre"], otra["rol"]), (fila["id"], "Cajero", "cliente"))
+        self.assertEqual(db.create_usuario("X", correo), fila["id"])
+
+        consultas = []
+        original = db.get_usuario_por_correo
+
+        def contar(*args, **kwargs):
+            consultas.append(args)
+            return original(*args, **kwargs)
+
+        db.get_usuario_por_correo = contar
+        try:
+            controller.invalidar_cache_usuarios()
+            nuevo = f"nuevo_{time.time_ns()}@example.com"
+            for _ in range(3):
+                self.assertEqual(controller.obtener_usuario_por_correo(correo).usuario_id, fila["id"])
+                self.assertIsNone(controller.obtener_usuario_por_correo(nuevo))
+            self.assertEqual(len(consultas), 2)
+            # registrar invalida la entrada negativa
+            registrado = controller.registrar_usuario("Nuevo", nuevo)
+            self.assertIs(controller.obtener_usuario_por_correo(nuevo), registrado)
+            self.assertIs(controller.obtener_usuario(registrado.usuario_id), registrado)
+            self.assertEqual(len(consultas), 2)
+        finally:
+            db.get_usuario_por_correo = original
+
+    def test_cache_usuarios_lru_y_caducidad(self):
+        import controller
+        from models import Usuario
+        ahora = [0.0]
+        cache = controller.CacheUsuarios(tamano=3, ttl=10, ttl_ausente=1, reloj=lambda: ahora[0])
+        a, b = Usuario(1, "A", "a@x.com"), Usuario(2, "B", "b@x.com")
+        cache.guardar(a)
+        cache.guardar_ausente("nadie@x.com")
+        self.assertIs(cache.obtener(("id", 1)), a)
+        self.assertIsNone(cache.obtener(("correo", "nadie@x.com")))
+        ahora[0] = 2
+        self.assertIs(cache.obtener(("correo", "nadie@x.com")), controller._NO_ESTA)
+        # 3 entradas como máximo: b saca a la menos usada (correo de a)
+        cache.guardar(b)
+        self.assertIs(cache.obtener(("correo", "a@x.com")), controller._NO_ESTA)
+        self.assertIs(cache.obtener(("id", 1)), a)
+        ahora[0] = 20
+        self.assertIs(cache.obtener(("id", 2)), controller._NO_ESTA)
+
+    @requiere_bd
+    def test_db_get_pedidos_por_lote(self):
+        import time
+        uid = db.create_usuario("Test Lote Pedidos", f"testlotep_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Detalle A", 3.0, 10)
+        p2 = db.create_producto("Detalle B", 4.0, 10)
+        con_lineas = db.crear_pedido(uid, "mesa", [(p1, 1), (p2, 2)])
+        sin_lineas = db.crear_pedido(uid, "mesa", [(999999999, 1)])
+
+        pedidos = db.get_pedidos([con_lineas, sin_lineas, 999999999])
+        self.assertEqual(set(pedidos), {con_lineas, sin_lineas})
+        detalles = pedidos[con_lineas]['detalles']
+        self.assertEqual([(d['producto_nombre'], d['cantidad']) for d in detalles],
+                         [("Detalle A", 1), ("Detalle B", 2)])
+        self.assertEqual(pedidos[sin_lineas]['detalles'], [])
+        self.assertIsNone(db.get_pedido(999999999))
+
+    @requiere_bd
+    def test_db_crear_pedido_varias_lineas(self):
+        import time
+        uid = db.create_usuario("Test Lote", f"testlote_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Lote A", 10.0, 5)
+        p2 = db.create_producto("Lote B", 2.5, 1)
+
+        # p2 pide más de lo que hay: el stock queda en 0, como antes
+        pedido_id = db.crear_pedido(uid, "mostrador", [(p1, 2), (p2, 3), (999999999, 1)])
+        self.assertIsNotNone(pedido_id)
+
+        pedido = db.get_pedido(pedido_id)
+        self.assertAlmostEqual(float(pedido['total']), 27.5)
+        self.assertEqual(sorted(d['producto_id'] for d in pedido['detalles']), [p1, p2])
+        self.assertEqual(int(db.get_producto(p1)['cantidad']), 3)
+        self.assertEqual(int(db.get_producto(p2)['cantidad']), 0)
+
+    @requiere_bd
+    def test_db_crear_pedido_estricto_sin_stock(self):
+        import time
+        uid = db.create_usuario("Test Estricto", f"testestricto_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Estricto A", 10.0, 5)
+        p2 = db.create_producto("Estricto B", 2.5, 1)
+
+        pedido_id, faltantes = db.crear_pedido_estricto(uid, "mostrador", [(p1, 2), (p2, 3)])
+        self.assertIsNone(pedido_id)
+        self.assertEqual(faltantes, [{"producto_id": p2, "solicitado": 3, "disponible": 1}])
+        # nada se descontó
+        self.assertEqual(int(db.get_producto(p1)['cantidad']), 5)
+        self.assertEqual(int(db.get_producto(p2)['cantidad']), 1)
+
+        pedido_id, faltantes = db.crear_pedido_estricto(uid, "mostrador", [(p1, 2), (p2, 1)])
+        self.assertIsNotNone(pedido_id)
+        self.assertEqual(faltantes, [])
+        self.assertEqual(int(db.get_producto(p1)['cantidad']), 3)
+        self.assertEqual(int(db.get_producto(p2)['cantidad']), 0)
+
+    @requiere_bd
+    def test_cola_pedidos_commit_agrupado(self):
+        import time
+        from cola_pedidos import ColaPedidos
+        uid = db.create_usuario("Test Cola", f"testcola_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Cola A", 10.0, 5)
+        p2 = db.create_producto("Cola B", 2.5, 1)
+
+        cola = ColaPedidos(ventana_ms=500, max_lote=4)
+        try:
+            futuros = [
+                cola.enviar(uid, "mesa", [(p1, 2), (p2, 1)]),
+                cola.enviar(uid, "mesa", [(p2, 1)]),            # el anterior se llevó el último
+                cola.enviar(uid, "mostrador", [(p1, 3), (p1, 0)]),
+                cola.enviar(uid, "mesa", [(p1, 1)]),            # ya no queda
+            ]
+            resultados = [f.result(timeout=30) for f in futuros]
+        finally:
+            cola.cerrar()
+        self.assertEqual(cola.stats, {"pedidos": 4, "lotes": 1, "lotes_fallidos": 0})
+        self.assertEqual([r[1] for r in resultados], [
+            [], [{"producto_id": p2, "solicitado": 1, "disponible": 0}],
+            [], [{"producto_id": p1, "solicitado": 1, "disponible": 0}],
+        ])
+        self.assertEqual((resultados[1][0], resultados[3][0]), (None, None))
+        self.assertEqual(float(db.get_pedido(resultados[0][0])["total"]), 22.5)
+        self.assertEqual(len(db.get_pedido(resultados[2][0])["detalles"]), 1)
+        self.assertEqual((int(db.get_producto(p1)["cantidad"]), int(db.get_producto(p2)["cantidad"])), (0, 0))
+        self.assertEqual(db.get_resumen_usuario(uid)["pedidos"], 2)
+        self.assertEqual(db.verificar_resumenes(), [])
+
+        # un usuario inexistente tumba el lote: se reintenta pedido por pedido
+        p3 = db.create_producto("Cola C", 1.0, 5)
+        cola = ColaPedidos(ventana_ms=500, max_lote=2)
+        try:
+            malo = cola.enviar(999999999, "mesa", [(p3, 1)])
+            bueno = cola.enviar(uid, "mesa", [(p3, 1)])
+            self.assertEqual(malo.result(timeout=30), (None, []))
+            self.assertIsNotNone(bueno.result(timeout=30)[0])
+        finally:
+            cola.cerrar()
+        self.assertEqual(cola.stats["lotes_fallidos"], 1)
+        self.assertEqual(int(db.get_producto(p3)["cantidad"]), 4)
+
+    @requiere_bd
+    def test_db_transaccion_compartida(self):
+        with db.transaccion() as tx:
+            p1 = db.create_producto("Tx A", 1.0, 1, tx=tx)
+            p2 = db.create_producto("Tx B", 2.0, 2, tx=tx)
+        self.assertEqual(db.get_producto(p1)['nombre'], "Tx A")
+        self.assertEqual(db.get_producto(p2)['nombre'], "Tx B")
+
+        # si algo falla a la mitad, no queda nada aplicado
+        with self.assertRaises(RuntimeError):
+            with db.transaccion() as tx:
+                db.update_producto_stock(p1, 99, tx=tx)
+                db.update_producto_stock(p2, 99, tx=tx)
+                raise RuntimeError("falla a la mitad")
+        self.assertEqual(int(db.get_producto(p1)['cantidad']), 1)
+        self.assertEqual(int(db.get_producto(p2)['cantidad']), 2)
+
+    @requiere_bd
+    def test_db_sentencias_preparadas_por_conexion(self):
+        sql = "SELECT * FROM productos WHERE id = %s"
+        with db.transaccion() as tx:
+            db.get_producto(1, tx=tx)
+            cur, _ = db.backend.sentencia_preparada(tx.conn, sql, True)
+            db.get_producto(2, tx=tx)
+            self.assertIs(db.backend.sentencia_preparada(tx.conn, sql, True)[0], cur)
+
+    @requiere_bd
+    def test_controller_cache_inventario(self):
+        import time
+        import controller
+        inv1 = controller.cargar_inventario_desde_db()
+        self.assertIs(controller.cargar_inventario_desde_db(), inv1)
+
+        # los cambios se aplican sobre el mismo inventario
+        pid = db.create_producto("Cache", 5.0, 3)
+        inv2 = controller.cargar_inventario_desde_db()
+        self.assertIs(inv2, inv1)
+        self.assertEqual(inv2.buscar(pid).cantidad, 3)
+        prod = inv2.buscar(pid)
+
+        # una venta sola (no toca la versión del catálogo) también se ve
+        uid = db.create_usuario("Cache User", f"cache_{time.time_ns()}@example.com")
+        version = db.get_version_catalogo()
+        db.crear_pedido(uid, "mesa", [(pid, 2)])
+        self.assertEqual(db.get_version_catalogo(), version)
+        self.assertEqual(controller.cargar_inventario_desde_db().buscar(pid).cantidad, 1)
+
+        db.update_producto(pid, "Cache 2", 6.5, 1)
+        inv3 = controller.cargar_inventario_desde_db()
+        self.assertIs(inv3.buscar(pid), prod)
+        self.assertEqual((prod.nombre, prod.precio, prod.cantidad), ("Cache 2", 6.5, 1))
+
+        # la recarga completa da lo mismo que la incremental
+        completo = controller.cargar_inventario_desde_db(forzar=True)
+        self.assertEqual(
+            sorted((p.producto_id, p.nombre, p.precio, p.cantidad) for p in completo.listar()),
+            sorted((p.producto_id, p.nombre, p.precio, p.cantidad) for p in inv3.listar()),
+        )
+
+    @requiere_bd
+    def test_db_listar_productos_cambiados(self):
+        version = db.get_version_catalogo()
+        p1 = db.create_producto("Delta A", 1.0, 1)
+        p2 = db.create_producto("Delta B", 1.0, 1)
+        db.update_producto_stock(p1, 7)
+        cambios = db.listar_productos_cambiados(version)
+        self.assertEqual([r['id'] for r in cambios], [p2, p1])
+        self.assertEqual(db.listar_productos_cambiados(db.get_version_catalogo()), [])
+
+    @requiere_bd
+    def test_db_listar_stock_cambiado(self):
+        import time
+        uid = db.create_usuario("Stock", f"stock_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Stock A", 1.0, 10)
+        p2 = db.create_producto("Stock B", 1.0, 10)
+        p3 = db.create_producto("Stock C", 1.0, 10)
+        _, marca = db.get_marcas_catalogo()
+        db.crear_pedido(uid, "mesa", [(p1, 1)])
+        db.crear_pedido_estricto(uid, "mesa", [(p2, 1)])
+        cambiados = {r['id'] for r in db.listar_stock_cambiado(marca)}
+        self.assertTrue({p1, p2} <= cambiados)
+        self.assertNotIn(p3, cambiados)
+
+    @requiere_bd
+    def test_db_paginacion_productos(self):
+        ids = [db.create_producto(f"Pag {i}", 1.0, 1) for i in range(7)]
+        pagina = db.listar_productos_pagina(ids[0] - 1, 3)
+        self.assertEqual([r['id'] for r in pagina], ids[:3])
+        pagina = db.listar_productos_pagina(pagina[-1]['id'], 3)
+        self.assertEqual([r['id'] for r in pagina], ids[3:6])
+
+        todos = [r['id'] for r in db.iterar_productos(tam_pagina=2)]
+        self.assertEqual(todos, sorted(todos))
+        self.assertEqual(todos, [r['id'] for r in sorted(db.listar_productos(), key=lambda r: r['id'])])
+
+    @requiere_bd
+    def test_db_paginacion_historial(self):
+        import time
+        uid = db.create_usuario("Historial", f"historial_{time.time_ns()}@example.com")
+        pid = db.create_producto("Hist", 1.0, 100)
+        # varios pedidos en el mismo segundo: el id desempata
+        pedidos = [db.crear_pedido(uid, "mesa", [(pid, 1)]) for _ in range(5)]
+
+        primera = db.listar_pedidos_por_usuario_pagina(uid, limite=2)
+        self.assertEqual([p['id'] for p in primera], pedidos[::-1][:2])
+        ultimo = primera[-1]
+        segunda = db.listar_pedidos_por_usuario_pagina(uid, (ultimo['created_at'], ultimo['id']), 2)
+        self.assertEqual([p['id'] for p in segunda], pedidos[::-1][2:4])
+
+        self.assertEqual([p['id'] for p in db.iterar_pedidos_por_usuario(uid, tam_pagina=2)], pedidos[::-1])
+
+    @requiere_bd
+    def test_importar_catalogo_csv_y_jsonl(self):
+        import importador
+        directorio = tempfile.mkdtemp(prefix="proyecto2_import_")
+        ruta_csv = os.path.join(directorio, "catalogo.csv")
+        with open(ruta_csv, "w", encoding="utf-8") as f:
+            f.write("nombre,precio,cantidad\n")
+            for i in range(7):
+                f.write(f"Import {i},{i + 0.5},{i}\n")
+            f.write(",1,1\n")          # sin nombre
+            f.write("Import X,caro,1\n")  # precio inválido
+
+        version = db.get_version_catalogo()
+        avances = []
+        resumen = importador.importar_catalogo(ruta_csv, tam_lote=2, lotes_por_tx=2,
+                                               al_progresar=lambda r: avances.append(r["importadas"]))
+        self.assertEqual((resumen["leidas"], resumen["importadas"]), (9, 7))
+        self.assertEqual([linea for linea, _ in resumen["errores"]], [9, 10])
+        self.assertEqual(avances, [4, 7])
+        # 4 lotes de a lo más 2 filas -> 4 incrementos de versión
+        self.assertEqual(db.get_version_catalogo(), version + 4)
+
+        pid = db.create_producto("Para actualizar", 1.0, 1)
+        ruta_jsonl = os.path.join(directorio, "catalogo.jsonl")
+        with open(ruta_jsonl, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": pid, "nombre": "Actualizado", "precio": 9.5, "cantidad": 3}) + "\n")
+            f.write("{no es json\n")
+        resumen = importador.importar_catalogo(ruta_jsonl)
+        self.assertEqual((resumen["importadas"], len(resumen["errores"])), (1, 1))
+        prod = db.get_producto(pid)
+        self.assertEqual((prod["nombre"], float(prod["precio"]), prod["cantidad"]), ("Actualizado", 9.5, 3))
+
+        # el mismo id dos veces en un lote: gana la última fila
+        ruta_repetido = os.path.join(directorio, "repetido.csv")
+        with open(ruta_repetido, "w", encoding="utf-8") as f:
+            f.write(f"id,nombre,precio,cantidad\n{pid},Primera,1,1\n{pid},Segunda,2,2\n")
+        resumen = importador.importar_catalogo(ruta_repetido)
+        self.assertEqual((resumen["importadas"], resumen["errores"]), (2, []))
+        prod = db.get_producto(pid)
+        self.assertEqual((prod["nombre"], float(prod["precio"]), prod["cantidad"]), ("Segunda", 2.0, 2))
+        self.assertEqual(db.upsert_productos([(pid, "Tercera", 3, 3), (None, "Nuevo", 1, 1), (pid, "Cuarta", 4, 4)]), 2)
+        self.assertEqual(db.get_producto(pid)["nombre"], "Cuarta")
+
+        # valores que la columna no admite se rechazan al validar
+        ruta_rangos = os.path.join(directorio, "rangos.csv")
+        with open(ruta_rangos, "w", encoding="utf-8") as f:
+            f.write("nombre,precio,cantidad\nNaN,nan,1\nInf,inf,1\nCaro,1e12,1\nMucho,1,99999999999\nBien,1,1\n")
+        resumen = importador.importar_catalogo(ruta_rangos)
+        self.assertEqual(resumen["importadas"], 1)
+        self.assertEqual([linea for linea, _ in resumen["errores"]], [2, 3, 4, 5])
+
+        # si la BD rechaza una fila, las demás de su transacción sí se importan
+        upsert_original = db.upsert_productos
+
+        def upsert_que_rechaza(filas, tx=None):
+            if any(nombre == "Rechazada" for _, nombre, _, _ in filas):
+                raise db.Error("rechazada por la BD")
+            return upsert_original(filas, tx=tx)
+
+        ruta_bd = os.path.join(directorio, "bd.csv")
+        with open(ruta_bd, "w", encoding="utf-8") as f:
+            f.write("nombre,precio,cantidad\n")
+            for i in range(7):
+                f.write(f"{'Rechazada' if i == 4 else f'Acepta {i}'},1,1\n")
+        db.upsert_productos = upsert_que_rechaza
+        try:
+            resumen = importador.importar_catalogo(ruta_bd, tam_lote=2, lotes_por_tx=2)
+        finally:
+            db.upsert_productos = upsert_original
+        self.assertEqual(resumen["importadas"], 6)
+        self.assertEqual([linea for linea, _ in resumen["errores"]], [6])
+
+
+@requiere_bd
+class TestConcurrencia(unittest.TestCase):
+    """
+    Varias cajas vendiendo los mismos productos a la vez.
+    El stock vendido + el que queda debe cuadrar siempre con el inicial.
+    """
+    STOCK_INICIAL = 40
+    CAJAS = db.POOL_SIZE
+    PEDIDOS_POR_CAJA = 15
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db()
+
+    def test_contencion_productos_calientes(self):
+        import random
+        import threading
+        import time
+
+        uid = db.create_usuario("Caja", f"caja_{time.time_ns()}@example.com")
+        self.assertIsNotNone(uid)
+        calientes = [db.create_producto(f"Caliente {i}", 10.0, self.STOCK_INICIAL) for i in range(3)]
+        self.assertNotIn(None, calientes)
+
+        vendidos = {pid: 0 for pid in calientes}
+        errores = []
+        candado = threading.Lock()
+
+        def caja(semilla):
+            rnd = random.Random(semilla)
+            for _ in range(self.PEDIDOS_POR_CAJA):
+                items = [(pid, rnd.randint(1, 3)) for pid in rnd.sample(calientes, 2)]
+                pedido_id, faltantes = db.crear_pedido_estricto(uid, "mostrador", items)
+                with candado:
+                    if pedido_id is not None:
+                        for pid, qty in items:
+                            vendidos[pid] += qty
+                    elif not faltantes:
+                        errores.append(items)
+
+        hilos = [threading.Thread(target=caja, args=(i,)) for i in range(self.CAJAS)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(errores, [], "Hubo pedidos que fallaron sin ser por falta de stock.")
+        for pid in calientes:
+            restante = int(db.get_producto(pid)['cantidad'])
+            self.assertGreaterEqual(restante, 0)
+            self.assertEqual(vendidos[pid] + restante, self.STOCK_INICIAL)
+
+
+class TestConnectionManager(unittest.TestCase):
+    """El pool compartido sobre SQLite (no necesita servidor)."""
+
+    def setUp(self):
+        import db_backends
+        self.dir = tempfile.mkdtemp(prefix="proyecto2_pool_")
+        self.backend = db_backends.SQLiteBackend(os.path.join(self.dir, "pool.sqlite3"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_pool_perezoso_y_reutiliza(self):
+        from connection_manager import ConnectionManager
+        self.backend.usa_pool = True
+        manager = ConnectionManager(self.backend, tamano=2, ping_tras_inactividad=60, maximo=2, espera_max=0)
+        self.assertFalse(manager.estadisticas()["inicializado"])
+
+        c1 = manager.get_conn()
+        c1.close()
+        c2 = manager.get_conn()
+        c3 = manager.get_conn()
+        self.assertIsNone(manager.get_conn())  # pool agotado (sin esperar)
+        c2.close()
+        c3.close()
+
+        stats = manager.estadisticas()
+        self.assertEqual(stats["creadas"], 2)
+        self.assertEqual(stats["prestamos"], 3)
+        self.assertEqual(stats["agotado"], 1)
+        self.assertEqual(stats["pings"], 0)
+        self.assertEqual(stats["en_uso"], 0)
+
+    def test_ping_solo_tras_inactividad(self):
+        from connection_manager import PoolConexiones
+        pool = PoolConexiones(self.backend, tamano=1, ping_tras_inactividad=0)
+        conn = pool.obtener()
+        conn._raw._raw.close()  # el "servidor" cerró la conexión mientras estaba libre
+        conn.close()
+
+        conn = pool.obtener()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        self.assertEqual(cur.fetchone(), (1,))
+        conn.close()
+        stats = pool.estadisticas()
+        self.assertEqual(stats["pings"], 1)
+        self.assertEqual(stats["descartadas"], 1)
+        self.assertEqual(stats["creadas"], 2)
+
+    def test_estres_4x_pool_sin_fallas(self):
+        import threading
+        import time
+        from connection_manager import ConnectionManager, POOL_SIZE
+        self.backend.usa_pool = True
+        manager = ConnectionManager(self.backend, tamano=POOL_SIZE, ping_tras_inactividad=60,
+                                    maximo=POOL_SIZE, espera_max=30)
+        fallas = []
+        en_uso = []
+        lock = threading.Lock()
+
+        def caja():
+            for _ in range(10):
+                conn = manager.get_conn()
+                if conn is None:
+                    fallas.append(1)
+                    continue
+                with lock:
+                    en_uso.append(manager.estadisticas()["en_uso"])
+                conn.cursor().execute("SELECT 1")
+                time.sleep(0.002)
+                conn.close()
+
+        hilos = [threading.Thread(target=caja) for _ in range(4 * POOL_SIZE)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        stats = manager.estadisticas()
+        self.assertEqual(fallas, [])
+        self.assertEqual(stats["prestamos"], 40 * POOL_SIZE)
+        self.assertLessEqual(max(en_uso), POOL_SIZE)
+        self.assertGreater(stats["esperas"], 0)
+        self.assertEqual((stats["agotado"], stats["en_uso"], stats["en_espera"]), (0, 0, 0))
+
+    def test_pool_crece_con_demanda_y_se_reduce(self):
+        from connection_manager import PoolConexiones
+        pool = PoolConexiones(self.backend, tamano=1, ping_tras_inactividad=60, maximo=2,
+                              espera_max=0.5, crecer_tras=0.01, inactividad_extra=0)
+        c1 = pool.obtener()
+        c2 = pool.obtener()  # espera crecer_tras y el pool crece a 2
+        self.assertIsNotNone(c2)
+        self.assertIsNone(pool.obtener())  # ya en el máximo: se rinde tras espera_max
+        stats = pool.estadisticas()
+        self.assertEqual((stats["limite"], stats["crecimientos"], stats["agotado"]), (2, 1, 1))
+
+        c1.close()
+        c2.close()  # nadie espera: regresa al tamaño base y cierra la de más
+        stats = pool.estadisticas()
+        self.assertEqual((stats["limite"], stats["abiertas"], stats["reducciones"]), (1, 1, 1))
+
+
+class ConexionFalsaMySQL:
+    """Lo que el pool usa de una conexión de mysql.connector; anota cada llamada."""
+
+    def __init__(self, error):
+        self.error = error
+        self.llamadas = []
+        self.in_transaction = False
+        self.caida = False
+        self._sentencias = None
+
+    def ping(self, reconnect=True):
+        self.llamadas.append(("ping", reconnect))
+        if self.caida:
+            raise self.error("MySQL server has gone away")
+
+    def rollback(self):
+        self.llamadas.append("rollback")
+        self.in_transaction = False
+
+    def reset_session(self):
+        self.llamadas.append("reset_session")
+        if self.caida:
+            raise self.error("Lost connection")
+
+    def close(self):
+        self.llamadas.append("close")
+
+
+class TestPoolMySQL(unittest.TestCase):
+    """Pings y reinicios que el pool le pide a MySQLBackend, con conexiones falsas."""
+
+    def setUp(self):
+        try:
+            import db_backends
+            self.backend = db_backends.MySQLBackend({})
+        except ImportError:
+            self.skipTest("mysql-connector no está instalado")
+        self.conexiones = []
+
+        def conectar():
+            conn = ConexionFalsaMySQL(self.backend.Error)
+            self.conexiones.append(conn)
+            return conn
+        self.backend.conectar = conectar
+
+    def test_ping_tras_inactividad(self):
+        from connection_manager import PoolConexiones
+        pool = PoolConexiones(self.backend, tamano=1, ping_tras_inactividad=60)
+        pool.obtener().close()
+        pool.obtener().close()  # recién devuelta: sin ping
+        self.assertNotIn(("ping", False), self.conexiones[0].llamadas)
+
+        pool.ping_tras_inactividad = 0
+        pool.obtener().close()
+        self.assertIn(("ping", False), self.conexiones[0].llamadas)  # sin reconectar por su cuenta
+
+        self.conexiones[0].caida = True
+        conn = pool.obtener()  # el ping falla: se descarta y se abre otra
+        self.assertIs(conn._raw, self.conexiones[1])
+        self.assertIn("close", self.conexiones[0].llamadas)
+        conn.close()
+        stats = pool.estadisticas()
+        self.assertEqual((stats["pings"], stats["descartadas"], stats["creadas"]), (2, 1, 2))
+
+    def test_reinicio_al_devolver(self):
+        from connection_manager import PoolConexiones
+        pool = PoolConexiones(self.backend, tamano=1, ping_tras_inactividad=60)
+        conn = pool.obtener()
+        raw = conn._raw
+        conn.close()  # sin transacción abierta no hay viaje al servidor
+        self.assertEqual(raw.llamadas, [])
+        conn = pool.obtener()
+        raw.in_transaction = True
+        conn.close()
+        self.assertEqual(raw.llamadas, ["rollback"])
+
+    def test_reinicio_completo(self):
+        from connection_manager import PoolConexiones
+        pool = PoolConexiones(self.backend, tamano=1, ping_tras_inactividad=60, reinicio_completo=True)
+        conn = pool.obtener()
+        raw = conn._raw
+        raw._sentencias = sentencias = object()
+        raw.in_transaction = True
+        conn.close()
+        # reset_session también cierra la transacción; las sentencias preparadas se pierden
+        self.assertEqual(raw.llamadas, ["reset_session"])
+        self.assertIsNot(raw._sentencias, sentencias)
+
+        conn = pool.obtener()
+        raw.caida = True
+        conn.close()  # si el reinicio falla, la conexión no regresa al pool
+        self.assertEqual(raw.llamadas[-1], "close")
+        self.assertIsNot(pool.obtener()._raw, raw)
+        self.assertEqual(pool.estadisticas()["descartadas"], 1)
+
+
+@unittest.skipUnless(db.backend.nombre == "sqlite", "la réplica de prueba es una copia del archivo SQLite")
+class TestReplicaLectura(unittest.TestCase):
+    """Una segunda BD SQLite (copia de la de pruebas) hace de réplica de lectura."""
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db()
+
+    def setUp(self):
+        import connection_manager
+        self.dir = tempfile.mkdtemp(prefix="proyecto2_replica_")
+        self.ahora = [1000.0]
+        self.anterior = connection_manager.lecturas
+
+    def tearDown(self):
+        import connection_manager
+        connection_manager.lecturas = self.anterior
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _usar_replica(self, copiar=True):
+        """Réplica = foto de la BD en este momento (lo que se escriba después no le llega)."""
+        import sqlite3
+        import connection_manager
+        import db_backends
+        ruta = os.path.join(self.dir, f"replica_{time_ns()}.sqlite3")
+        if copiar:
+            origen, destino = sqlite3.connect(db.backend.ruta), sqlite3.connect(ruta)
+            origen.backup(destino)
+            origen.close()
+            destino.close()
+        self.backend_replica = db_backends.SQLiteBackend(ruta, solo_lectura=True, primaria=db.backend.ruta)
+        enrutador = connection_manager.EnrutadorLecturas(
+            connection_manager.manager, connection_manager.ConnectionManager(self.backend_replica),
+            tras_escribir=5, retraso_max=2, revisar_cada=1, pausa_tras_falla=30,
+            reloj=lambda: self.ahora[0],
+        )
+        connection_manager.lecturas = enrutador
+        return enrutador
+
+    def test_lecturas_a_la_replica_y_lee_lo_propio(self):
+        from connection_manager import sesion
+        viejo = db.create_producto("Antes de la foto", 10, 5)
+        enrutador = self._usar_replica()
+        # aquí solo importa el enrutado: la réplica atrasada se da por aceptable
+        self.backend_replica.retraso = lambda conn: 0.0
+
+        with sesion("caja-1"):
+            nuevo = db.create_producto("Después de la foto", 20, 5)
+            self.assertIsNotNone(db.get_producto(nuevo))      # lo propio, de la primaria
+        with sesion("caja-2"):
+            self.assertIsNone(db.get_producto(nuevo))         # la réplica aún no lo tiene
+            self.assertEqual(db.get_producto(viejo)["nombre"], "Antes de la foto")
+            self.assertTrue(any(p["id"] == viejo for p in db.listar_productos()))
+
+        self.ahora[0] += 6  # pasó la ventana de leer lo propio
+        with sesion("caja-1"):
+            self.assertIsNone(db.get_producto(nuevo))
+        self.assertEqual(enrutador.stats["tras_escritura"], 1)
+        self.assertEqual(enrutador.stats["replica"], 4)
+
+    def test_replica_retrasada_o_caida_lee_de_la_primaria(self):
+        enrutador = self._usar_replica()
+        nuevo = db.create_producto("Solo en la primaria", 30, 5)
+        self.ahora[0] += 6
+
+        self.backend_replica.retraso = lambda conn: 60.0
+        self.assertIsNotNone(db.get_producto(nuevo))
+        self.assertEqual(enrutador.stats["retrasada"], 1)
+        self.backend_replica.retraso = lambda conn: 0.0   # se puso al día
+        self.ahora[0] += 1
+        self.assertIsNone(db.get_producto(nuevo))
+
+        # réplica sin tablas: la consulta falla allá y se repite en la primaria
+        enrutador = self._usar_replica(copiar=False)
+        self.backend_replica.retraso = lambda conn: 0.0
+        self.assertIsNotNone(db.get_producto(nuevo))
+        self.assertEqual(db.listar_pedidos_por_usuario(-1), [])
+        self.assertEqual(enrutador.stats["fallas"], 1)   # la segunda ya no intentó la réplica
+        self.assertEqual(enrutador.stats["primaria"], 1)
+
+    def test_retraso_sqlite_contra_la_primaria(self):
+        import sqlite3
+        import time
+        uid = db.create_usuario("Retraso", f"retraso_{time.time_ns()}@example.com")
+        pid = db.create_producto("Retraso", 1.0, 100)
+        db.crear_pedido(uid, "mesa", [(pid, 1)])
+        self._usar_replica()
+        conn = self.backend_replica.get_conn()
+        try:
+            self.assertEqual(self.backend_replica.retraso(conn), 0.0)  # misma foto
+
+            db.crear_pedido(uid, "mesa", [(pid, 1)])  # no le llega a la réplica
+            self.assertLess(self.backend_replica.retraso(conn), 60)
+
+            # la réplica se quedó con cambios de hace una hora
+            escritura = sqlite3.connect(self.backend_replica.ruta)
+            escritura.execute("UPDATE productos SET stock_marca = stock_marca - 3600000000")
+            escritura.execute("UPDATE pedidos SET created_at = datetime(created_at, '-1 hour')")
+            escritura.commit()
+            escritura.close()
+            self.assertGreater(self.backend_replica.retraso(conn), 3000)
+
+            self.backend_replica.primaria = None  # sin con qué comparar no se sabe
+            self.assertIsNone(self.backend_replica.retraso(conn))
+        finally:
+            conn.close()
+
+
+@requiere_bd
+class TestPlanesConsulta(unittest.TestCase):
+    """
+    Corre las funciones de db.py grabando cada SQL que pasa por tx.ejecutar/uno/todos,
+    y luego revisa su plan con EXPLAIN: una consulta frecuente no debe
+    recorrer toda la tabla ni ordenar en una tabla temporal (filesort).
+    Si una consulta nueva falla aquí, lo normal es agregarle un índice en
+    db.INDICES; si el escaneo es a propósito, agregarla a ESCANEOS_PERMITIDOS.
+    """
+
+    # Consultas que leen toda la tabla a propósito (carga completa del catálogo)
+    ESCANEOS_PERMITIDOS = ("SELECT * FROM productos",)
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db()
+
+    def _grabar_consultas(self, trabajo):
+        consultas = {}
+        correr_original = db.UnidadDeTrabajo._correr
+
+        def correr_grabando(tx, sql, params, dictionary, leer):
+            if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+                consultas.setdefault(" ".join(sql.split()), tuple(params))
+            return correr_original(tx, sql, params, dictionary, leer)
+
+        db.UnidadDeTrabajo._correr = correr_grabando
+        try:
+            trabajo()
+        finally:
+            db.UnidadDeTrabajo._correr = correr_original
+        return consultas
+
+    def _problemas(self, consultas):
+        problemas = []
+        with db.transaccion() as tx:
+            cur = tx.cursor()
+            for sql, params in consultas.items():
+                for paso in db.backend.explicar(cur, sql, params):
+                    escaneo = paso["escaneo_completo"] and sql not in self.ESCANEOS_PERMITIDOS
+                    if escaneo or paso["ordenamiento"]:
+                        problemas.append(f"{sql}\n    -> {paso['detalle']}")
+        return problemas
+
+    def test_consultas_usan_indices(self):
+        import time
+
+        def trabajo():
+            uid = db.create_usuario("Planes", f"planes_{time.time_ns()}@example.com")
+            db.get_usuario(uid)
+            db.get_usuario_por_correo("admin@mcd.com")
+            p1 = db.create_producto("Plan A", 10.0, 50)
+            p2 = db.create_producto("Plan B", 5.0, 50)
+            db.listar_productos()
+            db.listar_productos_pagina(0, 10)
+            # argumentos selectivos, como en el uso real: con unos que abarquen
+            # toda la tabla MySQL prefiere recorrerla completa
+            db.listar_productos_cambiados(db.get_version_catalogo() - 1)
+            db.listar_stock_cambiado(db.get_marcas_catalogo()[1])
+            db.get_producto(p1)
+            db.update_producto(p1, "Plan A2", 11.0, 40)
+            db.update_producto_stock(p2, 30)
+            pid = db.crear_pedido(uid, "mesa", [(p1, 1), (p2, 2)])
+            db.crear_pedido_estricto(uid, "mesa", [(p1, 1)])
+            db.crear_pedido_estricto(uid, "mesa", [(p1, 10_000)])
+            db.get_pedido(pid)
+            db.get_pedidos([pid, pid - 1])
+            db.listar_pedidos_por_usuario(uid)
+            pagina = db.listar_pedidos_por_usuario_pagina(uid, limite=1)
+            db.listar_pedidos_por_usuario_pagina(uid, (pagina[-1]["created_at"], pagina[-1]["id"]), 1)
+            ahora = datetime.now()
+            desde = (ahora - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S")
+            hasta = (ahora + timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S")
+            ventas = db.listar_pedidos_rango_pagina(desde, hasta, limite=2)
+            db.listar_pedidos_rango_pagina(desde, hasta, (ventas[-1]["created_at"], ventas[-1]["id"]), 2)
+            db.listar_detalles_de_pedidos([v["id"] for v in ventas])
+            db.get_resumen_usuario(uid)
+            db.listar_ventas_producto_dia(datetime.now().strftime("%Y-%m-%d"))
+
+        consultas = self._grabar_consultas(trabajo)
+        self.assertGreater(len(consultas), 10)
+        problemas = self._problemas(consultas)
+        self.assertEqual(problemas, [], "Consultas sin índice:\n" + "\n".join(problemas))
+
+
+class TestMetricas(unittest.TestCase):
+    def setUp(self):
+        import metricas
+        self.metricas = metricas
+        self.lentas_ms = metricas.LENTAS_MS
+        metricas.reiniciar()
+
+    def tearDown(self):
+        self.metricas.desactivar()
+        self.metricas.LENTAS_MS = self.lentas_ms
+        self.metricas.reiniciar()
+
+    def test_apagadas_no_registran(self):
+        db.get_version_catalogo()
+        self.assertEqual(self.metricas.instantanea()["operaciones"], {})
+
+    @requiere_bd
+    def test_operaciones_sql_y_consultas_lentas(self):
+        pid = db.create_producto("Metricas", 1.0, 1)
+        self.metricas.activar()
+        self.metricas.LENTAS_MS = 0  # todas cuentan como lentas
+        db.get_producto(pid)
+        db.get_producto(pid)
+
+        datos = self.metricas.instantanea()
+        operaciones = datos["operaciones"]
+        self.assertEqual(operaciones["db.get_producto"]["conteo"], 2)
+        self.assertEqual(operaciones["sql:SELECT productos"]["conteo"], 2)
+        self.assertEqual(operaciones["conexion.espera"]["conteo"], 2)
+        self.assertEqual(operaciones["commit"]["conteo"], 2)
+        self.assertEqual(sum(operaciones["commit"]["cubetas"].values()), 2)
+        self.assertEqual(datos["consultas_lentas"][-1]["params"], repr((pid,)))
+        self.assertIn("FROM productos", datos["consultas_lentas"][-1]["sql"])
+        json.dumps(datos)
+
+        texto = self.metricas.prometheus()
+        self.assertIn('proyecto_db_segundos_count{operacion="db.get_producto"} 2', texto)
+        self.assertIn('proyecto_db_segundos_bucket{operacion="db.get_producto",le="+Inf"} 2', texto)
+
+    def test_log_de_lentas_se_escribe_sin_tomar_el_candado(self):
+        import builtins
+        metricas = self.metricas
+        log_lentas = metricas.LOG_LENTAS
+        abiertos_con_candado = []
+
+        def abrir(*args, **kwargs):
+            abiertos_con_candado.append(metricas._lock.locked())
+            return builtins.open(*args, **kwargs)
+
+        ruta = os.path.join(tempfile.mkdtemp(prefix="proyecto2_lentas_"), "lentas.jsonl")
+        metricas.LOG_LENTAS = ruta
+        metricas.LENTAS_MS = 0
+        metricas.open = abrir   # tapa al open de builtins solo dentro de metricas
+        try:
+            metricas.registrar_sql("SELECT * FROM productos WHERE id = ?", (7,), 0.3)
+        finally:
+            del metricas.open
+            metricas.LOG_LENTAS = log_lentas
+        with open(ruta, encoding="utf-8") as archivo:
+            lenta = json.loads(archivo.read())
+        shutil.rmtree(os.path.dirname(ruta), ignore_errors=True)
+
+        self.assertEqual(abiertos_con_candado, [False])
+        self.assertEqual(lenta["params"], "(7,)")
+        self.assertEqual(metricas.instantanea()["consultas_lentas"], [lenta])
+
+class TestEjecutorTareas(unittest.TestCase):
+    """EjecutorTareas sin ventana: after() y los widgets se simulan."""
+
+    class RaizFalsa:
+        def __init__(self):
+            self.programadas = []
+
+        def after(self, ms, funcion):
+            self.programadas.append(funcion)
+
+        def correr_hasta(self, condicion, limite=5.0):
+            import time
+            fin = time.monotonic() + limite
+            while not condicion() and time.monotonic() < fin:
+                if self.programadas:
+                    self.programadas.pop(0)()
+                time.sleep(0.005)
+
+    class BotonFalso:
+        def __init__(self):
+            self.estado = "normal"
+
+        def cget(self, opcion):
+            return self.estado
+
+        def config(self, state):
+            self.estado = state
+
+    def test_resultado_viejo_se_descarta_y_widget_se_libera(self):
+        import threading
+        from tareas import EjecutorTareas
+
+        raiz, boton = self.RaizFalsa(), self.BotonFalso()
+        ejecutor = EjecutorTareas(raiz, max_hilos=2)
+        soltar = threading.Event()
+        recibidos = []
+        try:
+            ejecutor.enviar("k", lambda: soltar.wait(5) and "viejo",
+                            al_terminar=recibidos.append, ocupados=(boton,))
+            ejecutor.enviar("k", lambda: "nuevo", al_terminar=recibidos.append, ocupados=(boton,))
+            self.assertEqual(boton.estado, "disabled")
+            raiz.correr_hasta(lambda: recibidos)
+            soltar.set()
+            raiz.correr_hasta(lambda: not raiz.programadas and not ejecutor.ocupado("k"))
+        finally:
+            ejecutor.cerrar()
+        self.assertEqual(recibidos, ["nuevo"])
+        self.assertEqual(boton.estado, "normal")
+
+    def test_error_va_a_al_fallar(self):
+        from tareas import EjecutorTareas
+
+        raiz = self.RaizFalsa()
+        ejecutor = EjecutorTareas(raiz, max_hilos=1)
+        errores = []
+        try:
+            ejecutor.enviar("x", lambda: 1 / 0, al_fallar=errores.append)
+            raiz.correr_hasta(lambda: errores)
+        finally:
+            ejecutor.cerrar()
+        self.assertIsInstance(errores[0], ZeroDivisionError)
+
+
+class TestListaVirtual(unittest.TestCase):
+    """ListaVirtual sin ventana: el Listbox se simula con una lista."""
+
+    class ListboxFalsa:
+        def __init__(self, height=5):
+            self.filas, self.sel, self.llamadas = [], set(), 0
+            self.height = height
+
+        def cget(self, opcion):
+            return self.height
+
+        def config(self, **opciones):
+            pass
+
+        def bind(self, *args, **kwargs):
+            pass
+
+        def _indice(self, i):
+            return len(self.filas) if i == "end" else i
+
+        def insert(self, i, *textos):
+            self.llamadas += 1
+            i = self._indice(i)
+            self.filas[i:i] = textos
+            self.sel = {s + len(textos) if s >= i else s for s in self.sel}
+
+        def delete(self, desde, hasta=None):
+            self.llamadas += 1
+            desde = self._indice(desde)
+            hasta = desde if hasta is None else min(self._indice(hasta), len(self.filas) - 1)
+            del self.filas[desde:hasta + 1]
+            n = hasta - desde + 1
+            self.sel = {s - n if s > hasta else s for s in self.sel if not desde <= s <= hasta}
+
+        def curselection(self):
+            return tuple(sorted(self.sel))
+
+        def selection_set(self, i):
+            self.sel.add(i)
+
+        def selection_clear(self, *args):
+            self.sel.clear()
+
+    def test_solo_toca_filas_cambiadas_y_seleccion_por_clave(self):
+        from lista_virtual import ListaVirtual
+
+        lista = self.ListboxFalsa()
+        vista = ListaVirtual(lista, lambda p: f"{p[0]} | {p[1]}", clave=lambda p: p[0])
+        vista.actualizar([(i, f"stock {i}") for i in range(100)])
+        self.assertEqual(len(lista.filas), 100)
+
+        lista.selection_set(50)
+        lista.llamadas = 0
+        nuevos = [(i, f"stock {i}") for i in range(100) if i != 10]
+        nuevos[50] = (51, "stock 0")
+        nuevos.append((200, "nuevo"))
+        vista.actualizar(nuevos)
+        # un borrado, una fila reescrita (borrar + insertar) y un insertado
+        self.assertEqual(lista.llamadas, 4)
+        self.assertEqual(lista.filas, [f"{c} | {t}" for c, t in nuevos])
+        self.assertEqual(vista.clave_seleccionada(), 50)
+
+        vista.actualizar(list(reversed(nuevos)))   # otro orden: se repinta todo
+        self.assertEqual(vista.stats["repintadas"], 2)
+        self.assertEqual(vista.clave_seleccionada(), 50)
+
+    def test_modo_virtual_pinta_solo_la_ventana(self):
+        from lista_virtual import ListaVirtual
+
+        formateadas = []
+
+        def formato(i):
+            formateadas.append(i)
+            return f"fila {i}"
+
+        lista = self.ListboxFalsa(height=5)
+        vista = ListaVirtual(lista, formato, virtualizar_desde=20)
+        vista.actualizar(range(100_000))
+        self.assertTrue(vista.virtual)
+        self.assertEqual(lista.filas, [f"fila {i}" for i in range(5)])
+        self.assertEqual(len(formateadas), 5)
+
+        lista.selection_set(1)
+        vista._desplazar("scroll", 1, "units")
+        self.assertEqual(lista.filas, [f"fila {i}" for i in range(1, 6)])
+        self.assertEqual(vista.clave_seleccionada(), 1)
+        vista._desplazar("moveto", 0.5)
+        self.assertEqual(lista.filas[0], "fila 50000")
+        self.assertEqual(vista.clave_seleccionada(), 1)   # fuera de la ventana, pero sigue
+        self.assertLess(len(formateadas), 20)
+
+        # al cambiar los datos la ventana se queda sobre la misma fila
+        vista.actualizar(range(-10, 100_000))
+        self.assertEqual(lista.filas[0], "fila 50000")
+
+    def test_lista_fija_no_se_vuelve_a_recorrer(self):
+        from lista_virtual import ListaVirtual
+
+        claves = []
+        vista = ListaVirtual(self.ListboxFalsa(height=5), str, clave=lambda e: claves.append(e) or e,
+                             virtualizar_desde=20)
+        todos = list(range(1000))
+        vista.actualizar(todos, fija=True)
+        vista.actualizar([3, 7])            # una búsqueda
+        vista.actualizar(todos, fija=True)  # se borra la búsqueda: no se recorre otra vez
+        self.assertEqual(len(claves), 1002)
+        self.assertEqual(vista.elemento(999), 999)
+
+    def test_historial_por_paginas(self):
+        from lista_virtual import ListaVirtual
+
+        lista = self.ListboxFalsa(height=5)
+        pedidas = []
+        vista = ListaVirtual(lista, str, virtualizar_desde=20, al_llegar_al_final=lambda: pedidas.append(1))
+        cargados = list(range(100, 0, -1))   # del más nuevo al más viejo
+        vista.actualizar(cargados)
+        self.assertEqual(pedidas, [])
+        vista.mover_a(len(cargados))
+        self.assertEqual(len(pedidas), 1)    # cerca del final: pedir otra página
+
+        cargados.extend(range(0, -50, -1))
+        vista.actualizar(cargados)
+        self.assertEqual(len(pedidas), 1)    # la ventana se quedó donde estaba
+
+        # el pedido recién cobrado entra arriba con un solo insert
+        vista.mover_a(0)
+        lista.llamadas = 0
+        vista.actualizar([101] + cargados)
+        self.assertEqual(lista.filas, ["101", "100", "99", "98", "97"])
+        self.assertEqual(lista.llamadas, 2)  # entra 101 y sale 96 de la ventana
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "analitica.py necesita NumPy")
+@requiere_bd
+class TestAnalitica(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.init_db()
+
+    def test_reportes_y_cache(self):
+        import time
+        import analitica
+        from decimal import Decimal
+
+        uid = db.create_usuario("Analitica", f"analitica_{time.time_ns()}@example.com")
+        p1 = db.create_producto("Analitica A", 10.0, 100)
+        p2 = db.create_producto("Analitica B", 2.5, 100)
+        pedidos = [
+            db.crear_pedido(uid, "mesa", [(p1, 2), (p2, 1)]),       # 22.50
+            db.crear_pedido(uid, "mesa", [(p2, 3)]),                # 7.50
+            db.crear_pedido(uid, "mostrador", [(p1, 1)]),           # 10.00
+        ]
+        # Se mueven a un día ya cerrado (cacheable) que ningún otro test usa
+        fechas = ["1999-03-04 13:05:00", "1999-03-04 13:40:00", "1999-03-05 09:00:00"]
+        with db.transaccion() as tx:
+            for pid, fecha in zip(pedidos, fechas):
+                tx.ejecutar("UPDATE pedidos SET created_at = %s WHERE id = %s", (fecha, pid))
+            db.reconstruir_resumenes(tx=tx)  # las fechas cambiaron a mano
+
+        analitica.CACHE_DIR = tempfile.mkdtemp(prefix="proyecto2_analitica_")
+        datos = analitica.cargar_ventas("1999-03-04", "1999-03-06", tam_pagina=2)
+        self.assertEqual(sorted(datos.pedido_id.tolist()), sorted(pedidos))
+
+        ticket = analitica.ticket_promedio_por_entrega(datos)
+        self.assertEqual(ticket["mesa"], (2, Decimal("15.00")))
+        self.assertEqual(ticket["mostrador"], (1, Decimal("10.00")))
+        self.assertEqual(analitica.hora_pico(datos), 13)
+
+        reporte = analitica.ingresos_por_producto_dia(datos)
+        filas = list(zip(reporte["dia"].astype(str), reporte["producto_id"].tolist(),
+                         reporte["unidades"].tolist(), reporte["ingresos"].tolist()))
+        self.assertEqual(sorted(filas), sorted([
+            ("1999-03-04", p1, 2, 2000), ("1999-03-04", p2, 4, 1000), ("1999-03-05", p1, 1, 1000),
+        ]))
+
+        # la segunda vez sale del caché en disco, sin tocar la BD
+        iterar_original = db.iterar_ventas
+        db.iterar_ventas = None
+        try:
+            otra = analitica.cargar_ventas("1999-03-04", "1999-03-06")
+        finally:
+            db.iterar_ventas = iterar_original
+        self.assertEqual(otra.pedido_total.tolist(), datos.pedido_total.tolist())
+
+
+
+class TestInventarioReciente(unittest.TestCase):
+    """El inventario del servicio se sincroniza con la BD a lo más cada ttl segundos."""
+
+    def test_sincroniza_solo_al_caducar_sin_detener_lecturas(self):
+        import threading
+        from servicio import InventarioReciente
+        ahora = [0.0]
+        cargas = []
+        empezo, liberar = threading.Event(), threading.Event()
+
+        def cargar():
+            cargas.append(ahora[0])
+            if len(cargas) == 2:
+                empezo.set()
+                liberar.wait(5)   # sincronización lenta
+            return f"inventario {len(cargas)}"
+
+        reciente = InventarioReciente(cargar, ttl=1.0, reloj=lambda: ahora[0])
+        self.assertEqual(reciente.obtener(), "inventario 1")
+        ahora[0] = 0.5
+        self.assertEqual(reciente.obtener(), "inventario 1")
+        self.assertEqual(len(cargas), 1)
+
+        ahora[0] = 1.5   # caducó: un hilo sincroniza y los demás leen el anterior
+        hilo = threading.Thread(target=reciente.obtener)
+        hilo.start()
+        empezo.wait(5)
+        self.assertEqual(reciente.obtener(), "inventario 1")
+        liberar.set()
+        hilo.join()
+        self.assertEqual(reciente.obtener(), "inventario 2")
+        self.assertEqual(reciente.sincronizar(), "inventario 3")
+
+
+@requiere_bd
+class TestServicio(unittest.TestCase):
+    """servicio.py con un cliente HTTP real contra la BD de pruebas."""
+
+    @classmethod
+    def setUpClass(cls):
+        import asyncio
+        import threading
+        import servicio
+        db.init_db()
+        cls.loop = asyncio.new_event_loop()
+        cls.hilo = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.hilo.start()
+        # cada petición sincroniza: las pruebas leen lo que acaban de crear
+        cls.ttl_inventario = servicio.inventario.ttl
+        servicio.inventario.ttl = 0
+        cls.servicio = servicio.ServicioPedidos(hilos=2, max_en_curso=2)
+        servidor = asyncio.run_coroutine_threadsafe(cls.servicio.iniciar("127.0.0.1", 0), cls.loop).result()
+        cls.puerto = servidor.sockets[0].getsockname()[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        import asyncio
+        import servicio
+        servicio.inventario.ttl = cls.ttl_inventario
+        asyncio.run_coroutine_threadsafe(cls.servicio.cerrar(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.hilo.join()
+        cls.loop.close()
+
+    def pedir(self, conexion, metodo, ruta, datos=None):
+        cuerpo = json.dumps(datos) if datos is not None else None
+        conexion.request(metodo, ruta, body=cuerpo, headers={"Content-Type": "application/json"})
+        respuesta = conexion.getresponse()
+        return respuesta.status, json.loads(respuesta.read())
+
+    def test_flujo_de_caja(self):
+        import http.client
+        import time
+        pid = db.create_producto("Servicio Combo", 99.5, 3)
+        conexion = http.client.HTTPConnection("127.0.0.1", self.puerto, timeout=10)
+        try:
+            correo = f"kiosco_{time.time_ns()}@example.com"
+            self.assertEqual(self.pedir(conexion, "POST", "/login", {"correo": correo})[0], 404)
+            estado, user = self.pedir(conexion, "POST", "/usuarios", {"nombre": "Kiosco", "correo": correo})
+            self.assertEqual((estado, user["correo"]), (201, correo))
+            self.assertEqual(self.pedir(conexion, "POST", "/login", {"correo": correo}), (200, user))
+
+            estado, datos = self.pedir(conexion, "GET", "/productos?buscar=servicio%20combo")
+            self.assertIn({"id": pid, "nombre": "Servicio Combo", "precio": "99.50", "cantidad": 3}, datos["productos"])
+            estado, datos = self.pedir(conexion, "GET", f"/productos?desde={pid - 1}&limite=1")
+            self.assertEqual([p["id"] for p in datos["productos"]], [pid])
+
+            # el precio cambia en la BD sin pasar por el caché: el total que
+            # se regresa es el que quedó guardado
+            with db.transaccion() as tx:
+                tx.ejecutar("UPDATE productos SET precio = %s WHERE id = %s", (100, pid))
+            pedido = {"usuario_id": user["id"], "tipo_entrega": "mesa", "items": [[pid, 2]]}
+            estado, creado = self.pedir(conexion, "POST", "/pedidos", pedido)
+            self.assertEqual((estado, creado["total"]), (201, "200.00"))
+            estado, sin_stock = self.pedir(conexion, "POST", "/pedidos", pedido)
+            self.assertEqual((estado, sin_stock["faltantes"][0]["disponible"]), (409, 1))
+
+            estado, historial = self.pedir(conexion, "GET", f"/usuarios/{user['id']}/pedidos")
+            self.assertEqual([p["id"] for p in historial["pedidos"]], [creado["pedido_id"]])
+            estado, detalle = self.pedir(conexion, "GET", f"/pedidos/{creado['pedido_id']}")
+            self.assertEqual(detalle["detalles"][0]["cantidad"], 2)
+
+            self.assertEqual(self.pedir(conexion, "GET", "/nada")[0], 404)
+            self.assertEqual(self.pedir(conexion, "POST", "/pedidos", {"usuario_id": 1})[0], 400)
+        finally:
+            conexion.close()
+
+    def test_clientes_concurrentes(self):
+        import http.client
+        from concurrent.futures import ThreadPoolExecutor
+
+        def cliente(_):
+            conexion = http.client.HTTPConnection("127.0.0.1", self.puerto, timeout=30)
+            try:
+                return [self.pedir(conexion, "GET", "/productos?limite=5")[0] for _ in range(10)]
+            finally:
+                conexion.close()
+
+        with ThreadPoolExecutor(max_workers=8) as clientes:
+            estados = [e for lote in clientes.map(cliente, range(8)) for e in lote]
+        self.assertEqual(estados, [200] * 80)
+
+
 if __name__ == "__main__":
     unittest.main()